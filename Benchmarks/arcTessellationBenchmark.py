@@ -0,0 +1,128 @@
+'''
+
+Times the adaptive arc tessellation used by the gcode canvas against the fixed 0.1 radian steps it
+replaced, on the arcs of gcodeForTesting/Dragon.nc scaled to several sizes.
+
+For each tolerance it reports the number of points drawn, the time taken and the furthest any chord
+strays from its arc.
+
+Run from the top level of the repository with:
+
+    python -m Benchmarks.arcTessellationBenchmark [copies]
+
+'''
+
+from DataStructures.gcodeParser              import GcodeParser
+from DataStructures.gcodeProgram             import GcodeProgram
+from DataStructures.arcTessellation          import tessellateArc
+import math
+import sys
+import time
+
+
+def legacyTessellate(xStart, yStart, xEnd, yEnd, centerX, centerY, clockwise):
+    '''
+
+    The arc drawing previously done by GcodeCanvas.drawArc, kept here to compare against. Each
+    point was added to the line on its own.
+
+    '''
+    points = []
+    radius = math.sqrt((xStart - centerX)**2 + (yStart - centerY)**2)
+
+    angle1 = math.atan2(yStart - centerY, xStart - centerX)
+    angle2 = math.atan2(yEnd - centerY, xEnd - centerX)
+    if angle1 < 0:
+        angle1 = angle1 + 2*math.pi
+    if angle2 < 0:
+        angle2 = angle2 + 2*math.pi
+
+    if clockwise:
+        if angle1 < angle2:
+            angle1 = angle1 + 2*math.pi
+        direction = -1
+    else:
+        if angle2 < angle1:
+            angle2 = angle2 + 2*math.pi
+        direction = 1
+
+    arcLen = abs(angle1 - angle2)
+    if abs(angle1 - angle2) == 0:
+        arcLen = 6.28313530718
+
+    i = 0
+    while abs(i) < arcLen:
+        points.extend((centerX + radius*math.cos(angle1 + i), centerY + radius*math.sin(angle1 + i)))
+        i = i+.1*direction
+    points.extend((xEnd, yEnd))
+
+    return points
+
+def readArcs(filename):
+    '''
+
+    The arcs in a gcode file as (xStart, yStart, xEnd, yEnd, centerX, centerY, clockwise) tuples,
+    following absolute moves only.
+
+    '''
+    gcode, zMoves = GcodeParser(0, 4, 0.5).parseFile(filename)
+
+    arcs    = []
+    x, y    = 0.0, 0.0
+    current = GcodeProgram.OTHER
+    for index in xrange(len(gcode)):
+        for code, mask, values in gcode.commands(index):
+            if code in (0, 1, 2, 3):
+                current = code
+            elif code == GcodeProgram.MODAL:
+                code = current
+
+            xTarget = values[0] if mask & GcodeProgram.X else x
+            yTarget = values[1] if mask & GcodeProgram.Y else y
+            if code in (2, 3):
+                arcs.append((x, y, xTarget, yTarget, x + values[3], y + values[4], code == 2))
+            x, y = xTarget, yTarget
+
+    return arcs
+
+def chordError(points, centerX, centerY, radius):
+    '''
+
+    The furthest the middle of any chord is from the arc.
+
+    '''
+    error = 0
+    for index in xrange(0, len(points) - 2, 2):
+        middleX = (points[index] + points[index + 2])/2
+        middleY = (points[index + 1] + points[index + 3])/2
+        error   = max(error, radius - math.sqrt((middleX - centerX)**2 + (middleY - centerY)**2))
+    return error
+
+def measure(arcs, tessellate):
+    start  = time.time()
+    drawn  = [tessellate(arc) for arc in arcs]
+    taken  = time.time() - start
+
+    count  = sum(len(points)//2 for points in drawn)
+    error  = max(chordError(points, arc[4], arc[5], math.sqrt((arc[0] - arc[4])**2 + (arc[1] - arc[5])**2)) for points, arc in zip(drawn, arcs))
+    return count, taken, error
+
+def main(copies = 20):
+    baseArcs = readArcs('gcodeForTesting/Dragon.nc')
+
+    for scale in (0.1, 1, 10, 100):
+        arcs = [tuple(value*scale for value in arc[:6]) + (arc[6],) for arc in baseArcs]*copies
+        print "%d arcs scaled by %g" % (len(arcs), scale)
+
+        count, taken, error = measure(arcs, lambda arc: legacyTessellate(*arc))
+        print "    legacy 0.1 rad     points: %8d  time: %.2fs  worst chord error: %.4f" % (count, taken, error)
+
+        for tolerance in (0.25, 0.05, 0.01):
+            count, taken, error = measure(arcs, lambda arc: tessellateArc(*(arc + (tolerance,))))
+            print "    tolerance %-8g points: %8d  time: %.2fs  worst chord error: %.4f" % (tolerance, count, taken, error)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,74 @@
+'''
+
+Times the single pass GcodeParser against the chain of whole-file regular expressions which it
+replaced, using gcodeForTesting/Dragon.nc repeated until it is the size of a large 3D relief job.
+
+Run from the top level of the repository with:
+
+    python -m Benchmarks.gcodeParserBenchmark [copies]
+
+'''
+
+from DataStructures.gcodeParser              import GcodeParser
+from StringIO                                import StringIO
+import re
+import sys
+import time
+
+
+def legacyParse(rawfilters, truncate, digits, tolerance):
+    '''
+
+    The gcode normalization previously done by GcodeCanvas.reloadGcode, kept here to compare
+    against.
+
+    '''
+    filtersparsed = re.sub(r'\(([^)]*)\)','\n',rawfilters)
+    filtersparsed = re.sub(r';([^\n]*)\n','\n',filtersparsed)
+    filtersparsed = re.sub(r'\n\n','\n',filtersparsed)
+    filtersparsed = re.sub(r'([0-9])([GXYZIJFTM]) *', '\\1 \\2',filtersparsed)
+    filtersparsed = re.sub(r'  +',' ',filtersparsed)
+    if truncate:
+        filtersparsed = re.sub(r'([+-]?\d*\.\d{1,'+str(digits)+'})(\d*)',r'\g<1>',filtersparsed)
+    filtersparsed = re.split('\n', filtersparsed)
+    filtersparsed = [x + ' ' for x in filtersparsed]
+    filtersparsed = [x.lstrip() for x in filtersparsed]
+    for axis in 'XYZIJF':
+        filtersparsed = [x.replace(axis + ' ', axis) for x in filtersparsed]
+
+    zMoves = [0]
+    zList = []
+    for index, line in enumerate(filtersparsed):
+        z = re.search("Z(?=.)([+-]?([0-9]*)(\.([0-9]+))?)",line)
+        if z:
+            zList.append(z)
+            if len(zList) > 1:
+                if not abs(float(zList[-1].groups()[0]) - float(zList[-2].groups()[0])) <= tolerance:
+                    zMoves.append(index-1)
+            else:
+                zMoves.append(index)
+
+    return filtersparsed, zMoves
+
+def timeIt(function, *args):
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+def main(copies = 300):
+    with open('gcodeForTesting/Dragon.nc', 'r') as dragon:
+        rawText = dragon.read() * copies
+
+    print "Parsing " + str(rawText.count('\n')) + " lines (" + str(len(rawText)/1000000.0) + " MB)"
+
+    for truncate in (0, 1):
+        legacy, legacyTime = timeIt(legacyParse, rawText, truncate, 4, 0.5)
+        parsed, parserTime = timeIt(GcodeParser(truncate, 4, 0.5).parse, StringIO(rawText))
+
+        print "truncate=%d  legacy: %.2fs  GcodeParser: %.2fs  speedup: %.1fx  identical: %s" % (truncate, legacyTime, parserTime, legacyTime/parserTime, legacy == (list(parsed[0]), parsed[1]))
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
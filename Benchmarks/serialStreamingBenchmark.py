@@ -0,0 +1,98 @@
+'''
+
+Times sending a short segment 3D toolpath to the firmware emulator, one line at a time as Ground
+Control used to and streamed to fill the machine's receive buffer.
+
+The emulator is connected through an in-memory loopback. It receives bytes at the speed of a 57600
+baud serial connection into a 256 byte receive buffer, spends a fixed time on each line and sends
+'ok' when each line is done, like the Arduino does.
+
+Run from the top level of the repository with:
+
+    python -m Benchmarks.serialStreamingBenchmark [lines] [milliseconds per line]
+
+'''
+
+from Connection.serialPortThread             import SerialPortThread
+from Connection.transports                   import loopbackPair
+from DataStructures.data                     import Data
+from DataStructures.gcodeProgram             import GcodeProgram
+from DataStructures.wakingQueue              import WakingQueue
+from Simulation.firmwareEmulator             import FirmwareEmulator
+import Queue
+import os
+import random
+import sys
+import threading
+import time
+
+
+def shortSegmentToolpath(lines):
+    '''
+
+    A 3D relief style toolpath made of many short moves.
+
+    '''
+    random.seed(0)
+    program = ['G21', 'G90', 'G1 F800']
+    x, y = 0.0, 0.0
+    for index in xrange(lines):
+        x = x + random.uniform(0.1, 0.5)
+        y = y + random.uniform(-0.2, 0.2)
+        program.append('G1 X%.4f Y%.4f Z%.4f' % (x, y, -random.uniform(0, 3)))
+    return GcodeProgram(program)
+
+def timeJob(program, lineTime, streaming, minTimePerLine):
+    data = Data()
+    data.gcode      = program
+    data.gcodeIndex = 0
+    data.units      = 'MM'
+    data.wake_queue  = Queue.Queue()        #the queues are shared by every Data unless replaced
+    data.gcode_queue = WakingQueue(data.wake_queue)
+    data.quick_queue = WakingQueue(data.wake_queue)
+
+    hostEnd, machineEnd = loopbackPair()
+    machine = FirmwareEmulator(machineEnd, lineTime = lineTime)
+    thread  = SerialPortThread()
+    thread.setUpData(data)
+    thread.transport      = hostEnd
+    thread.streaming      = streaming
+    thread.MINTimePerLine = minTimePerLine
+
+    machine.start()
+    connection = threading.Thread(target = thread._runConnection)
+    connection.daemon = True
+    connection.start()
+
+    while not thread.machineHasResponded:
+        time.sleep(.001)
+
+    start = time.time()
+    cpu   = sum(os.times()[:2])
+    data.uploadFlag = 1
+    while data.uploadFlag or machine.linesRun < len(program) + 2:      #+2 for the firmware version and units lines
+        time.sleep(.001)
+    taken = time.time() - start
+    cpu   = sum(os.times()[:2]) - cpu       #includes the emulator
+    rate  = data.linesPerSecond             #measured by the connection from the acks
+
+    machine.stop()
+    connection.join()                       #the connection times out once the machine goes away
+    return taken, cpu, rate, machine.overflows
+
+def main(lines = 500, lineTime = 0.004):
+    program = shortSegmentToolpath(lines)
+    print "%d lines, %.1fms per line on the machine" % (len(program), lineTime*1000)
+
+    for minTimePerLine in (0.05, SerialPortThread.MINTimePerLine):        #the 50ms minimum Ground Control used to keep between lines
+        for streaming in (False, True):
+            taken, cpu, rate, overflows = timeJob(program, lineTime, streaming, minTimePerLine)
+            print "%-14s minimum %4.0fms between lines: %6.2fs  cpu %5.2fs  %7.1f lines/s (%.1f measured)  buffer overflows: %d" % ("streamed" if streaming else "one at a time", minTimePerLine*1000, taken, cpu, len(program)/taken, rate, overflows)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        main(int(sys.argv[1]), float(sys.argv[2])/1000)
+    elif len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
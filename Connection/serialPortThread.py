@@ -1,6 +1,9 @@
 from DataStructures.makesmithInitFuncs         import   MakesmithInitFuncs
 from DataStructures.data          import   Data
+from Connection.transports        import   transportFor
+from DataStructures.telemetryLog  import   Sent, Ack, parsePosition, parsePositionalError
 import serial
+import threading
 import time
 from collections import deque
 
@@ -16,28 +19,38 @@ class SerialPortThread(MakesmithInitFuncs):
     '''
     
     machineIsReadyForData      = False # Tracks whether last command was acked
+    machineHasResponded        = False # Tracks whether any command has been acked since connecting
+    connected                  = False # Keeps the thread reading from the machine running
+    streaming                  = True  # Send lines whenever they fit in the buffer rather than one at a time
+    nextCommand                = None  # A command taken from the gcode_queue which did not fit in the buffer yet
     lastWriteTime              = time.time()
     bufferSize                 = 256                #The total size of the arduino buffer
     bufferSpace                = bufferSize         #The amount of space currently available in the buffer
-    lengthOfLastLineStack      =  deque()
+    lengthOfLastLineStack      =  deque()           #(length, time sent, line number) of each line the machine has not acked yet
+    completedLines             = deque()            #The time each line was acked within the last rateWindow seconds
+    rateWindow                 = 2.0                #How many seconds of acks the line rate is measured over
     
-    # Minimum time between lines sent to allow Arduino to cope
-    # could be smaller (0.02) however larger number doesn't seem to impact performance
-    MINTimePerLine = 0.05    
+    # Optional minimum time between lines sent. Lines are paced by the acks from the machine, which
+    # free space in its buffer as it finishes with them, so this is normally not needed
+    MINTimePerLine = 0
     
-    def _write (self, message, isQuickCommand = False):
+    checkInterval  = .25    #how often the connection wakes to check it has not been lost, in seconds
+    
+    def _write (self, message, isQuickCommand = False, lineNumber = -1):
         #message = message + 'L' + str(len(message) + 1 + 2 + len(str(len(message))) )
         
         taken = time.time() - self.lastWriteTime
-        if taken < self.MINTimePerLine:  # wait between sends
-            # self.data.logger.writeToLog("Sleeping: " + str( taken ) + "\n")
-            time.sleep (self.MINTimePerLine) # could use (taken - MINTimePerLine)
+        if taken < self.MINTimePerLine:  # wait out the rest of the minimum time between sends
+            time.sleep (self.MINTimePerLine - taken)
         
         message = message.encode()
         print "Sending: " + str(message)
         
         message = message + '\n'
         
+        if len(message) > self.bufferSize:
+            self.data.message_queue.put("Warning: a line of " + str(len(message)) + " characters is longer than the machine's " + str(self.bufferSize) + " character buffer and may not be read correctly\n")
+        
         self.bufferSpace       = self.bufferSpace - len(message)        #shrink the available buffer space by the length of the line
         
         self.machineIsReadyForData = False
@@ -49,16 +62,19 @@ class SerialPortThread(MakesmithInitFuncs):
                 #if we've just sent a stop command, the buffer is now empty on the arduino side
                 self.lengthOfLastLineStack.clear()
                 self.bufferSpace = self.bufferSize - len(message)
-                self.lengthOfLastLineStack.append(len(message)) 
+                self.nextCommand = None
+                self.lengthOfLastLineStack.append((len(message), time.time(), lineNumber)) 
             else:
-                self.lengthOfLastLineStack.append(len(message))
+                self.lengthOfLastLineStack.append((len(message), time.time(), lineNumber))
         else:
-            self.lengthOfLastLineStack.appendleft(len(message))
+            self.lengthOfLastLineStack.appendleft((len(message), time.time(), lineNumber))
+        
+        self.data.telemetry.record(Sent(time.time(), lineNumber, len(message), self.bufferSpace))
         
         
         message = message.encode()
         try:
-            self.serialInstance.write(message)
+            self.transport.write(message)
             self.data.logger.writeToLog("Sent: " + str(message))
         except:
             print("write issue")
@@ -66,6 +82,56 @@ class SerialPortThread(MakesmithInitFuncs):
     
         self.lastWriteTime = time.time()
 
+    def _canSend(self, line):
+        '''
+        
+        True if line can be sent to the machine now. When streaming, lines are sent as long as they
+        fit in the space left in the machine's receive buffer, otherwise only once the buffer is
+        empty and the last line has been acked. A line too long for the buffer is always sent the
+        second way.
+        
+        '''
+        empty = self.bufferSpace == self.bufferSize and self.machineIsReadyForData
+        if self.streaming:
+            return (self.machineHasResponded and len(line) + 1 <= self.bufferSpace) or empty     #+1 for the newline
+        return empty
+    
+    def _recordCompletedLine(self):
+        '''
+        
+        Records that the machine has finished with a line and updates the rate the machine is
+        getting through lines, measured over the last rateWindow seconds.
+        
+        '''
+        now = time.time()
+        self.completedLines.append(now)
+        while now - self.completedLines[0] > self.rateWindow:
+            self.completedLines.popleft()
+        
+        taken = now - self.completedLines[0]
+        if taken > 0:
+            #the first line in the window was finished at the start of it, so isn't counted
+            self.data.linesPerSecond = (len(self.completedLines) - 1)/taken
+    
+    def _recordReport(self, lineFromMachine):
+        '''
+        
+        Adds position and positional error reports from the machine to the telemetry.
+        
+        '''
+        if lineFromMachine[0] == "<":
+            record = parsePosition(lineFromMachine, self.lastMessageTime)
+        elif lineFromMachine[0:4] == "[PE:":
+            record = parsePositionalError(lineFromMachine, self.lastMessageTime)
+        else:
+            return
+        if record is not None:
+            self.data.telemetry.record(record)
+    
+    def _resetLineRate(self):
+        self.completedLines      = deque()
+        self.data.linesPerSecond = 0.0
+    
     def _getFirmwareVersion(self):
         self.data.gcode_queue.put('B05 ')
     
@@ -76,7 +142,7 @@ class SerialPortThread(MakesmithInitFuncs):
             self.data.gcode_queue.put('G21 ')
     
     def getmessage (self):
-        #opens a serial connection called self.serialInstance
+        #opens a connection to the machine called self.transport
         
         #check for serial version being > 3
         if float(serial.VERSION[0]) < 3:
@@ -84,99 +150,163 @@ class SerialPortThread(MakesmithInitFuncs):
         
         try:
             #print("connecting")
-            self.serialInstance = serial.Serial(self.data.comport, 57600, timeout = .25) #self.data.comport is the com port which is opened
+            self.transport = transportFor(self.data.comport) #self.data.comport is the com port or address which is opened
+            self.transport.open()
         except:
             #print(self.data.comport + " is unavailable or in use")
             #self.data.message_queue.put("\n" + self.data.comport + " is unavailable or in use")
             pass
         else:
-            self.data.message_queue.put("\r\nConnected on port " + self.data.comport + "\r\n")
-            print("\r\nConnected on port " + self.data.comport + "\r\n")
-            gcode = ""
-            msg = ""
-            subReadyFlag = True
-            
-            self.serialInstance.parity = serial.PARITY_ODD #This is something you have to do to get the connection to open properly. I have no idea why.
-            self.serialInstance.close()
-            self.serialInstance.open()
-            self.serialInstance.close()
-            self.serialInstance.parity = serial.PARITY_NONE
-            self.serialInstance.open()
-            
-            #print "port open?:"
-            #print self.serialInstance.isOpen()
-            self.lastMessageTime = time.time()
-            self.data.connectionStatus = 1
-            
-            self._getFirmwareVersion()
-            self._setupMachineUnits()
-            
-            while True:
-                
-                
-                                        #Read serial line from machine if available
-                #-------------------------------------------------------------------------------------
-                lineFromMachine = ""
-                
-                try:
-                    if self.serialInstance.in_waiting > 0:
-                        lineFromMachine = self.serialInstance.readline()
-                        self.lastMessageTime = time.time()
-                        self.data.message_queue.put(lineFromMachine)
-                except:
-                    pass
-                
-                #Check if a line has been completed
-                if lineFromMachine == "ok\r\n" or (len(lineFromMachine) >= 6 and lineFromMachine[0:6] == "error:"):
-                    self.machineIsReadyForData = True
-                    if bool(self.lengthOfLastLineStack) is True:                                     #if we've sent lines to the machine
-                        self.bufferSpace = self.bufferSpace + self.lengthOfLastLineStack.pop()    #free up that space in the buffer
-                
-                
-                
-                                            #Write to the machine if ready
-                #-------------------------------------------------------------------------------------
-                
-                #send any emergency instructions to the machine if there are any
-                if self.data.quick_queue.empty() != True:
-                    command = self.data.quick_queue.get_nowait()
-                    self._write(command, True)
-                
-                #send regular instructions to the machine if there are any
-                if self.bufferSpace == self.bufferSize and self.machineIsReadyForData:
-                    if self.data.gcode_queue.empty() != True:
-                        command = self.data.gcode_queue.get_nowait() + " "
-                        self._write(command)
-                
-                #Send the next line of gcode to the machine if we're running a program
-                if self.bufferSpace == self.bufferSize and self.machineIsReadyForData: #> len(self.data.gcode[self.data.gcodeIndex]):
-                    if self.data.uploadFlag:
-                        self._write(self.data.gcode[self.data.gcodeIndex])
-                        
-                        #increment gcode index
-                        if self.data.gcodeIndex + 1 < len(self.data.gcode):
-                            self.data.gcodeIndex = self.data.gcodeIndex + 1
-                        else:
-                            self.data.uploadFlag = 0
-                            self.data.gcodeIndex = 0
-                            print "Gcode Ended"
-                
-                
-                
-                
-                
-                
-                                            #Check for serial connection loss
-                #-------------------------------------------------------------------------------------
-                if time.time() - self.lastMessageTime > 2:
-                    print "Connection Timed Out"
-                    self.data.message_queue.put("Connection Timed Out\n")
-                    if self.data.uploadFlag:
-                        self.data.message_queue.put("Message: USB connection lost. This has likely caused the machine to loose it's calibration, which can cause erratic behavior. It is recommended to stop the program, remove the sled, and perform the chain calibration process. Press Continue to override and proceed with the cut.")
-                    self.data.connectionStatus = 0
-                    self.serialInstance.close()
-                    return
+            self.data.message_queue.put("\r\nConnected on port " + self.transport.name + "\r\n")
+            print("\r\nConnected on port " + self.transport.name + "\r\n")
+            
+            self.streaming = self.data.config.getboolean('Ground Control Settings', 'streamGcode')
+            self.data.telemetry.enabled = self.data.config.getboolean('Ground Control Settings', 'recordTelemetry')
+            self._runConnection()
+    
+    def _runConnection(self):
+        '''
+        
+        Exchanges messages with the machine over self.transport, which must already be open, until
+        the connection is lost. Any of the transports in Connection.transports can be used.
+        
+        The connection sleeps until there is a line from the machine or something new to send,
+        which are both signalled through data.wake_queue.
+        
+        '''
+        
+        self.lastMessageTime = time.time()
+        self.data.connectionStatus = 1
+        
+        #the machine starts with an empty buffer
+        self.bufferSpace           = self.bufferSize
+        self.lengthOfLastLineStack = deque()
+        self._resetLineRate()
+        
+        #drop stale signals from before connecting, the queues themselves are checked on every pass
+        with self.data.wake_queue.mutex:
+            self.data.wake_queue.queue.clear()
+        
+        self.connected = True
+        reader = threading.Thread(target = self._readFromMachine)
+        reader.daemon = True
+        reader.start()
+        ticker = threading.Thread(target = self._wakePeriodically)
+        ticker.daemon = True
+        ticker.start()
+        self.data.bind(uploadFlag = self._wakeUp)
+        
+        self._getFirmwareVersion()
+        self._setupMachineUnits()
+        
+        while True:
+            
+            
+                                    #Wait for a line from the machine or something to send
+            #-------------------------------------------------------------------------------------
+            lineFromMachine = self.data.wake_queue.get() or ""
+            
+            if lineFromMachine:
+                self.lastMessageTime = time.time()
+                self.data.message_queue.put(lineFromMachine)
+                self._recordReport(lineFromMachine)
+            
+            #Check if a line has been completed
+            if lineFromMachine == "ok\r\n" or (len(lineFromMachine) >= 6 and lineFromMachine[0:6] == "error:"):
+                self.machineIsReadyForData = True
+                self.machineHasResponded   = True
+                if bool(self.lengthOfLastLineStack) is True:                                     #if we've sent lines to the machine
+                    length, sentTime, lineNumber = self.lengthOfLastLineStack.pop()
+                    self.bufferSpace = self.bufferSpace + length                              #free up that space in the buffer
+                    if lineNumber >= 0:                                                       #the machine has finished a line of the program
+                        self.data.runningIndex = min(lineNumber + 1, len(self.data.gcode) - 1)
+                    self._recordCompletedLine()
+                    self.data.telemetry.record(Ack(self.lastMessageTime, self.lastMessageTime - sentTime, self.bufferSpace))
+            elif self.completedLines and time.time() - self.completedLines[-1] > self.rateWindow:
+                self._resetLineRate()                                                         #the machine has stopped working through lines
+            
+            
+            
+                                        #Write to the machine if ready
+            #-------------------------------------------------------------------------------------
+            
+            #send any emergency instructions to the machine if there are any
+            if self.data.quick_queue.empty() != True:
+                command = self.data.quick_queue.get_nowait()
+                self._write(command, True)
+            
+            #send regular instructions to the machine if there are any
+            while self.nextCommand is not None or self.data.gcode_queue.empty() != True:
+                if self.nextCommand is None:
+                    self.nextCommand = self.data.gcode_queue.get_nowait() + " "
+                if not self._canSend(self.nextCommand):
+                    break
+                self._write(self.nextCommand)
+                self.nextCommand = None
+            
+            #Send the next lines of gcode to the machine if we're running a program
+            while self.data.uploadFlag and self.nextCommand is None and self._canSend(self.data.gcode[self.data.gcodeIndex]):
+                self._write(self.data.gcode[self.data.gcodeIndex], lineNumber = self.data.gcodeIndex)
                 
-                # Sleep between passes to save CPU
-                time.sleep(.001)
-                    
\ No newline at end of file
+                #increment gcode index
+                if self.data.gcodeIndex + 1 < len(self.data.gcode):
+                    self.data.gcodeIndex = self.data.gcodeIndex + 1
+                else:
+                    self.data.uploadFlag = 0
+                    self.data.gcodeIndex = 0
+                    print "Gcode Ended"
+            
+            
+            
+            
+            
+            
+                                        #Check for serial connection loss
+            #-------------------------------------------------------------------------------------
+            if time.time() - self.lastMessageTime > 2:
+                print "Connection Timed Out"
+                self.data.message_queue.put("Connection Timed Out\n")
+                if self.data.uploadFlag:
+                    self.data.message_queue.put("Message: USB connection lost. This has likely caused the machine to loose it's calibration, which can cause erratic behavior. It is recommended to stop the program, remove the sled, and perform the chain calibration process. Press Continue to override and proceed with the cut.")
+                self.data.connectionStatus = 0
+                self.connected = False
+                self.data.unbind(uploadFlag = self._wakeUp)
+                self.transport.close()
+                return
+    
+    def _readFromMachine(self):
+        '''
+        
+        Runs in its own thread while connected, passing each line from the machine to the connection
+        through data.wake_queue. A read which times out passes an empty line so that the connection
+        still checks whether it has been lost.
+        
+        '''
+        partLine = ""
+        while self.connected:
+            try:
+                partLine = partLine + self.transport.readline()
+            except:
+                time.sleep(.25)         #the port is closed or gone, the connection will time out
+            
+            if partLine.endswith("\n"):
+                self.data.wake_queue.put(partLine)
+                partLine = ""
+            else:
+                self.data.wake_queue.put("")
+    
+    def _wakePeriodically(self):
+        '''
+        
+        Runs in its own thread while connected, waking the connection every checkInterval seconds
+        so that it notices when the machine stops responding, even over a transport whose reads
+        never time out.
+        
+        '''
+        while self.connected:
+            time.sleep(self.checkInterval)
+            self.data.wake_queue.put("")
+    
+    def _wakeUp(self, *args):
+        self.data.wake_queue.put(None)
+                
\ No newline at end of file
@@ -0,0 +1,158 @@
+'''
+
+This module provides the transports which a connection to the machine can run over, so that the
+protocol spoken with the machine does not depend on how the bytes get there.
+
+Every transport has the same methods:
+
+    open()          opens the connection, raising an exception if it can't
+    readline()      returns the next line from the machine, including its newline, or an empty
+                    string if no whole line arrived within the transport's timeout, if it has one
+    write(data)     sends data to the machine
+    close()         closes the connection
+
+and a name which is shown to the user. readline and write raise an exception once the connection
+is lost.
+
+'''
+
+import Queue
+import serial
+import socket
+
+
+class SerialTransport(object):
+    '''
+
+    Talks to the machine over a serial port, which is how the Arduino is usually connected.
+
+    '''
+
+    def __init__(self, port, baudRate = 57600, timeout = .25):
+        self.name     = port
+        self.baudRate = baudRate
+        self.timeout  = timeout
+        self.port     = None
+
+    def open(self):
+        self.port = serial.Serial(self.name, self.baudRate, timeout = self.timeout)
+
+        self.port.parity = serial.PARITY_ODD #This is something you have to do to get the connection to open properly. I have no idea why.
+        self.port.close()
+        self.port.open()
+        self.port.close()
+        self.port.parity = serial.PARITY_NONE
+        self.port.open()
+
+    def readline(self):
+        return self.port.readline()
+
+    def write(self, data):
+        self.port.write(data)
+
+    def close(self):
+        self.port.close()
+
+
+class TCPTransport(object):
+    '''
+
+    Talks to the machine through a network serial bridge, like ser2net or a wifi module, which
+    passes the bytes of a TCP connection to and from the machine's serial port.
+
+    '''
+
+    def __init__(self, host, port, timeout = .25):
+        self.name     = 'tcp://%s:%d' % (host, port)
+        self.address  = (host, port)
+        self.timeout  = timeout
+        self.socket   = None
+        self.partLine = ''                  #the start of a line which has not all arrived yet
+
+    def open(self):
+        self.socket = socket.create_connection(self.address, self.timeout)
+        self.socket.settimeout(self.timeout)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)     #send each line as soon as it is written
+        self.partLine = ''
+
+    def readline(self):
+        while '\n' not in self.partLine:
+            try:
+                received = self.socket.recv(4096)
+            except socket.timeout:
+                return ''
+            if not received:
+                raise IOError('Connection closed by ' + self.name)
+            self.partLine = self.partLine + received
+
+        line, self.partLine = self.partLine.split('\n', 1)
+        return line + '\n'
+
+    def write(self, data):
+        self.socket.sendall(data)
+
+    def close(self):
+        self.socket.close()
+
+
+class LoopbackTransport(object):
+    '''
+
+    One end of an in-memory connection, made by loopbackPair. Whatever is written to one end is
+    read from the other, which lets the protocol be run against a machine emulated in the same
+    process as fast as the two can exchange lines.
+
+    readline waits until a line arrives or the other end closes, without a timeout, so that lines
+    are passed on the moment they are written.
+
+    '''
+
+    def __init__(self, incoming, outgoing, name = 'loopback'):
+        self.name     = name
+        self.incoming = incoming
+        self.outgoing = outgoing
+        self.partLine = ''                  #the start of a line which has not all been written yet
+
+    def open(self):
+        pass
+
+    def readline(self):
+        line = self.incoming.get()
+        if line is None:
+            self.incoming.put(None)         #leave the end marker for any later reads
+            raise IOError('Connection closed by the other end of ' + self.name)
+        return line
+
+    def write(self, data):
+        lines = (self.partLine + data).split('\n')
+        self.partLine = lines.pop()
+        for line in lines:
+            self.outgoing.put(line + '\n')
+
+    def close(self):
+        self.outgoing.put(None)
+        self.incoming.put(None)
+
+
+def loopbackPair(name = 'loopback'):
+    '''
+
+    The two ends of an in-memory connection, as (the end Ground Control uses, the end the machine
+    uses).
+
+    '''
+    toMachine   = Queue.Queue()
+    fromMachine = Queue.Queue()
+    return LoopbackTransport(fromMachine, toMachine, name), LoopbackTransport(toMachine, fromMachine, name)
+
+def transportFor(address):
+    '''
+
+    The transport for an address from the settings, which is either a serial port or
+    tcp://host:port for a network serial bridge.
+
+    '''
+    if address.startswith('tcp://'):
+        host, port = address[len('tcp://'):].rsplit(':', 1)
+        return TCPTransport(host, int(port))
+    return SerialTransport(address)
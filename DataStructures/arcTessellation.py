@@ -0,0 +1,64 @@
+'''
+
+This module turns G2 and G3 arcs into the points of a polyline for drawing.
+
+The number of points depends on the size of the arc, so that no chord strays further from the true
+arc than a given tolerance. Small arcs get a handful of points and large arcs as many as they need.
+
+'''
+
+import math
+
+
+maxStepAngle = math.pi/4                #the most any one chord may turn through
+
+def arcSteps(radius, arcLength, tolerance):
+    '''
+
+    The number of chords needed to draw an arc of radius turning through arcLength radians without
+    any chord being further than tolerance from the arc.
+
+    '''
+    if radius > tolerance:
+        stepAngle = min(2*math.acos(1 - tolerance/radius), maxStepAngle)
+    else:
+        stepAngle = maxStepAngle
+    return max(1, int(math.ceil(arcLength/stepAngle)))
+
+def tessellateArc(xStart, yStart, xEnd, yEnd, centerX, centerY, clockwise, tolerance):
+    '''
+
+    The points of an arc around (centerX, centerY) from (xStart, yStart) to (xEnd, yEnd) as a flat
+    list of x, y pairs. The list starts and ends exactly at the start and end points. An arc which
+    ends where it starts is a full circle.
+
+    '''
+    radius = math.sqrt((xStart - centerX)**2 + (yStart - centerY)**2)
+
+    startAngle = math.atan2(yStart - centerY, xStart - centerX)
+    endAngle   = math.atan2(yEnd - centerY, xEnd - centerX)
+
+    #the angle turned through, which is negative clockwise
+    if clockwise:
+        arcLength = startAngle - endAngle
+    else:
+        arcLength = endAngle - startAngle
+    if arcLength <= 0:
+        arcLength = arcLength + 2*math.pi
+
+    steps = arcSteps(radius, arcLength, tolerance)
+    step  = arcLength/steps
+    if clockwise:
+        step = -step
+
+    points = [0.0]*(2*steps + 2)
+    points[0] = xStart
+    points[1] = yStart
+    for index in xrange(1, steps):
+        angle = startAngle + step*index
+        points[2*index]     = centerX + radius*math.cos(angle)
+        points[2*index + 1] = centerY + radius*math.sin(angle)
+    points[-2] = xEnd
+    points[-1] = yEnd
+
+    return points
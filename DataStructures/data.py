@@ -7,6 +7,9 @@ from kivy.properties                                  import NumericProperty
 from kivy.event                                       import EventDispatcher
 from DataStructures.logger                            import   Logger
 from DataStructures.loggingQueue                      import   LoggingQueue
+from DataStructures.wakingQueue                       import   WakingQueue
+from DataStructures.gcodeProgram                      import   GcodeProgram
+from DataStructures.telemetryLog                      import   TelemetryLog
 import Queue
 
 class Data(EventDispatcher):
@@ -25,7 +28,7 @@ class Data(EventDispatcher):
     '''
     
     #Gcodes contains all of the lines of gcode in the opened file
-    gcode      = ObjectProperty([])
+    gcode      = ObjectProperty(GcodeProgram())
     version    = '1.11'
     #all of the available COM ports
     comPorts   = []
@@ -33,6 +36,9 @@ class Data(EventDispatcher):
     comport    = StringProperty("")
     #The index of the next unread line of Gcode
     gcodeIndex = NumericProperty(0)
+    #The index of the line of Gcode the machine is running, the first one sent which it has not acked.
+    #When streaming this is behind gcodeIndex by the lines waiting in the machine's buffer
+    runningIndex = NumericProperty(0)
     #Index of changes in z
     zMoves     = ObjectProperty([])
     #Holds the current value of the feed rate
@@ -45,7 +51,9 @@ class Data(EventDispatcher):
     units      = OptionProperty("MM", options=["MM", "INCHES"])
     tolerance  = NumericProperty(0.5)
     gcodeShift = ObjectProperty([0.0,0.0])                          #the amount that the gcode has been shifted
+    linesPerSecond = 0.0                                            #the rate the machine is finishing lines at, measured from its acks
     logger     =  Logger()                                          #the module which records the machines behavior to review later
+    telemetry  =  TelemetryLog()                                    #binary records of the lines sent, acks and reports from the machine
     
     '''
     Flags
@@ -89,8 +97,9 @@ class Data(EventDispatcher):
     Queues
     '''
     message_queue   =  LoggingQueue(logger)
-    gcode_queue     =  Queue.Queue()
-    quick_queue     =  Queue.Queue()
+    wake_queue      =  Queue.Queue()                    #wakes the serial connection with lines from the machine or None when there is something to send
+    gcode_queue     =  WakingQueue(wake_queue)
+    quick_queue     =  WakingQueue(wake_queue)
     
     def __init__(self):
         '''
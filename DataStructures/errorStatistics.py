@@ -0,0 +1,185 @@
+'''
+
+This module keeps statistics of the positional error reported by the machine while it cuts, using
+the same small amount of memory however long the job runs.
+
+'''
+
+from collections                             import OrderedDict
+import json
+import math
+import threading
+
+
+class ErrorStatistics(object):
+    '''
+
+    ErrorStatistics takes each error value along with where the sled was when it was reported.
+
+    It keeps the running mean and variance of the errors, the largest error and where it happened,
+    and a histogram of the errors in buckets whose width grows with the error, so that any
+    percentile can be read off to within relativeAccuracy of the true value. The board is divided
+    into square cells of cellSize millimeters, each with the count, mean and largest of the errors
+    reported in it, to show which regions of the board cut worst.
+
+    Values can be added from one thread while they are read from another.
+
+    '''
+
+    def __init__(self, cellSize = 100.0, relativeAccuracy = 0.01, smallestError = 0.001):
+        '''
+
+        Errors below smallestError are counted together as zero.
+
+        '''
+        self.cellSize      = float(cellSize)
+        self.smallestError = smallestError
+        self.gamma         = (1 + relativeAccuracy)/(1 - relativeAccuracy)      #the ratio between bucket edges
+        self.logGamma      = math.log(self.gamma)
+        self.lock          = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.count      = 0
+        self.mean       = 0.0
+        self.squares    = 0.0               #the sum of the squared differences from the mean
+        self.maximum    = 0.0
+        self.maximumAt  = None              #the x, y position of the largest error
+        self.zeroCount  = 0                 #errors below smallestError
+        self.buckets    = {}                #bucket number to the count of errors in it
+        self.cells      = {}                #(column, row) to [count, total, largest] of the errors in that cell
+
+    def add(self, error, x = None, y = None):
+        '''
+
+        Add the size of an error, in millimeters, reported with the sled at x, y millimeters. The
+        error still counts if the position is unknown or unreadable, but it is not placed on the
+        board.
+
+        '''
+        error = abs(error)
+        if math.isnan(error) or math.isinf(error):
+            return
+
+        placed = x is not None and y is not None and not (math.isnan(x) or math.isinf(x) or math.isnan(y) or math.isinf(y))
+
+        with self.lock:
+            #Welford's running mean and variance
+            self.count   = self.count + 1
+            delta        = error - self.mean
+            self.mean    = self.mean + delta/self.count
+            self.squares = self.squares + delta*(error - self.mean)
+
+            if error >= self.maximum:
+                self.maximum   = error
+                self.maximumAt = (x, y) if placed else None
+
+            if error < self.smallestError:
+                self.zeroCount = self.zeroCount + 1
+            else:
+                bucket = int(math.ceil(math.log(error)/self.logGamma))
+                self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+            if placed:
+                cell  = (int(math.floor(x/self.cellSize)), int(math.floor(y/self.cellSize)))
+                stats = self.cells.get(cell)
+                if stats is None:
+                    stats = self.cells[cell] = [0, 0.0, 0.0]
+                stats[0] = stats[0] + 1
+                stats[1] = stats[1] + error
+                stats[2] = max(stats[2], error)
+
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self.squares/(self.count - 1)
+
+    def standardDeviation(self):
+        return math.sqrt(self.variance())
+
+    def percentile(self, percent):
+        '''
+
+        The error which percent of the errors are no larger than, or None if there are no errors.
+
+        '''
+        with self.lock:
+            if self.count == 0:
+                return None
+            rank = max(int(math.ceil(percent/100.0*self.count)), 1)
+
+            seen = self.zeroCount
+            if seen >= rank:
+                return 0.0
+            for bucket in sorted(self.buckets):
+                seen = seen + self.buckets[bucket]
+                if seen >= rank:
+                    #the middle of the bucket, which is within relativeAccuracy of every value in it,
+                    #but no more than the largest error
+                    return min(2*self.gamma**bucket/(self.gamma + 1), self.maximum)
+            return self.maximum
+
+    def worstCells(self, count = 10, minimumSamples = 5):
+        '''
+
+        The cells with the highest mean error as (xStart, yStart, samples, mean, largest) tuples,
+        skipping cells with fewer than minimumSamples errors.
+
+        '''
+        return sorted(self._cellRows(minimumSamples), key = lambda row: row[3], reverse = True)[:count]
+
+    def _cellRows(self, minimumSamples = 1):
+        with self.lock:
+            return [(column*self.cellSize, row*self.cellSize, stats[0], stats[1]/stats[0], stats[2])
+                    for (column, row), stats in self.cells.items() if stats[0] >= minimumSamples]
+
+    def summary(self):
+        '''
+
+        The statistics as an ordered dictionary.
+
+        '''
+        results = OrderedDict()
+        results['samples']           = self.count
+        results['mean']              = self.mean
+        results['standardDeviation'] = self.standardDeviation()
+        for percent in (50, 90, 95, 99):
+            results['percentile' + str(percent)] = self.percentile(percent)
+        results['maximum']           = self.maximum
+        results['maximumAt']         = self.maximumAt
+        return results
+
+    def report(self):
+        '''
+
+        The statistics as text to show the user.
+
+        '''
+        if self.count == 0:
+            return "No positional errors have been recorded"
+
+        summary = self.summary()
+        text = ("Samples: %d\nAverage error: %.3fmm\nStandard deviation: %.3fmm\n" % (summary['samples'], summary['mean'], summary['standardDeviation']) +
+                "Median: %.3fmm\n95th percentile: %.3fmm\n99th percentile: %.3fmm\n" % (summary['percentile50'], summary['percentile95'], summary['percentile99']) +
+                "Largest error: %.3fmm" % summary['maximum'])
+        if summary['maximumAt'] is not None:
+            text = text + " at %.0f, %.0f" % summary['maximumAt']
+
+        worst = self.worstCells(5)
+        if worst:
+            text = text + "\n\nWorst regions of the board (%gmm squares):" % self.cellSize
+            for xStart, yStart, samples, mean, largest in worst:
+                text = text + "\n    from %.0f, %.0f: average %.3fmm, largest %.3fmm over %d samples" % (xStart, yStart, mean, largest, samples)
+        return text
+
+    def export(self, path):
+        '''
+
+        Write the statistics and every cell of the board to a JSON file.
+
+        '''
+        results = self.summary()
+        results['cellSize'] = self.cellSize
+        results['cells']    = [OrderedDict(zip(('x', 'y', 'samples', 'mean', 'maximum'), row)) for row in sorted(self._cellRows())]
+        with open(path, 'w') as exportFile:
+            json.dump(results, exportFile, indent = 4)
@@ -0,0 +1,239 @@
+'''
+
+This module provides an on disk cache of parsed gcode programs so that a file which has been opened
+before does not need to be parsed again.
+
+Each entry is keyed by a hash of the contents of the gcode file and the settings it was parsed with.
+The cache is limited in size, and the entries which were used least recently are deleted first.
+
+'''
+
+from DataStructures.gcodeParser              import GcodeSource
+from DataStructures.gcodeProgram             import GcodeProgram, MappedGcodeProgram
+from array                                   import array
+import hashlib
+import os
+import struct
+import zlib
+
+
+class GcodeCache(object):
+    '''
+
+    GcodeCache stores the normalized text and z-axis move index of a GcodeProgram, or just the
+    block index of a MappedGcodeProgram, in a file in the cache directory along with the
+    GcodeSource which allows the program to be re-read incrementally.
+
+    Reading from or writing to the cache never fails loudly, a problem with the cache only means the
+    file is parsed again.
+
+    '''
+
+    directory = os.path.join(os.path.expanduser('~'), '.groundcontrol', 'gcodeCache')
+
+    version   = 3
+    header    = struct.Struct('<4sBBxxQQQQQQi')     #magic, version, array item size, the lengths of each part, then the crc32 of the rest
+    magic     = 'GCPC'
+
+    def __init__(self, maxSize, directory = None):
+        '''
+
+        maxSize is the largest number of bytes the cache is allowed to use.
+
+        '''
+        self.maxSize = maxSize
+        if directory is not None:
+            self.directory = directory
+
+    def key(self, filename, parser, mapped):
+        '''
+
+        The cache key for the gcode file at filename parsed by parser, either in full or
+        memory mapped.
+
+        '''
+        fileHash = hashlib.sha1()
+        with open(filename, 'rb') as gcodeFile:
+            while True:
+                chunk = gcodeFile.read(1 << 20)
+                if not chunk:
+                    break
+                fileHash.update(chunk)
+
+        if parser.truncate:
+            settings = 't' + str(parser.digits)
+        else:
+            settings = 'f'
+        settings = settings + '-z' + repr(float(parser.tolerance)) + ('-m' if mapped else '-p')
+
+        return fileHash.hexdigest() + '-' + settings
+
+    def load(self, key, filename, parser, fileStatus):
+        '''
+
+        The cached (program, zMoves) for key, or None if it is not in the cache. A memory mapped
+        program maps filename and uses parser to normalize its lines. fileStatus is the os.stat of
+        filename from before key was made, which is recorded in the program's source.
+
+        '''
+        entryPath = os.path.join(self.directory, key)
+        try:
+            with open(entryPath, 'rb') as entry:
+                contents = entry.read()
+            os.utime(entryPath, None)                               #mark the entry as recently used
+        except (IOError, OSError):
+            return None
+
+        try:
+            magic, version, itemSize, textLength, offsetCount, zMoveCount, blockCount, zTextLength, sourceLength, checksum = self.header.unpack_from(contents)
+            if magic != self.magic or version != self.version or itemSize != array('L').itemsize:
+                return None
+            
+            #a truncated or corrupted entry is deleted, so the file is parsed and stored again
+            entryLength = self.header.size + textLength + (offsetCount + zMoveCount + 3*blockCount)*itemSize + 20*blockCount + zTextLength
+            if len(contents) != entryLength or zlib.crc32(buffer(contents, self.header.size)) != checksum:
+                self._remove(entryPath)
+                return None
+
+            position = self.header.size
+            text     = contents[position:position + textLength]
+            position = position + textLength
+            offsets  = array('L', contents[position:position + offsetCount*itemSize])
+            position = position + offsetCount*itemSize
+            zMoves   = array('L', contents[position:position + zMoveCount*itemSize]).tolist()
+            position = position + zMoveCount*itemSize
+            blocks   = array('L', contents[position:position + 3*blockCount*itemSize])
+            position = position + 3*blockCount*itemSize
+            hashes   = contents[position:position + 20*blockCount]
+            position = position + 20*blockCount
+            zText    = contents[position:position + zTextLength]
+            source   = GcodeSource(filename, parser, fileStatus)
+        except (struct.error, ValueError, OSError):
+            return None
+
+        source.length      = sourceLength
+        source.blockStarts = blocks[:blockCount]
+        source.firstLines  = blocks[blockCount:2*blockCount]
+        source.zMoveCounts = blocks[2*blockCount:]
+        source.hashes      = [hashes[20*block:20*block + 20] for block in xrange(blockCount)]
+        source.previousZs  = [previousZ[1:] if previousZ else None for previousZ in zText.split('\n')] if blockCount else []
+
+        try:
+            if key.endswith('-m'):
+                gcode = self._mappedProgram(filename, parser, offsets)
+            else:
+                gcode = GcodeProgram()
+                gcode.text       = bytearray(text)
+                gcode.lineStarts = offsets
+        except (IOError, IndexError, ValueError):
+            self._remove(entryPath)
+            return None
+        gcode.source = source
+
+        return gcode, zMoves
+
+    def store(self, key, gcode, zMoves):
+        '''
+
+        Add a freshly parsed program and its z-axis move index to the cache, then delete the least
+        recently used entries until the cache fits in maxSize.
+
+        '''
+        if isinstance(gcode, MappedGcodeProgram):
+            text    = ''
+            offsets = array('L', [gcode.lastBlock + 1, gcode.lineCount])   #+1 so the list is unsigned
+            offsets.extend(gcode.blockStarts)
+            offsets.extend(gcode.blockEnds)
+            offsets.extend(gcode.firstLines)
+        else:
+            text    = str(gcode.text)
+            offsets = gcode.lineStarts
+
+        zMoves = array('L', zMoves)
+
+        source = getattr(gcode, 'source', None)
+        blocks = array('L')
+        hashes = ''
+        zText  = ''
+        sourceLength = 0
+        if source is not None:
+            blocks.extend(source.blockStarts)
+            blocks.extend(source.firstLines)
+            blocks.extend(source.zMoveCounts)
+            hashes = ''.join(source.hashes)
+            zText  = '\n'.join('' if previousZ is None else '=' + previousZ for previousZ in source.previousZs)   #'' is a z height of None
+            sourceLength = source.length
+
+        entryPath = os.path.join(self.directory, key)
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+            checksum = 0
+            for part in (text, offsets, zMoves, blocks, hashes, zText):
+                checksum = zlib.crc32(buffer(part), checksum)
+            
+            with open(entryPath + '.tmp', 'wb') as entry:
+                entry.write(self.header.pack(self.magic, self.version, offsets.itemsize, len(text), len(offsets), len(zMoves), len(blocks)//3, len(zText), sourceLength, checksum))
+                entry.write(text)
+                offsets.tofile(entry)
+                zMoves.tofile(entry)
+                blocks.tofile(entry)
+                entry.write(hashes)
+                entry.write(zText)
+
+            if os.path.exists(entryPath):
+                os.remove(entryPath)
+            os.rename(entryPath + '.tmp', entryPath)                #readers never see a partly written entry
+        except (IOError, OSError):
+            return
+
+        self.evict()
+
+    def evict(self):
+        '''
+
+        Delete the least recently used entries until the cache is no larger than maxSize.
+
+        '''
+        try:
+            entries = []
+            for name in os.listdir(self.directory):
+                entryPath = os.path.join(self.directory, name)
+                entries.append((os.path.getmtime(entryPath), os.path.getsize(entryPath), entryPath))
+
+            entries.sort()
+            totalSize = sum(size for modified, size, entryPath in entries)
+            for modified, size, entryPath in entries:
+                if totalSize <= self.maxSize:
+                    break
+                os.remove(entryPath)
+                totalSize = totalSize - size
+        except (IOError, OSError):
+            pass
+
+    def _remove(self, entryPath):
+        try:
+            os.remove(entryPath)
+        except OSError:
+            pass
+
+    def _mappedProgram(self, filename, parser, offsets):
+        '''
+
+        Rebuild a MappedGcodeProgram from its stored block index.
+
+        '''
+        blockCount = (len(offsets) - 2) // 3
+        if len(offsets) < 2 or len(offsets) != 2 + 3*blockCount or offsets[0] > blockCount:
+            raise ValueError('The stored block index is the wrong length')
+
+        gcode = MappedGcodeProgram(filename, parser)
+
+        gcode.lastBlock   = offsets[0] - 1
+        gcode.lineCount   = offsets[1]
+        gcode.blockStarts = offsets[2:2 + blockCount]
+        gcode.blockEnds   = offsets[2 + blockCount:2 + 2*blockCount]
+        gcode.firstLines  = offsets[2 + 2*blockCount:]
+
+        return gcode
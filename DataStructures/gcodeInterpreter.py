@@ -0,0 +1,238 @@
+'''
+
+This module turns a GcodeProgram into the moves it makes.
+
+The interpreter follows the modal state of the program (the motion command, units, absolute or
+relative positioning and the feed rate) and records each move with absolute coordinates in
+millimeters. Anything which needs to know where the program goes, like the gcode canvas, can use
+the moves without reading the gcode again, and drawing the same program a second time does not
+interpret it again.
+
+'''
+
+from DataStructures.gcodeProgram             import GcodeProgram
+from array                                   import array
+from bisect                                  import bisect_left, bisect_right
+import math
+
+
+class Toolpath(object):
+    '''
+
+    Toolpath is the list of moves a gcode program makes, stored in typed columns.
+
+    Each move has a kind, which is the G number of the motion command, the gcode line it comes
+    from, its end point and feed rate and, for arcs, the center of the arc. A move starts where the
+    one before it ends, and the first move starts at start.
+
+    '''
+
+    RAPID            = 0
+    FEED             = 1
+    CLOCKWISE        = 2
+    COUNTERCLOCKWISE = 3
+
+    def __init__(self, start = (0.0, 0.0, 0.0)):
+        self.start   = start
+        self.kinds   = array('b')           #the kind of each move
+        self.lines   = array('L')           #the gcode line of each move
+        self.ends    = array('d')           #x, y, z of the end of each move
+        self.centers = array('d')           #x, y of the center of each arc, 0 for other moves
+        self.feeds   = array('d')           #the feed rate of each move in millimeters per minute
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def append(self, kind, line, x, y, z, centerX, centerY, feed):
+        self.kinds.append(kind)
+        self.lines.append(line)
+        self.ends.extend((x, y, z))
+        self.centers.extend((centerX, centerY))
+        self.feeds.append(feed)
+
+    def startOf(self, index):
+        '''
+
+        The x, y, z position a move starts from.
+
+        '''
+        if index == 0:
+            return self.start
+        return self.endOf(index - 1)
+
+    def endOf(self, index):
+        return (self.ends[3*index], self.ends[3*index + 1], self.ends[3*index + 2])
+
+    def centerOf(self, index):
+        return (self.centers[2*index], self.centers[2*index + 1])
+
+    def firstMoveOf(self, line):
+        '''
+
+        The index of the first move made by line or any line after it.
+
+        '''
+        return bisect_left(self.lines, line)
+
+    def truncate(self, count):
+        '''
+
+        Remove every move after the first count.
+
+        '''
+        del self.kinds[count:]
+        del self.lines[count:]
+        del self.ends[3*count:]
+        del self.centers[2*count:]
+        del self.feeds[count:]
+
+
+class GcodeInterpreter(object):
+    '''
+
+    GcodeInterpreter runs through a GcodeProgram a number of lines at a time, adding the moves it
+    makes to its toolpath.
+
+    The state of the interpreter is recorded at the start of each run so that, if the program is
+    changed, it can carry on from before the change instead of starting again.
+
+    '''
+
+    scales = {'MM':1, 'INCHES':25.4}
+
+    def __init__(self, gcode, units = 'MM'):
+        '''
+
+        gcode is the program to interpret, which should not be shifted. units are the units the
+        program is in until it sets them.
+
+        '''
+        self.gcode       = gcode
+        self.startUnits  = units
+        self.toolpath    = Toolpath()
+        self.checkpoints = []               #(line number, number of moves, state) at the start of each run
+        self._reset()
+
+    def _reset(self):
+        self.lineNumber = 0                 #the next line to interpret
+        self.x          = 0.0
+        self.y          = 0.0
+        self.z          = 0.0
+        self.feed       = 0.0
+        self.motion     = 0                 #the command used by lines which do not start with a G word, a rapid until one is given
+        self.relative   = False
+        self.units      = self.startUnits
+
+    def state(self):
+        return (self.x, self.y, self.z, self.feed, self.motion, self.relative, self.units)
+
+    def isFinished(self):
+        return self.lineNumber >= len(self.gcode)
+
+    def advance(self, lineNumber):
+        '''
+
+        Interpret the program up to, but not including, lineNumber.
+
+        '''
+        lineNumber = min(lineNumber, len(self.gcode))
+        if lineNumber <= self.lineNumber:
+            return
+
+        if not self.checkpoints or self.checkpoints[-1][0] < self.lineNumber:
+            self.checkpoints.append((self.lineNumber, len(self.toolpath), self.state()))
+
+        for index in xrange(self.lineNumber, lineNumber):
+            for code, mask, values in self.gcode.commands(index):
+                self._interpretCommand(index, code, mask, values)
+        self.lineNumber = lineNumber
+
+    def finish(self):
+        '''
+
+        Interpret the rest of the program and return the toolpath.
+
+        '''
+        self.advance(len(self.gcode))
+        return self.toolpath
+
+    def restart(self, gcode, lineNumber):
+        '''
+
+        Replace the program with gcode, which is the same as the old one before lineNumber. The
+        moves from the last recorded state before lineNumber on are removed and the line to carry
+        on from is returned.
+
+        '''
+        self.gcode = gcode
+
+        index = bisect_right([checkpoint[0] for checkpoint in self.checkpoints], lineNumber) - 1
+        if index < 0:
+            self.checkpoints = []
+            self.toolpath.truncate(0)
+            self._reset()
+            return 0
+
+        line, moveCount, state = self.checkpoints[index]
+        del self.checkpoints[index:]
+        self.toolpath.truncate(moveCount)
+        self.x, self.y, self.z, self.feed, self.motion, self.relative, self.units = state
+        self.lineNumber = line
+        return line
+
+    def _interpretCommand(self, index, code, mask, values):
+        if code in (0, 1, 2, 3, 17):
+            self.motion = code
+
+        if code == GcodeProgram.MODAL: #this adds the gcode operator if it is omitted by the program
+            code = self.motion
+
+        if code in (0, 1, 2, 3):
+            self._move(index, code, mask, values)
+
+        if code == 18:
+            print "G18 not supported"
+
+        if code == 20:
+            self.units = 'INCHES'
+
+        if code == 21:
+            self.units = 'MM'
+
+        if code == 90:
+            self.relative = False
+
+        if code == 91:
+            self.relative = True
+
+    def _move(self, index, code, mask, values):
+        scale = self.scales[self.units]
+
+        xTarget = self.x
+        yTarget = self.y
+        zTarget = self.z
+        if mask & GcodeProgram.X:
+            xTarget = values[0]*scale + (self.x if self.relative else 0)
+        if mask & GcodeProgram.Y:
+            yTarget = values[1]*scale + (self.y if self.relative else 0)
+        if mask & GcodeProgram.Z:
+            zTarget = values[2]*scale + (self.z if self.relative else 0)
+
+        centerX = centerY = 0.0
+        if code in (2, 3):
+            centerX = self.x + (values[3]*scale if mask & GcodeProgram.I else 0)
+            centerY = self.y + (values[4]*scale if mask & GcodeProgram.J else 0)
+
+        feed = self.feed
+        if mask & GcodeProgram.F:
+            feed = values[5]*scale
+
+        if math.isnan(xTarget + yTarget + zTarget + centerX + centerY + feed):
+            print "Unable to interpret line: " + self.gcode[index]
+            return
+
+        self.toolpath.append(code, index, xTarget, yTarget, zTarget, centerX, centerY, feed)
+        self.x    = xTarget
+        self.y    = yTarget
+        self.z    = zTarget
+        self.feed = feed
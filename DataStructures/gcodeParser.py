@@ -0,0 +1,442 @@
+'''
+
+This module provides a single pass parser which turns the raw text of a gcode file into the program
+of normalized lines used by the rest of the program, indexing the z-axis moves as it goes.
+
+The output is identical to the older chain of whole-file regular expressions which it replaces, but
+the file is streamed through in blocks so only one block of text and the finished program are ever
+held in memory. Between blocks the parser reports its progress and checks whether it has been
+cancelled, which allows it to be run in a separate thread.
+
+'''
+
+from DataStructures.gcodeProgram             import GcodeProgram, MappedGcodeProgram
+from StringIO                                import StringIO
+from array                                   import array
+import hashlib
+import os
+import re
+
+
+class GcodeParser(object):
+    '''
+
+    GcodeParser strips comments, normalizes whitespace, optionally truncates long floating point
+    numbers and records the indices of z-axis moves in a single pass over a gcode file.
+
+    '''
+
+    blockSize          = 1 << 20                                        #number of characters read at a time
+    mappedBlockSize    = 1 << 16                                        #smallest block a mapped file is indexed in
+
+    comment            = re.compile(r'\([^)]*\)')                       #mach3 style gcode comments
+    semicolonComment   = re.compile(r';[^\n]*\n')                       #standard ; initiated gcode comments
+    commandAfterNumber = re.compile(r'([0-9])([GXYZIJFTM]) *')          #a command with no space before it
+    spaceRun           = re.compile(r'  +')                             #runs of spaces
+    zValue             = re.compile(r'[+-]?[0-9]*(?:\.[0-9]+)?')        #the number following a Z
+
+    def __init__(self, truncate = False, digits = 4, tolerance = 0.5):
+        '''
+
+        truncate and digits mirror the 'Advanced Settings' of the same names. tolerance is the
+        smallest change in z height which is recorded as a z-axis move.
+
+        '''
+        self.truncate  = bool(int(truncate))
+        self.digits    = int(digits)
+        self.tolerance = tolerance
+        self.cancelled = False
+
+        if self.truncate:
+            if self.digits < 1:
+                raise ValueError("Cannot truncate floating point numbers to " + str(digits) + " digits")
+            self.longFloat = re.compile(r'(?<=\.\d{' + str(self.digits) + r'})\d+')
+
+    def cancel(self):
+        '''
+
+        Stop a parse which is in progress in another thread. The parse stops at the end of the
+        block it is working on and returns what it has read so far.
+
+        '''
+        self.cancelled = True
+
+    def parseFile(self, filename, progress = None):
+        '''
+
+        Parse the gcode file at filename. Returns a tuple of the GcodeProgram of normalized lines
+        and the list of z-axis move indices.
+
+        If given, progress is called after each block with the fraction of the file read so far.
+
+        The program's source records the blocks it was read in so that reparseFile can later read
+        only the parts of the file which have changed.
+
+        '''
+        with open(filename, 'r') as gcodeFile:
+            fileStatus = os.fstat(gcodeFile.fileno())
+            source     = GcodeSource(filename, self, fileStatus)
+            if progress is None or fileStatus.st_size == 0:
+                return self.parse(gcodeFile, None, source)
+            return self.parse(gcodeFile, lambda charactersRead: progress(min(float(charactersRead)/fileStatus.st_size, 1.0)), source)
+
+    def parse(self, gcodeFile, progress = None, source = None):
+        '''
+
+        Parse an open gcode file (or anything else with a read method). Returns a tuple of the
+        GcodeProgram of normalized lines and the list of z-axis move indices.
+
+        If given, progress is called after each block with the number of characters read so far,
+        and the blocks are recorded in source.
+
+        '''
+        gcode     = GcodeProgram()
+        zMoves    = [0]
+        previousZ = None
+
+        for block, lines, isLastBlock in self._normalizedBlocks(gcodeFile, self.blockSize, progress):
+            if source is not None:
+                source.addBlock(block, len(gcode), len(zMoves), previousZ)
+            previousZ = self._findZMoves(lines, len(gcode), zMoves, previousZ)
+            gcode.extend(lines)
+
+        gcode.source = source
+        return gcode, zMoves
+
+    def mapFile(self, filename, progress = None):
+        '''
+
+        Index the gcode file at filename without keeping its text. Returns a tuple of a
+        MappedGcodeProgram, which normalizes its lines from the memory mapped file as they are
+        used, and the list of z-axis move indices.
+
+        If given, progress is called after each block with the fraction of the file read so far.
+
+        '''
+        gcode        = MappedGcodeProgram(filename, self)
+        gcode.source = GcodeSource(filename, self, os.stat(filename))
+        zMoves       = [0]
+        fileSize     = len(gcode.mapped)
+        if fileSize == 0:
+            gcode.addBlock(0, 0, 1, True)                           #an empty file is a single blank line
+            return gcode, zMoves
+
+        reportProgress = None
+        if progress is not None:
+            reportProgress = lambda charactersRead: progress(float(charactersRead)/fileSize)
+
+        start     = 0
+        previousZ = None
+        for block, lines, isLastBlock in self._normalizedBlocks(gcode.mapped, self.mappedBlockSize, reportProgress):
+            previousZ = self._findZMoves(lines, len(gcode), zMoves, previousZ)
+            gcode.addBlock(start, start + len(block), len(lines), isLastBlock)
+            start = start + len(block)
+
+        return gcode, zMoves
+
+    def reparseFile(self, filename, gcode, zMoves, progress = None):
+        '''
+
+        Read the gcode file at filename again, given the program and z-axis move indices it was
+        last read into. Returns a tuple of the new program, its z-axis move indices and the index of
+        the first line which changed, which is None if the file has not changed at all.
+
+        Only the blocks of the file which changed are parsed again; the lines before and after them
+        are copied from the old program. Files which were memory mapped, or read with different
+        settings, are read in full.
+
+        '''
+        source = getattr(gcode, 'source', None)
+        if source is None or not source.matches(filename, self):
+            return self.parseFile(filename, progress) + (0,)
+
+        with open(filename, 'r') as gcodeFile:
+            fileStatus = os.fstat(gcodeFile.fileno())
+            if source.unchanged(fileStatus):
+                return gcode, zMoves, None
+
+            if isinstance(gcode, MappedGcodeProgram) or len(source.blockStarts) == 0:
+                return self.mapOrParseFile(filename, gcode, progress) + (0,)
+
+            text = gcodeFile.read()
+
+        #find the blocks at the start and end of the file which are unchanged
+        blockCount = len(source.blockStarts)
+        first      = 0
+        while first < blockCount - 1 and source.blockMatches(first, text, 0):
+            first = first + 1
+        while first > 0 and text[source.blockStarts[first]:source.blockStarts[first] + 1] in ('\n', '(', ';'):
+            first = first - 1                                       #the change moved where the block can start
+
+        offset = len(text) - source.length                          #how far the end of the file has moved
+        last   = blockCount
+        while last > first and source.blockStarts[last - 1] + offset >= source.blockStarts[first] and source.blockMatches(last - 1, text, offset):
+            last = last - 1
+
+        if last == first and offset == 0:
+            source.modified = fileStatus.st_mtime
+            return gcode, zMoves, None                              #only the modification time changed
+
+        middleStart = source.blockStarts[first]
+        while last < blockCount and not self._cleanCut(text, middleStart, source.blockStarts[last] + offset):
+            last = last + 1                                         #the change runs on into the next block
+        if last < blockCount:
+            middleEnd = source.blockStarts[last] + offset
+        else:
+            middleEnd = len(text)
+
+        #copy the unchanged lines at the start
+        newSource         = GcodeSource(filename, self, fileStatus)
+        firstChangedLine  = source.firstLines[first]
+        newGcode          = GcodeProgram()
+        newGcode.text     = gcode.text[:gcode.lineStarts[firstChangedLine]]
+        newGcode.lineStarts = gcode.lineStarts[:firstChangedLine + 1]
+        newZMoves         = zMoves[:source.zMoveCounts[first]]
+        previousZ         = source.previousZs[first]
+        newSource.copyBlocks(source, 0, first, 0, 0, 0)
+
+        #parse the lines which changed
+        middle = self._normalizedBlocks(StringIO(text[middleStart:middleEnd]), self.blockSize, None)
+        for block, lines, isLastBlock in middle:
+            if isLastBlock and last < blockCount:
+                lines.pop()                                         #the rest of the file follows
+            newSource.addBlock(block, len(newGcode), len(newZMoves), previousZ)
+            previousZ = self._findZMoves(lines, len(newGcode), newZMoves, previousZ)
+            newGcode.extend(lines)
+
+        #copy the unchanged lines at the end
+        if last < blockCount:
+            oldStart  = source.firstLines[last]
+            lineShift = len(newGcode) - oldStart
+            textShift = len(newGcode.text) - gcode.lineStarts[oldStart]
+            newGcode.text.extend(gcode.text[gcode.lineStarts[oldStart]:])
+            newGcode.lineStarts.extend(array('L', [lineStart + textShift for lineStart in gcode.lineStarts[oldStart + 1:]]))
+
+            if previousZ == source.previousZs[last]:
+                zMoveShift = len(newZMoves) - source.zMoveCounts[last]
+                newZMoves.extend(zMove + lineShift for zMove in zMoves[source.zMoveCounts[last]:])
+                newSource.copyBlocks(source, last, blockCount, offset, lineShift, zMoveShift)
+            else:
+                for block in xrange(last, blockCount):          #the z height going into the end changed
+                    blockEnd = len(newGcode)
+                    if block + 1 < blockCount:
+                        blockEnd = source.firstLines[block + 1] + lineShift
+                    newSource.copyBlocks(source, block, block + 1, offset, lineShift, 0)
+                    newSource.zMoveCounts[-1] = len(newZMoves)
+                    newSource.previousZs[-1]  = previousZ
+                    previousZ = self._findZMoves(newGcode[source.firstLines[block] + lineShift:blockEnd], source.firstLines[block] + lineShift, newZMoves, previousZ)
+
+        newGcode.source = newSource
+        return newGcode, newZMoves, firstChangedLine
+
+    def mapOrParseFile(self, filename, gcode, progress = None):
+        '''
+
+        Read a file in full the same way as gcode was read, either memory mapped or parsed.
+
+        '''
+        if isinstance(gcode, MappedGcodeProgram):
+            return self.mapFile(filename, progress)
+        return self.parseFile(filename, progress)
+
+    def _cleanCut(self, text, start, cut):
+        '''
+
+        True if text can be split at cut without changing how it is normalized, given that it can
+        be split at start.
+
+        '''
+        if text[cut - 1:cut] != '\n' or text[cut:cut + 1] in ('\n', '(', ';'):
+            return False
+        return text.rfind('(', start, cut) <= text.rfind(')', start, cut)
+
+    def _findZMoves(self, lines, firstIndex, zMoves, previousZ):
+        '''
+
+        Append the indices of the z-axis moves in lines, the first of which is line firstIndex of
+        the program, to zMoves. previousZ is the last z height before lines. Returns the last z
+        height in lines.
+
+        '''
+        for index, line in enumerate(lines, firstIndex):
+            if 'Z' in line:
+                z = line.find('Z')
+                if z == len(line) - 1:
+                    continue
+                currentZ = self.zValue.match(line, z + 1).group()
+                if previousZ is None:
+                    zMoves.append(index)
+                elif abs(float(currentZ) - float(previousZ)) > self.tolerance:
+                    zMoves.append(index - 1)
+                previousZ = currentZ
+
+        return previousZ
+
+    def _normalizedBlocks(self, gcodeFile, blockSize, progress):
+        '''
+
+        Yields each block of the file along with its normalized lines and whether it is the last
+        block.
+
+        '''
+        charactersRead = 0
+
+        for block, isLastBlock in self._blocks(gcodeFile, blockSize):
+            if self.cancelled:
+                return
+
+            charactersRead = charactersRead + len(block)
+            lines = self.normalizeBlock(block)
+            if not isLastBlock:
+                lines.pop()                                         #the block ends with a newline
+
+            yield block, lines, isLastBlock
+
+            if progress is not None and not isLastBlock:
+                progress(charactersRead)
+
+    def normalizeBlock(self, block):
+        '''
+
+        Remove the comments from a block of raw gcode, normalize its whitespace and split it into
+        lines.
+
+        '''
+
+        block = self.comment.sub('\n', block)                       #replace mach3 style gcode comments with newline
+        block = self.semicolonComment.sub('\n', block)              #replace standard ; initiated gcode comments with newline
+        block = block.replace('\n\n', '\n')                         #removes blank lines
+        block = self.commandAfterNumber.sub('\\1 \\2', block)       #put spaces between gcodes
+        if '  ' in block:
+            block = self.spaceRun.sub(' ', block)                   #condense space runs
+        if self.truncate:
+            block = self.longFloat.sub('', block)                   #truncates long floats, leaves shorter floats
+
+        block = block.replace('\n', ' \n') + ' '                    #adds a space to the end of each line
+        for axis in 'XYZIJF':
+            block = block.replace(axis + ' ', axis)
+
+        return [line.lstrip() for line in block.split('\n')]
+
+    def _blocks(self, gcodeFile, blockSize):
+        '''
+
+        Yields the file in blocks which can each be normalized on their own, along with whether
+        each block is the last one.
+
+        '''
+
+        text = ''
+        while True:
+            chunk = gcodeFile.read(blockSize)
+            if not chunk:
+                yield text, True
+                return
+
+            text = text + chunk
+            cut  = self._safeCut(text)
+            if cut > 0:
+                yield text[:cut], False
+                text = text[cut:]
+
+    def _safeCut(self, text):
+        '''
+
+        Find the last point in text where it can be split without changing how it is normalized.
+        This is just after a newline which is outside of any comment and which is followed by a line
+        that is not blank once its comments are removed. Returns 0 if there is no such point.
+
+        '''
+
+        end = len(text)
+        while True:
+            newline = text.rfind('\n', 0, end)
+            if newline == -1:
+                return 0
+
+            cut = newline + 1
+            if cut < len(text) and text[cut] not in '\n(;':
+                opened = text.rfind('(', 0, cut)
+                if opened <= text.rfind(')', 0, cut):
+                    return cut
+                end = opened                                        #a comment is still open, cut before it
+            else:
+                end = newline
+
+
+class GcodeSource(object):
+    '''
+
+    GcodeSource records the file a GcodeProgram was read from, the settings it was read with and,
+    for each block the file was read in: where the block starts, the program line it starts on, the
+    number of z-axis moves and the z height before it and a hash of its text. This is enough to
+    tell which parts of the file have changed and to read only those again.
+
+    '''
+
+    def __init__(self, filename, parser, fileStatus):
+        self.filename    = os.path.abspath(filename)
+        self.settings    = (parser.truncate, parser.digits, parser.tolerance)
+        self.modified    = fileStatus.st_mtime
+        self.size        = fileStatus.st_size
+        self.length      = 0                    #the number of characters read from the file
+
+        self.blockStarts = array('L')
+        self.firstLines  = array('L')
+        self.zMoveCounts = array('L')
+        self.previousZs  = []
+        self.hashes      = []
+
+    def matches(self, filename, parser):
+        '''
+
+        True if filename is the file this source describes and parser has the same settings.
+
+        '''
+        return self.filename == os.path.abspath(filename) and self.settings == (parser.truncate, parser.digits, parser.tolerance)
+
+    def unchanged(self, fileStatus):
+        return self.modified == fileStatus.st_mtime and self.size == fileStatus.st_size
+
+    def addBlock(self, block, firstLine, zMoveCount, previousZ):
+        self.blockStarts.append(self.length)
+        self.firstLines.append(firstLine)
+        self.zMoveCounts.append(zMoveCount)
+        self.previousZs.append(previousZ)
+        self.hashes.append(hashlib.sha1(block).digest())
+        self.length = self.length + len(block)
+
+    def copyBlocks(self, source, first, last, offset, lineShift, zMoveShift):
+        '''
+
+        Add blocks first to last of another source, moved by offset characters, lineShift lines and
+        zMoveShift z-axis moves.
+
+        '''
+        for block in xrange(first, last):
+            self.blockStarts.append(source.blockStarts[block] + offset)
+            self.firstLines.append(source.firstLines[block] + lineShift)
+            self.zMoveCounts.append(source.zMoveCounts[block] + zMoveShift)
+            self.previousZs.append(source.previousZs[block])
+            self.hashes.append(source.hashes[block])
+        if last > first:
+            self.length = source.blockStarts[last - 1] + offset + source.blockLength(last - 1)
+
+    def blockLength(self, block):
+        '''
+
+        The number of characters in a block.
+
+        '''
+        if block + 1 < len(self.blockStarts):
+            return self.blockStarts[block + 1] - self.blockStarts[block]
+        return self.length - self.blockStarts[block]
+
+    def blockMatches(self, block, text, offset):
+        '''
+
+        True if the text of a block, moved by offset characters, is unchanged in text.
+
+        '''
+        start = self.blockStarts[block] + offset
+        return start >= 0 and hashlib.sha1(text[start:start + self.blockLength(block)]).digest() == self.hashes[block]
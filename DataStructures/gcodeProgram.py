@@ -0,0 +1,475 @@
+'''
+
+This module provides a compact representation of a gcode program.
+
+The normalized text of every line is kept back to back in a single buffer rather than as one string
+object per line. Each line is also read into typed columns the first time it is needed so that
+drawing the program, seeking through it and reading positions out of it are numeric operations
+rather than regular expression searches on a string.
+
+For very large files a MappedGcodeProgram keeps only an index into the memory mapped file and
+normalizes the text of its lines when they are asked for, so its memory use does not grow with the
+size of the file.
+
+'''
+
+from array                                   import array
+from bisect                                  import bisect_left, bisect_right
+from collections                             import OrderedDict
+import copy
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+
+class GcodeProgram(object):
+    '''
+
+    GcodeProgram behaves like the list of lines of gcode which it replaces: it can be indexed,
+    iterated over and has a length, and indexing it reconstructs the text of that line.
+
+    Each line is also split into commands the same way the gcode canvas draws them, where every 'G'
+    starts a new command. For each command the program stores the command code, a bitmask of which
+    of the X, Y, Z, I, J and F words are present, and the value of each. A value which is present
+    but can not be read is stored as NaN.
+
+    The columns are filled in a page of lines at a time, the first time any line in the page is
+    asked for. Only the pages used most recently are kept, since a page can be read again from the
+    text and the moves of the whole program are kept in its Toolpath once it has been interpreted.
+
+    '''
+
+    pageSize    = 1024
+    cachedPages = 16                        #the most pages of columns to keep, None for no limit
+
+    #bits of the presence mask
+    X = 1
+    Y = 2
+    Z = 4
+    I = 8
+    J = 16
+    F = 32
+    axes = {'X':(0, X), 'Y':(1, Y), 'Z':(2, Z), 'I':(3, I), 'J':(4, J), 'F':(5, F)}
+
+    #command codes which are not a G number
+    MODAL = -1      #the command has no G word and continues the previous one
+    OTHER = -2      #a G word which is not drawn
+
+    codes = {'G00':0, 'G0 ':0, 'G01':1, 'G1 ':1, 'G02':2, 'G2 ':2, 'G03':3, 'G3 ':3,
+             'G17':17, 'G18':18, 'G20':20, 'G21':21, 'G90':90, 'G91':91}
+
+    word          = re.compile(r'([XYZIJF])( *[+-]?[0-9]*(?:\.[0-9]+)?)')
+    shiftableWord = re.compile(r'([XYxy])([+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+))')
+    distanceMode  = re.compile(r'[Gg]9([01])')                             #G90 or G91, read the same way as the command codes
+
+    shift       = (0.0, 0.0)                #the amount the origin of the program has been moved by
+    shiftDigits = 0
+    original    = None                      #the unshifted program a shifted one was made from
+    modeLines   = None                      #the lines of a shifted program which change between G90 and G91
+    modesAfter  = None                      #whether each of those lines leaves the program relative
+
+    def __init__(self, lines = ()):
+        self.text       = bytearray()           #the text of every line, back to back
+        self.lineStarts = array('L', [0])       #offset of the start of each line in text
+        self.edited     = {}                    #lines which have been replaced since they were added
+        self.pages      = OrderedDict()         #the columns of each page which has been read
+
+        self.extend(lines)
+
+    def __len__(self):
+        return len(self.lineStarts) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+
+        index = self._checkIndex(index)
+        line  = self._text(index)
+        if self.shift != (0.0, 0.0):
+            return self._shiftLine(index, line)
+        return line
+
+    def __setitem__(self, index, line):
+        '''
+
+        Replace the text of a line, re-reading its commands if they have already been read.
+
+        '''
+        index = self._checkIndex(index)
+        self.edited[index] = line
+
+        number = index // self.pageSize
+        if number in self.pages:
+            self._storeLine(self.pages[number], index - number*self.pageSize, self._parseLine(line))
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def append(self, line):
+        self.extend((line,))
+
+    def extend(self, lines):
+        '''
+
+        Add lines of normalized gcode to the end of the program.
+
+        '''
+        self.pages.pop(len(self) // self.pageSize, None)        #the last page is about to grow
+
+        text       = self.text
+        lineStarts = self.lineStarts
+        for line in lines:
+            text.extend(line)
+            lineStarts.append(len(text))
+
+    def shifted(self, x, y):
+        '''
+
+        A copy of the program with its origin moved by x and y. The copy shares the text and columns
+        of the original; the shift is added to the X and Y values as they are read, and to the text
+        of a line when it is asked for. Values on lines in relative mode (G91) are moves rather than
+        positions, so they are left as they are.
+
+        '''
+        program = copy.copy(self)
+        program.shift    = (float(x), float(y))
+        program.original = self.unshifted()
+        if program.shift != (0.0, 0.0):
+            program.modeLines, program.modesAfter = program.original._distanceModes()
+
+        #the shift is rounded to shiftDigits places, which a shifted number keeps along with the places it had
+        program.shiftDigits = max(len(('%.4f' % shift).rstrip('0').split('.')[1]) for shift in program.shift)
+        return program
+
+    def unshifted(self):
+        '''
+
+        The program this one was shifted from, or this program if it has not been shifted.
+
+        '''
+        if self.original is not None:
+            return self.original
+        return self
+
+    def commands(self, index):
+        '''
+
+        The commands in a line as a list of (code, mask, values) tuples, where values holds the X, Y,
+        Z, I, J and F values in that order.
+
+        '''
+        page, row = self._page(self._checkIndex(index))
+        codes, masks, values, extraCommands = page
+
+        commands = [(codes[row], masks[row], values[6*row:6*row+6])]
+        if row in extraCommands:
+            commands.extend(extraCommands[row])
+
+        if self.shift != (0.0, 0.0):
+            relative = self._relativeBefore(index)
+            shifted  = []
+            for code, mask, values in commands:
+                if code == 90 or code == 91:
+                    relative = code == 91
+                shifted.append((code, mask, values if relative else self._shiftValues(mask, values)))
+            commands = shifted
+        return commands
+
+    def lineValue(self, index, letter):
+        '''
+
+        The value of the first letter ('X', 'Y', 'Z', 'I', 'J' or 'F') word in a line, or None if
+        the line does not have one.
+
+        '''
+        axis, bit = self.axes[letter]
+        for code, mask, values in self.commands(index):
+            if mask & bit:
+                return values[axis]
+        return None
+
+    def _text(self, index):
+        '''
+
+        The unshifted text of a line.
+
+        '''
+        if index in self.edited:
+            return self.edited[index]
+        return str(self.text[self.lineStarts[index]:self.lineStarts[index+1]])
+
+    def _distanceModes(self):
+        '''
+
+        Find the lines which switch between absolute (G90) and relative (G91) positioning. Returns
+        an array of the line indices and an array of whether each leaves the program relative.
+
+        '''
+        modes = {}
+        for mode in self.distanceMode.finditer(self.text):
+            modes[bisect_right(self.lineStarts, mode.start()) - 1] = mode.group(1) == '1'
+        for index, line in self.edited.items():
+            modes.pop(index, None)
+            self._lineModes(index, line, modes)
+        return self._modeArrays(modes)
+
+    def _lineModes(self, index, line, modes):
+        if '9' in line:
+            found = self.distanceMode.findall(line)
+            if found:
+                modes[index] = found[-1] == '1'
+
+    def _modeArrays(self, modes):
+        modeLines = array('L', sorted(modes))
+        return modeLines, array('b', [modes[index] for index in modeLines])
+
+    def _relativeBefore(self, index):
+        '''
+
+        True if the program is in relative mode at the start of a line.
+
+        '''
+        change = bisect_left(self.modeLines, index) - 1
+        return change >= 0 and bool(self.modesAfter[change])
+
+    def _shiftLine(self, index, line):
+        '''
+
+        The text of a line with the shift added to the X and Y words which are positions, that is
+        those which are not in relative mode.
+
+        '''
+        relative = self._relativeBefore(index)
+        if '9' not in line or not self.distanceMode.search(line):
+            if relative:
+                return line
+            return self.shiftableWord.sub(self._shiftWord, line)
+
+        #the mode changes part way through the line
+        pieces = []
+        start  = 0
+        for mode in self.distanceMode.finditer(line):
+            piece = line[start:mode.start()]
+            pieces.append(piece if relative else self.shiftableWord.sub(self._shiftWord, piece))
+            relative = mode.group(1) == '1'
+            start    = mode.start()
+        piece = line[start:]
+        pieces.append(piece if relative else self.shiftableWord.sub(self._shiftWord, piece))
+        return ''.join(pieces)
+
+    def _shiftValues(self, mask, values):
+        values = array('d', values)
+        if mask & self.X:
+            values[0] = values[0] + self.shift[0]
+        if mask & self.Y:
+            values[1] = values[1] + self.shift[1]
+        return values
+
+    def _shiftWord(self, match):
+        '''
+
+        The text of an X or Y word moved by the shift, keeping at least as many decimal places as
+        it had.
+
+        '''
+        letter, number = match.groups()
+        if letter in 'Xx':
+            value = float(number) + self.shift[0]
+        else:
+            value = float(number) + self.shift[1]
+
+        places = 0
+        if '.' in number:
+            places = len(number) - number.index('.') - 1
+        number = '%.*f' % (max(places, self.shiftDigits), value)
+        if number[0] == '-' and float(number) == 0:
+            number = number[1:]                                 #no negative zero
+        return letter + number
+
+    def _checkIndex(self, index):
+        length = len(self)
+        if index < 0:
+            index = index + length
+        if index < 0 or index >= length:
+            raise IndexError("gcode line index out of range")
+        return index
+
+    def _page(self, index):
+        '''
+
+        Returns the page holding a line, reading it first if needed, and the row of the line in it.
+
+        '''
+        number = index // self.pageSize
+        page   = self.pages.get(number)
+        if page is None:
+            start = number*self.pageSize
+            end   = min(start + self.pageSize, len(self))
+
+            page = (array('b', [0])*(end - start), array('B', [0])*(end - start), array('d', [0.0])*(6*(end - start)), {})
+            for row in xrange(end - start):
+                self._storeLine(page, row, self._parseLine(self._text(start + row)))
+            self.pages[number] = page
+            if self.cachedPages is not None and len(self.pages) > self.cachedPages:
+                self.pages.popitem(last = False)
+
+        return page, index - number*self.pageSize
+
+    def _storeLine(self, page, row, commands):
+        codes, masks, values, extraCommands = page
+
+        code, mask, lineValues = commands[0]
+        codes[row] = code
+        masks[row] = mask
+        values[6*row:6*row+6] = array('d', lineValues)
+
+        if len(commands) > 1:
+            extraCommands[row] = commands[1:]
+        else:
+            extraCommands.pop(row, None)
+
+    def _parseLine(self, line):
+        '''
+
+        Split a line into the commands the gcode canvas would draw and read each one. Returns a list
+        of (code, mask, values) tuples.
+
+        '''
+
+        line = line.upper() + ' '
+        if 'G' in line:
+            commands = ['G' + piece + ' ' for piece in line.split('G') if len(piece) > 0]
+        else:
+            commands = [line]
+
+        parsed = []
+        for command in commands:
+            if command[0] == 'G':
+                code = self.codes.get(command[:3], self.OTHER)
+            else:
+                code = self.MODAL
+
+            mask   = 0
+            values = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+            for letter, number in self.word.findall(command):
+                axis, bit = self.axes[letter]
+                if mask & bit:
+                    continue                                    #only the first of each word is used
+                mask = mask | bit
+                try:
+                    values[axis] = float(number)
+                except ValueError:
+                    values[axis] = float('nan')
+            parsed.append((code, mask, values))
+
+        return parsed
+
+
+class MappedGcodeProgram(GcodeProgram):
+    '''
+
+    MappedGcodeProgram is a GcodeProgram which reads its lines from a memory mapped gcode file.
+
+    The file is copied to a temporary file which is mapped instead, so that the program being run
+    is not changed or cut short, and the mapping does not lock the file, when the file is written
+    again while the machine is cutting.
+
+    The file is split into blocks which can each be normalized on their own. Only the position of
+    each block in the file and the number of its first line are stored; the lines of a block are
+    normalized the first time one of them is asked for, and only a few blocks and pages of columns
+    are kept at a time.
+
+    '''
+
+    cachedBlocks  = 4
+    copyDirectory = os.path.join(os.path.expanduser('~'), '.groundcontrol', 'mappedGcode')     #where the copy of the file is kept, next to the gcode cache
+
+    def __init__(self, filename, parser):
+        '''
+
+        Copy and map the file at filename. parser is the GcodeParser used to normalize each block,
+        which adds the blocks with addBlock.
+
+        '''
+        self.edited      = {}
+        self.pages       = OrderedDict()
+        self.parser      = parser
+        self.blockStarts = array('L')           #offset of the start of each block in the file
+        self.blockEnds   = array('L')           #offset of the end of each block in the file
+        self.firstLines  = array('L')           #index of the first line of each block
+        self.lastBlock   = -1                   #the block which ends the file and keeps its last line
+        self.lineCount   = 0
+        self.blocks      = OrderedDict()        #the lines of the blocks which have been normalized
+        self.blockLock   = threading.Lock()     #lines are read by both the UI and the serial thread
+
+        try:
+            if not os.path.isdir(self.copyDirectory):
+                os.makedirs(self.copyDirectory)
+            self.copy = tempfile.TemporaryFile(dir = self.copyDirectory)  #deleted once it is closed and unmapped
+        except (IOError, OSError):
+            self.copy = tempfile.TemporaryFile()
+        with open(filename, 'rb') as gcodeFile:
+            shutil.copyfileobj(gcodeFile, self.copy, 1 << 20)
+        self.copy.flush()
+        try:
+            self.mapped = mmap.mmap(self.copy.fileno(), 0, access = mmap.ACCESS_READ)
+        except ValueError:
+            self.mapped = ''                    #an empty file can not be mapped
+
+    def __len__(self):
+        return self.lineCount
+
+    def _text(self, index):
+        if index in self.edited:
+            return self.edited[index]
+
+        block = bisect_right(self.firstLines, index) - 1
+        return self._blockLines(block)[index - self.firstLines[block]]
+
+    def extend(self, lines):
+        raise TypeError("lines can not be added to a memory mapped gcode program")
+
+    def _distanceModes(self):
+        modes = {}
+        for index in xrange(len(self)):
+            self._lineModes(index, self._text(index), modes)
+        return self._modeArrays(modes)
+
+    def addBlock(self, start, end, lineCount, isLastBlock):
+        '''
+
+        Add the block of the file from start to end, which holds lineCount normalized lines.
+
+        '''
+        if lineCount == 0:
+            return
+
+        self.pages.pop(self.lineCount // self.pageSize, None)  #the last page is about to grow
+
+        if isLastBlock:
+            self.lastBlock = len(self.blockStarts)
+        self.blockStarts.append(start)
+        self.blockEnds.append(end)
+        self.firstLines.append(self.lineCount)
+        self.lineCount = self.lineCount + lineCount
+
+    def _blockLines(self, block):
+        '''
+
+        The normalized lines of a block, normalizing it first if needed.
+
+        '''
+        with self.blockLock:
+            lines = self.blocks.get(block)
+            if lines is None:
+                lines = self.parser.normalizeBlock(self.mapped[self.blockStarts[block]:self.blockEnds[block]])
+                if block != self.lastBlock:
+                    lines.pop()                 #the block ends with a newline
+                self.blocks[block] = lines
+                if len(self.blocks) > self.cachedBlocks:
+                    self.blocks.popitem(last = False)
+            return lines
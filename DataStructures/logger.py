@@ -6,15 +6,27 @@ behavior.
 '''
 
 from DataStructures.makesmithInitFuncs       import MakesmithInitFuncs
+from DataStructures.errorStatistics          import ErrorStatistics
+from DataStructures.telemetryLog             import TelemetryLog, waitUntilDone
+import atexit
+import os
+import Queue
 import threading
+import time
 
 
 class Logger(MakesmithInitFuncs):
     
-    errorValues = []
+    errorStatistics = ErrorStatistics()
     recordingPositionalErrors = False 
     
-    messageBuffer = ""
+    logQueue        = Queue.Queue(10000)    #messages waiting to be written, bounded so a stalled disk can't use up the memory
+    flushSize       = 4096                  #characters gathered before they are written
+    flushInterval   = 0.5                   #the longest a message waits before it is written, in seconds
+    flushTimeout    = 5.0                   #the longest flush waits for the writer, in seconds
+    droppedMessages = 0                     #messages thrown away because the queue was full
+    writer          = None                  #the thread which writes to the log file
+    writerLock      = threading.Lock()
     
     #clear the old log file
     with open("log.txt", "a") as logFile:
@@ -26,45 +38,99 @@ class Logger(MakesmithInitFuncs):
         Writes a message into the log
         
         Actual writing is done in a separate thread to no lock up the UI because file IO is 
-        way slow
+        way slow. Messages are written in the order they are logged.
         
         '''
         
-        try:
-            self.messageBuffer = self.messageBuffer + message
-        except:
-            pass
+        if self.writer is None:
+            self._startWriter()
         
-        if len(self.messageBuffer) > 500:
-            
-            t = threading.Thread(target=self.writeToFile, args=(self.messageBuffer, "write"))
-            t.daemon = True
-            t.start()
-            self.messageBuffer = ""
+        try:
+            self.logQueue.put_nowait(message)
+        except Queue.Full:
+            Logger.droppedMessages = Logger.droppedMessages + 1
     
-    def writeToFile(self, toWrite, *args):
+    def flush(self):
         '''
         
-        Write to the log file
+        Wait until every message logged so far has been written to the file, for at most
+        flushTimeout seconds.
         
+        '''
+        if self.writer is not None:
+            waitUntilDone(self.logQueue, self.writer, self.flushTimeout)
+    
+    def _startWriter(self):
+        with self.writerLock:
+            if Logger.writer is None:
+                Logger.writer = threading.Thread(target = self._writeLog)
+                Logger.writer.daemon = True
+                Logger.writer.start()
+                atexit.register(self.flush)
+    
+    def _writeLog(self):
         '''
         
-        with open("log.txt", "a") as logFile:
-            logFile.write(toWrite)
+        Runs in the writer thread, writing the messages from logQueue to the log file a batch at a
+        time. A batch is written once it reaches flushSize characters or its first message has
+        waited flushInterval seconds.
         
-        return
+        '''
         
-    def writeErrorValueToLog(self, error):
+        logFile   = None
+        batch     = []
+        batchSize = 0
+        deadline  = None                    #when the batch must be written
+        dropped   = 0
+        while True:
+            try:
+                if deadline is None:
+                    message = self.logQueue.get()
+                else:
+                    message = self.logQueue.get(True, max(deadline - time.time(), 0.001))
+                if not isinstance(message, basestring):
+                    try:
+                        message = str(message)
+                    except:
+                        message = repr(message)
+                batch.append(message)
+                batchSize = batchSize + len(message)
+                if deadline is None:
+                    deadline = time.time() + self.flushInterval
+            except Queue.Empty:
+                pass
+            
+            if batch and (batchSize >= self.flushSize or time.time() >= deadline):
+                messageCount = len(batch)
+                if self.droppedMessages != dropped:
+                    batch.append("\n[" + str(self.droppedMessages - dropped) + " log messages dropped]\n")
+                    dropped = self.droppedMessages
+                #the messages are marked done even if they can't be written, so flush never waits forever
+                try:
+                    if logFile is None:
+                        logFile = open("log.txt", "a")
+                    logFile.write(''.join(batch))
+                    logFile.flush()
+                except:
+                    print "Unable to write to log file"
+                for written in xrange(messageCount):
+                    self.logQueue.task_done()
+                batch     = []
+                batchSize = 0
+                deadline  = None
+        
+    def writeErrorValueToLog(self, error, x = None, y = None):
         '''
         
-        Writes an error value into the log.
+        Adds an error value, and the x, y position of the sled when it was reported, to the
+        positional error statistics. All are in millimeters.
         
         '''
         if self.recordingPositionalErrors:
-            self.errorValues.append(abs(error))
+            self.errorStatistics.add(error, x, y)
         
-        #if we've gotten to the end of the file
-        if self.data.gcodeIndex == len(self.data.gcode) and self.recordingPositionalErrors:
+        #if the program has finished or been stopped
+        if self.recordingPositionalErrors and not self.data.uploadFlag and self.data.gcodeIndex == 0:
             self.endRecordingAvgError()
             self.reportAvgError()
     
@@ -75,7 +141,7 @@ class Logger(MakesmithInitFuncs):
         
         '''
         self.recordingPositionalErrors = True
-        self.errorValues = []
+        self.errorStatistics.clear()
     
     def endRecordingAvgError(self):
         '''
@@ -89,12 +155,21 @@ class Logger(MakesmithInitFuncs):
     def reportAvgError(self):
         '''
         
-        Reports the average positional error since the recording began.
+        Reports the positional error statistics since the recording began, and saves them next to
+        the telemetry.
         
         '''
         
-        avg = sum(self.errorValues)/len(self.errorValues)
-        self.data.message_queue.put("Message: The average feedback system error was: " + "%.2f" % avg + "mm")
+        if self.errorStatistics.count == 0:
+            return
         
+        path = os.path.join(TelemetryLog.directory, 'positionalError-' + time.strftime('%Y%m%d-%H%M%S') + '.json')
+        try:
+            if not os.path.isdir(TelemetryLog.directory):
+                os.makedirs(TelemetryLog.directory)
+            self.errorStatistics.export(path)
+            saved = "\n\nThe statistics have been saved to " + path
+        except:
+            saved = "\n\nThe statistics could not be saved to " + path
         
-        #should popup message here
\ No newline at end of file
+        self.data.message_queue.put("Message: The average feedback system error was: " + "%.2f" % self.errorStatistics.mean + "mm\n\n" + self.errorStatistics.report() + saved)
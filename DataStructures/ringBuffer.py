@@ -0,0 +1,78 @@
+'''
+
+This module provides a list of fixed capacity which throws away its oldest items to make room for
+new ones, without moving the items it keeps.
+
+'''
+
+
+class RingBuffer(object):
+    '''
+
+    RingBuffer holds the last capacity items appended to it, oldest first. Appending and indexing
+    take the same time however many items are held.
+
+    Items are also numbered in the order they were appended, counting the ones which have been
+    thrown away, so that something showing part of the buffer can keep its place as it fills.
+
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = max(int(capacity), 1)
+        self.clear()
+
+    def clear(self):
+        self.items    = []
+        self.start    = 0                   #where the oldest item is in items once it is full
+        self.appended = 0                   #how many items have ever been appended
+
+    def __len__(self):
+        return len(self.items)
+
+    def append(self, item):
+        if len(self.items) < self.capacity:
+            self.items.append(item)
+        else:
+            self.items[self.start] = item
+            self.start = (self.start + 1) % self.capacity
+        self.appended = self.appended + 1
+
+    def __getitem__(self, index):
+        length = len(self.items)
+        if index < 0:
+            index = index + length
+        if not 0 <= index < length:
+            raise IndexError('RingBuffer index out of range')
+        return self.items[(self.start + index) % self.capacity]
+
+    def firstNumber(self):
+        '''
+
+        The number of the oldest item held.
+
+        '''
+        return self.appended - len(self.items)
+
+    def numbered(self, first, end):
+        '''
+
+        A list of the items numbered from first up to, but not including, end which are still held.
+
+        '''
+        first = max(first, self.firstNumber()) - self.firstNumber()
+        end   = min(end, self.appended) - self.firstNumber()
+        return [self[index] for index in xrange(first, end)]
+
+    def resize(self, capacity):
+        '''
+
+        Change the capacity, keeping as many of the newest items as fit.
+
+        '''
+        capacity = max(int(capacity), 1)
+        kept     = self.numbered(self.appended - capacity, self.appended)
+        appended = self.appended
+        self.capacity = capacity
+        self.items    = kept
+        self.start    = 0
+        self.appended = appended
@@ -0,0 +1,191 @@
+'''
+
+This module provides a spatial index over the line segments of a drawn toolpath so that the gcode
+line which cuts at a point can be found without searching every segment.
+
+'''
+
+from array                                   import array
+from bisect                                  import bisect_left
+import math
+
+
+class SegmentIndex(object):
+    '''
+
+    SegmentIndex files each segment under every cell of a uniform grid which it passes through. A
+    query only looks at the segments in the cells near the point asked about.
+
+    Segments are usually added in order of their gcode line, which allows the segments from a line
+    on to be removed quickly when the toolpath is redrawn from that line. If they are not, removing
+    them rebuilds the index.
+
+    '''
+
+    def __init__(self, cellSize = 10):
+        '''
+
+        cellSize is the width of a grid cell, in the same units as the segments.
+
+        '''
+        self.cellSize = float(cellSize)
+        self.ends     = array('d')          #xStart, yStart, xEnd, yEnd of each segment
+        self.lines    = array('L')          #the gcode line of each segment
+        self.cells    = {}                  #(column, row) to the segments passing through that cell
+        self.ordered  = True                #whether the segments were added in order of their line
+
+    def __len__(self):
+        return len(self.lines)
+
+    def add(self, xStart, yStart, xEnd, yEnd, line):
+        '''
+
+        Add the segment from (xStart, yStart) to (xEnd, yEnd) drawn by a line of gcode.
+
+        '''
+        segment = len(self.lines)
+        if segment and line < self.lines[-1]:
+            self.ordered = False
+        self.ends.extend((xStart, yStart, xEnd, yEnd))
+        self.lines.append(line)
+
+        cells = self.cells
+        for cell in self._cellsOnSegment(xStart, yStart, xEnd, yEnd):
+            segments = cells.get(cell)
+            if segments is None:
+                segments = cells[cell] = array('L')
+            segments.append(segment)
+
+    def addPolyline(self, points, line):
+        '''
+
+        Add the segments joining a flat list of x, y points drawn by a line of gcode.
+
+        '''
+        for index in xrange(0, len(points) - 2, 2):
+            self.add(points[index], points[index + 1], points[index + 2], points[index + 3], line)
+
+    def removeFrom(self, line):
+        '''
+
+        Remove the segments of line and every line after it.
+
+        '''
+        if not self.ordered:
+            self._rebuild(line)
+            return
+
+        count = bisect_left(self.lines, line)
+        if count == len(self.lines):
+            return
+
+        del self.ends[4*count:]
+        del self.lines[count:]
+        for cell in self.cells.keys():
+            segments = self.cells[cell]
+            while segments and segments[-1] >= count:      #segments are filed in the order they were added
+                segments.pop()
+            if not segments:
+                del self.cells[cell]
+
+    def _rebuild(self, line):
+        '''
+
+        Index the segments before line again, in order of their line.
+
+        '''
+        ends  = self.ends
+        lines = self.lines
+        kept  = sorted((lines[segment], segment) for segment in xrange(len(lines)) if lines[segment] < line)
+
+        self.ends    = array('d')
+        self.lines   = array('L')
+        self.cells   = {}
+        self.ordered = True
+        for segmentLine, segment in kept:
+            self.add(ends[4*segment], ends[4*segment + 1], ends[4*segment + 2], ends[4*segment + 3], segmentLine)
+
+    def nearest(self, x, y, maxDistance):
+        '''
+
+        The gcode line of the segment closest to (x, y) and its distance, or None if no segment is
+        within maxDistance. The earliest line wins a tie so that a job is resumed from the first
+        pass over a point.
+
+        '''
+        best    = None
+        seen    = set()
+        ends    = self.ends
+        columns = xrange(int(math.floor((x - maxDistance)/self.cellSize)), int(math.floor((x + maxDistance)/self.cellSize)) + 1)
+        rows    = xrange(int(math.floor((y - maxDistance)/self.cellSize)), int(math.floor((y + maxDistance)/self.cellSize)) + 1)
+        for column in columns:
+            for row in rows:
+                for segment in self.cells.get((column, row), ()):
+                    if segment in seen:
+                        continue
+                    seen.add(segment)
+
+                    distance = self._distance(x, y, ends[4*segment], ends[4*segment + 1], ends[4*segment + 2], ends[4*segment + 3])
+                    if distance > maxDistance:
+                        continue
+                    candidate = (distance, self.lines[segment])
+                    if best is None or candidate < best:
+                        best = candidate
+
+        if best is None:
+            return None
+        return best[1], best[0]
+
+    def _distance(self, x, y, xStart, yStart, xEnd, yEnd):
+        dx = xEnd - xStart
+        dy = yEnd - yStart
+        lengthSquared = dx*dx + dy*dy
+        if lengthSquared > 0:
+            along = max(0.0, min(1.0, ((x - xStart)*dx + (y - yStart)*dy)/lengthSquared))
+        else:
+            along = 0.0
+        return math.sqrt((x - xStart - along*dx)**2 + (y - yStart - along*dy)**2)
+
+    def _cellsOnSegment(self, xStart, yStart, xEnd, yEnd):
+        '''
+
+        The grid cells the segment passes through, walking from cell to cell along it.
+
+        '''
+        size   = self.cellSize
+        column = int(math.floor(xStart/size))
+        row    = int(math.floor(yStart/size))
+        lastColumn = int(math.floor(xEnd/size))
+        lastRow    = int(math.floor(yEnd/size))
+
+        cells = [(column, row)]
+        if column == lastColumn and row == lastRow:
+            return cells
+
+        dx = xEnd - xStart
+        dy = yEnd - yStart
+        columnStep = 1 if dx > 0 else -1
+        rowStep    = 1 if dy > 0 else -1
+
+        #the distance along the segment, as a fraction of its length, to the next column and row boundaries
+        if dx != 0:
+            nextColumn  = ((column + (columnStep > 0))*size - xStart)/dx
+            columnWidth = size/abs(dx)
+        else:
+            nextColumn  = columnWidth = float('inf')
+        if dy != 0:
+            nextRow   = ((row + (rowStep > 0))*size - yStart)/dy
+            rowHeight = size/abs(dy)
+        else:
+            nextRow   = rowHeight = float('inf')
+
+        for step in xrange(abs(lastColumn - column) + abs(lastRow - row)):
+            if nextColumn < nextRow:
+                column     = column + columnStep
+                nextColumn = nextColumn + columnWidth
+            else:
+                row     = row + rowStep
+                nextRow = nextRow + rowHeight
+            cells.append((column, row))
+
+        return cells
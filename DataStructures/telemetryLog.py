@@ -0,0 +1,246 @@
+'''
+
+This module records what happens on the connection to the machine as compact binary records, so
+that a long job can be replayed or analyzed afterwards without keeping huge text logs.
+
+Each record is a type byte, a timestamp and a fixed set of values packed with struct. A run is
+written to a series of files in the telemetry directory which are started afresh once they reach
+maxBytes. Each finished file is compressed with gzip in the background. readTelemetry reads the
+records back from either kind of file.
+
+'''
+
+from collections                             import namedtuple
+import atexit
+import glob
+import gzip
+import os
+import Queue
+import shutil
+import struct
+import threading
+import time
+
+
+Sent            = namedtuple('Sent', 'time line length bufferSpace')           #a line was sent, line is -1 if it is not from the program
+Ack             = namedtuple('Ack', 'time latency bufferSpace')                #a line was acked, latency seconds after it was sent
+Position        = namedtuple('Position', 'time x y z')                         #a position report
+PositionalError = namedtuple('PositionalError', 'time left right')             #a positional error report, for each chain
+
+recordTypes = {                                                                 #type byte to (record, struct format of its values)
+    1: (Sent,            struct.Struct('<diHh')),
+    2: (Ack,             struct.Struct('<dfh')),
+    3: (Position,        struct.Struct('<dfff')),
+    4: (PositionalError, struct.Struct('<dff')),
+}
+recordFormats = dict((record, (chr(recordType), format)) for recordType, (record, format) in recordTypes.items())
+
+fileHeader = 'GCTELEM1'
+
+
+class TelemetryLog(object):
+    '''
+
+    TelemetryLog takes records from any thread and writes them from a single background thread,
+    a batch at a time, like the Logger.
+
+    '''
+
+    directory     = 'telemetry'
+    maxBytes      = 8*1024*1024             #the size a file can grow to before a new one is started
+    maxFiles      = 100                     #the most files to keep, the oldest are deleted
+    flushInterval = 1.0                     #the longest a record waits before it is written, in seconds
+    flushTimeout  = 5.0                     #the longest flush waits for the writer, in seconds
+
+    def __init__(self):
+        self.records  = Queue.Queue(10000)  #records waiting to be written
+        self.writer   = None
+        self.lock     = threading.Lock()
+        self.enabled  = True
+        self.dropped  = 0                   #records thrown away because the queue was full
+
+    def record(self, record):
+        '''
+
+        Add a record, one of the namedtuples from this module, to the log.
+
+        '''
+        if not self.enabled:
+            return
+        if self.writer is None:
+            self._startWriter()
+        try:
+            self.records.put_nowait(record)
+        except Queue.Full:
+            self.dropped = self.dropped + 1
+
+    def flush(self):
+        '''
+
+        Wait until every record so far has been written, for at most flushTimeout seconds.
+
+        '''
+        if self.writer is not None:
+            waitUntilDone(self.records, self.writer, self.flushTimeout)
+
+    def _startWriter(self):
+        with self.lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target = self._writeRecords)
+                self.writer.daemon = True
+                self.writer.start()
+                atexit.register(self.flush)
+
+    def _writeRecords(self):
+        runName   = time.strftime('%Y%m%d-%H%M%S')
+        fileCount = 0
+        logFile   = None
+        deadline  = None
+        batch     = []
+
+        while True:
+            try:
+                if deadline is None:
+                    batch.append(self.records.get())
+                    deadline = time.time() + self.flushInterval
+                else:
+                    batch.append(self.records.get(True, max(deadline - time.time(), 0.001)))
+            except Queue.Empty:
+                pass
+
+            if batch and (len(batch) >= 1000 or time.time() >= deadline):
+                #the records are marked done even if they can't be written, so flush never waits forever
+                try:
+                    if logFile is None or logFile.tell() >= self.maxBytes:
+                        if logFile is not None:
+                            logFile.close()
+                            self._compressInBackground(logFile.name)
+                            logFile = None
+                        if not os.path.isdir(self.directory):
+                            os.makedirs(self.directory)
+                        fileCount = fileCount + 1
+                        logFile = open(os.path.join(self.directory, '%s-%04d.gctl' % (runName, fileCount)), 'wb')
+                        logFile.write(fileHeader)
+                        self._removeOldFiles()
+
+                    logFile.write(''.join(encodeRecord(record) for record in batch))
+                    logFile.flush()
+                except:
+                    print "Unable to write telemetry"
+                for written in xrange(len(batch)):
+                    self.records.task_done()
+                batch    = []
+                deadline = None
+
+    def _compressInBackground(self, path):
+        thread = threading.Thread(target = compressFile, args = (path,))
+        thread.daemon = True
+        thread.start()
+
+    def _removeOldFiles(self):
+        files = sorted(glob.glob(os.path.join(self.directory, '*.gctl*')))
+        for path in files[:max(len(files) - self.maxFiles, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def waitUntilDone(queue, writer, timeout):
+    '''
+
+    Wait until every item put on queue has been marked done by the writer thread, for at most
+    timeout seconds. Returns straight away if the writer thread is not running, since nothing
+    would ever mark the rest done.
+
+    '''
+    deadline = time.time() + timeout
+    with queue.all_tasks_done:
+        while queue.unfinished_tasks and writer.is_alive():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            queue.all_tasks_done.wait(min(remaining, 0.1))
+
+def encodeRecord(record):
+    typeByte, format = recordFormats[type(record)]
+    return typeByte + format.pack(*record)
+
+def compressFile(path):
+    '''
+
+    Compress a telemetry file with gzip, replacing it with path + '.gz'. The compressed file only
+    appears once it is complete.
+
+    '''
+    with open(path, 'rb') as source:
+        compressed = gzip.open(path + '.gz.tmp', 'wb')
+        try:
+            shutil.copyfileobj(source, compressed)
+        finally:
+            compressed.close()
+    os.rename(path + '.gz.tmp', path + '.gz')
+    os.remove(path)
+
+def telemetryFiles(directory = TelemetryLog.directory, run = None):
+    '''
+
+    The files of a run in the order they were written, or of every run if run is None. A run is
+    named by the date and time it started, like '20170801-142501'.
+
+    '''
+    pattern = (run or '') + '*.gctl*'
+    paths   = [path for path in glob.glob(os.path.join(directory, pattern)) if not path.endswith('.tmp')]
+    return sorted(paths, key = lambda path: os.path.basename(path).split('.')[0])
+
+def readTelemetry(paths):
+    '''
+
+    Yield the records in the files at paths, in order. Files may be compressed or not, and a
+    record cut short at the end of a file is ignored.
+
+    '''
+    if isinstance(paths, basestring):
+        paths = [paths]
+
+    for path in paths:
+        if path.endswith('.gz'):
+            data = gzip.open(path, 'rb').read()
+        else:
+            with open(path, 'rb') as telemetryFile:
+                data = telemetryFile.read()
+        if not data.startswith(fileHeader):
+            raise ValueError(path + ' is not a telemetry file')
+
+        position = len(fileHeader)
+        while position < len(data):
+            record, format = recordTypes[ord(data[position])]
+            end = position + 1 + format.size
+            if end > len(data):
+                break
+            yield record(*format.unpack_from(data, position + 1))
+            position = end
+
+def parsePosition(message, received):
+    '''
+
+    The Position in a position report like '<Idle,MPos:1.0,2.0,3.0,WPos:...>', or None.
+
+    '''
+    try:
+        values = message[message.index('MPos:') + 5:message.index('WPos:')].split(',')
+        return Position(received, float(values[0]), float(values[1]), float(values[2]))
+    except (ValueError, IndexError):
+        return None
+
+def parsePositionalError(message, received):
+    '''
+
+    The PositionalError in a report like '[PE:0.1,-0.2,127]', or None.
+
+    '''
+    try:
+        values = message[message.index(':') + 1:].split(',')
+        return PositionalError(received, float(values[0]), float(values[1]))
+    except (ValueError, IndexError):
+        return None
@@ -0,0 +1,19 @@
+'''
+
+This module provides a simple addition to the Queue, which is that each put also puts a token on a
+second queue. A thread can then block on the second queue to wait for any of the queues which
+share it, instead of polling them all.
+
+'''
+
+from Queue import Queue
+
+
+class WakingQueue(Queue, object):
+    def __init__(self, wakeQueue):
+        self.wakeQueue = wakeQueue
+        super(WakingQueue, self).__init__()
+    
+    def put(self, msg):
+        super(WakingQueue, self).put(msg)
+        self.wakeQueue.put(None)
@@ -37,7 +37,7 @@ settings = {
             {
                 "type": "string",
                 "title": "Serial Connection",
-                "desc": "Select the COM port to connect to machine",
+                "desc": "Select the COM port to connect to machine, or enter tcp://host:port to connect through a network serial bridge",
                 "key": "COMport",
                 "default": ''
             },
@@ -361,6 +361,20 @@ settings = {
                 "key": "centerCanvasOnResize",
                 "default": 0
             },
+            {
+                "type": "bool",
+                "title": "Stream Gcode",
+                "desc": "Keep sending lines of gcode for as long as they fit in the machine's receive buffer, instead of waiting for each line to finish before sending the next. The machine finishes the lines already in its buffer after HOLD is pressed, so it takes longer to stop. Takes effect the next time the machine connects.",
+                "key": "streamGcode",
+                "default": 1
+            },
+            {
+                "type": "bool",
+                "title": "Record Telemetry",
+                "desc": "Record the lines sent to the machine, how long each took to be acked, and the position and positional error reports in compressed binary files in the telemetry folder, for analyzing a job afterwards. Takes effect the next time the machine connects.",
+                "key": "recordTelemetry",
+                "default": 1
+            },
             {
                 "type": "string",
                 "title": "Zoom In",
@@ -381,6 +395,34 @@ settings = {
                 "desc": "Valid file extensions for Ground Control to open. Comma separated list.",
                 "key": "validExtensions",
                 "default": ".nc, .ngc, .text, .gcode"
+            },
+            {
+                "type": "string",
+                "title": "Memory Map Files Larger Than",
+                "desc": "Gcode files larger than this many megabytes are read from the disk as they are needed instead of being loaded into memory. This keeps memory use low for very large files.",
+                "key": "mapFileSize",
+                "default": "100"
+            },
+            {
+                "type": "string",
+                "title": "Gcode Cache Size",
+                "desc": "Gcode files which have been opened before are loaded from a cache instead of being read again. This is the most space in megabytes the cache can use.",
+                "key": "gcodeCacheSize",
+                "default": "500"
+            },
+            {
+                "type": "string",
+                "title": "Drawing Time Per Frame",
+                "desc": "The gcode is drawn a little at a time between frames so that the program stays responsive while it draws. This is how many milliseconds of each frame can be spent drawing.",
+                "key": "drawingFrameTime",
+                "default": "8"
+            },
+            {
+                "type": "string",
+                "title": "Console Scrollback",
+                "desc": "The number of lines of output from the machine which the console keeps to scroll back through. Keeping more lines, even 100000, does not slow the console down but uses more memory.",
+                "key": "consoleScrollback",
+                "default": "2000"
             }
         ],
     "Computed Settings": #These are setting calculated from the user inputs on other settings, they are not direclty seen by the user
@@ -0,0 +1,257 @@
+'''
+
+This module provides a stand-in for the Maslow firmware, so that the connection to the machine can
+be run and timed without the hardware.
+
+The emulator speaks the same protocol as the firmware over any transport from Connection.transports,
+usually one end of a loopbackPair, or over a pseudo terminal which Ground Control can open like a
+serial port. It has a receive buffer of a fixed size, takes a set time to run each line, and reports
+its position, worked out through the kinematics the same way the firmware works it out from the
+chain lengths.
+
+'''
+
+from DataStructures.gcodeInterpreter         import GcodeInterpreter
+from DataStructures.gcodeProgram             import GcodeProgram
+from Simulation.kinematics                   import Kinematics
+import math
+import os
+import Queue
+import random
+import threading
+import time
+
+
+class FirmwareEmulator(object):
+    '''
+
+    FirmwareEmulator receives lines into a receive buffer of bufferSize bytes at the speed of the
+    serial connection, and runs them one at a time in the order they arrived. A line leaves the
+    buffer when it starts to run and is acked with 'ok' once it is done, or with 'error:' if it is
+    not understood. Bytes which arrive to a full buffer are lost and counted in overflows.
+
+    The quick commands '!' and '~' are handled as soon as they arrive: '!' throws away the lines
+    waiting in the buffer.
+
+    '''
+
+    version        = '1.11'
+    statusInterval = 0.1                    #seconds between position reports
+    rapidFeed      = 1000.0                 #millimeters per minute for G0 moves when lines take as long as their moves
+
+    def __init__(self, transport, bufferSize = 256, lineTime = 0.0, baudRate = 57600, moveTime = False, positionalError = 0.0, kinematics = None, settings = None):
+        '''
+
+        transport is the end of the connection the machine uses. Each line takes lineTime seconds to
+        run plus, if moveTime is set, as long as the move would take at its feed rate. baudRate sets
+        how quickly bytes arrive, or None for no delay. The reported positional error of each chain
+        is drawn from a normal distribution with a standard deviation of positionalError
+        millimeters. settings maps firmware setting numbers to their values, as read by $$.
+
+        '''
+        self.transport       = transport
+        self.bufferSize      = bufferSize
+        self.lineTime        = lineTime
+        self.byteTime        = 10.0/baudRate if baudRate else 0     #8 data bits plus start and stop bits
+        self.moveTime        = moveTime
+        self.positionalError = positionalError
+        self.kinematics      = kinematics if kinematics is not None else Kinematics()
+        self.settings        = dict(settings) if settings is not None else {}
+
+        self.received        = Queue.Queue()            #the lines in the receive buffer
+        self.bufferUsed      = 0
+        self.overflows       = 0                        #bytes lost to a full buffer
+        self.linesRun        = 0
+        self.lock            = threading.Lock()         #guards the buffer accounting and writes to the transport
+        self.running         = False
+        self.threads         = []
+        self.lastStatus      = 0                        #when the position was last reported
+
+        self.program         = GcodeProgram()           #every line run, to interpret them in order
+        self.interpreter     = GcodeInterpreter(self.program)
+
+    def start(self):
+        '''
+
+        Start receiving and running lines, each in its own thread.
+
+        '''
+        self.running = True
+        self._reply("ok")                   #the firmware is ready as soon as it starts
+        self.threads = [threading.Thread(target = self._receive), threading.Thread(target = self._run)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        '''
+
+        Stop and close the connection, which Ground Control sees as the machine going away.
+
+        '''
+        self.running = False
+        self.received.put(None)
+        self.transport.close()
+
+    def position(self):
+        '''
+
+        The x, y, z position of the sled in millimeters, as the firmware would calculate it from the
+        chain lengths needed to reach where the gcode has moved it to.
+
+        '''
+        chainA, chainB = self.kinematics.inverse(self.interpreter.x, self.interpreter.y)
+        x, y = self.kinematics.forward(chainA, chainB)
+        return x, y, self.interpreter.z
+
+    def _reply(self, message):
+        with self.lock:
+            self.transport.write(message + "\r\n")
+
+    def _receive(self):
+        while self.running:
+            try:
+                line = self.transport.readline()
+            except:
+                self.running = False
+                self.received.put(None)
+                return
+            if not line:
+                continue
+
+            time.sleep(len(line)*self.byteTime)             #the time taken to arrive over the wire
+
+            if line.strip() in ('!', '~'):
+                self._quickCommand(line.strip())
+                continue
+
+            with self.lock:
+                if self.bufferUsed + len(line) > self.bufferSize:
+                    self.overflows = self.overflows + len(line)
+                    continue
+                self.bufferUsed = self.bufferUsed + len(line)
+            self.received.put(line)
+
+    def _quickCommand(self, command):
+        if command == '!':
+            #throw away everything waiting to run
+            with self.lock:
+                while True:
+                    try:
+                        self.received.get_nowait()
+                    except Queue.Empty:
+                        break
+                self.bufferUsed = 0
+        self._reply("ok")
+
+    def _run(self):
+        while self.running:
+            try:
+                line = self.received.get(True, self.statusInterval)
+            except Queue.Empty:
+                line = ""
+
+            if line:
+                with self.lock:
+                    self.bufferUsed = max(self.bufferUsed - len(line), 0)
+                self._runLine(line.strip())
+                self.linesRun = self.linesRun + 1
+
+            self._reportStatusIfDue()
+
+    def _waitUntil(self, finish):
+        '''
+
+        Wait until the time finish, still reporting the position while a long move runs.
+
+        '''
+        while self.running:
+            remaining = finish - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, self.statusInterval))
+            self._reportStatusIfDue()
+
+    def _runLine(self, line):
+        started = time.time()
+
+        if line == 'B05':
+            self._reply("Firmware Version " + self.version)
+        elif line == '$$':
+            for key in sorted(self.settings):
+                self._reply("$%d=%s" % (key, self.settings[key]))
+        elif line.startswith('$'):
+            try:
+                key, value = line[1:].split('=', 1)
+                self.settings[int(key)] = value.strip()
+            except ValueError:
+                self._reply("error: Invalid setting " + line)
+                return
+        elif line and line[0].upper() not in 'GMTSFXYZIJ(;':
+            self._reply("error: Unsupported command " + line)
+            return
+        elif line:
+            x, y, z = self.interpreter.x, self.interpreter.y, self.interpreter.z
+            self.program.append(line)
+            self.interpreter.advance(len(self.program))
+            self.interpreter.toolpath.truncate(0)           #only the position is needed
+            del self.interpreter.checkpoints[:]
+
+            if self.moveTime:
+                distance = math.sqrt((self.interpreter.x - x)**2 + (self.interpreter.y - y)**2 + (self.interpreter.z - z)**2)
+                feed     = self.interpreter.feed if self.interpreter.motion != 0 and self.interpreter.feed > 0 else self.rapidFeed
+                started  = started + 60*distance/feed
+
+        self._waitUntil(started + self.lineTime)
+        self._reply("ok")
+
+    def _reportStatusIfDue(self):
+        if time.time() - self.lastStatus > self.statusInterval and self.running:
+            self._reportStatus()
+            self.lastStatus = time.time()
+
+    def _reportStatus(self):
+        x, y, z = self.position()
+        scale   = GcodeInterpreter.scales[self.interpreter.units]
+        self._reply("<Idle,MPos:%.3f,%.3f,%.3f,WPos:0.000,0.000,0.000>" % (x/scale, y/scale, z/scale))
+
+        with self.lock:
+            bufferSpace = self.bufferSize - self.bufferUsed
+        self._reply("[PE:%.2f,%.2f,%d]" % (random.gauss(0, self.positionalError), random.gauss(0, self.positionalError), bufferSpace))
+
+
+class PtyTransport(object):
+    '''
+
+    The machine's end of a pseudo terminal. Ground Control can connect to the emulator by opening
+    the terminal named by path as its serial port.
+
+    '''
+
+    def __init__(self):
+        import tty                          #only available on Unix
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        self.name     = self.path = os.ttyname(slave)
+        self.slave    = slave               #kept open so that the terminal stays up between connections
+        self.partLine = ''
+
+    def open(self):
+        pass
+
+    def readline(self):
+        while '\n' not in self.partLine:
+            received = os.read(self.master, 4096)
+            if not received:
+                raise IOError('Pseudo terminal ' + self.name + ' closed')
+            self.partLine = self.partLine + received
+
+        line, self.partLine = self.partLine.split('\n', 1)
+        return line + '\n'
+
+    def write(self, data):
+        os.write(self.master, data)
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
@@ -23,6 +23,9 @@ class Kinematics():
     x = 2708.4
     y = 270
 
+    xForward = -10                                      #the last position found by forward, where the next search starts
+    yForward = 0
+
     #utility variables
     DegPerRad = 360/(4 * math.atan(1))
     Time = 0
@@ -37,6 +40,10 @@ class Kinematics():
     #Calculation tolerances
     MaxError = 0.01
     MaxTries = 10
+    MaxForwardTries = 20                                #Newton steps forward takes before it gives up
+    ForwardDelta = 0.1                                  #distance moved to see how the chain lengths change, in mm
+    ForwardMaxError = 0.0001                            #MaxError of the inverse solves forward makes
+    ForwardMargin = 100                                 #how far off the board forward prefers a position on the board, in mm
     DeltaPhi = 0.01
     DeltaY = 0.01
 
@@ -53,9 +60,6 @@ class Kinematics():
     Psi1 = Theta - Phi
     Psi2 = Theta + Phi
     Tries = 0
-    Jac=[0,0,0,0,0,0,0,0,0,0]
-    Solution=[0,0,0]
-    Crit=[0,0,0]
     #Offsetx1 = 0
     #Offsetx2 = 0
     #Offsety1 = 0
@@ -189,9 +193,74 @@ class Kinematics():
         #Confirm that the coordinates are on the wood
         self._verifyValidTarget(xTarget, yTarget)
 
+        #start from the tilt of the sled at the last position, which is usually close
+        Chain1, Chain2, self.Phi, converged = self._quadrilateralSolve(xTarget, yTarget, self.Phi)
+        self.Psi1 = self.Theta - self.Phi
+        self.Psi2 = self.Theta + self.Phi
+
+        if not converged:
+            print "unable to calculate chain lengths"
+
+        return Chain1, Chain2
+
+    def inverseBatch(self, xTargets, yTargets):
+        '''
+
+        Compute the chain lengths needed to reach many XY positions, returned as a list of the left
+        chain lengths and a list of the right ones.
+
+        Nothing is stored on the object, so a batch can be computed on one thread while inverse is
+        used on another. Each point starts from the sled tilt found for the point before it, so the
+        points along a toolpath or across a grid take few steps to converge.
+
+        '''
+        chainALengths = []
+        chainBLengths = []
+
+        if not self.isQuadKinematics:
+            for xTarget, yTarget in zip(xTargets, yTargets):
+                Chain1, Chain2 = self.triangularInverse(xTarget, yTarget)
+                chainALengths.append(Chain1)
+                chainBLengths.append(Chain2)
+            return chainALengths, chainBLengths
+
+        Phi      = self.Phi
+        failures = 0
+        for xTarget, yTarget in zip(xTargets, yTargets):
+            Chain1, Chain2, solvedPhi, converged = self._quadrilateralSolve(xTarget, yTarget, Phi)
+            if converged:
+                Phi = solvedPhi
+            else:
+                failures = failures + 1
+            chainALengths.append(Chain1)
+            chainBLengths.append(Chain2)
+
+        if failures:
+            print "unable to calculate chain lengths for " + str(failures) + " points"
+
+        return chainALengths, chainBLengths
+
+    def _quadrilateralSolve(self, xTarget, yTarget, Phi, MaxError = None):
+
+        '''
+
+        Solve for the tilt of the sled and the chain lengths at an XY position, starting from the
+        tilt Phi, until the criteria are within MaxError (self.MaxError if None). Every intermediate
+        value is kept local.
+
+        Returns the left and right chain lengths, the tilt found, and whether it converged.
+
+        '''
+
+        h = self.h
+        D = self.D
+        R = self.R
+        if MaxError is None:
+            MaxError = self.MaxError
+
         #coordinate shift to put (0,0) in the center of the plywood from the left sprocket
-        self.x = (self.D/2.0) + xTarget
-        self.y = (self.machineHeight/2.0) + self.motorOffsetY  - yTarget
+        x = (D/2.0) + xTarget
+        y = (self.machineHeight/2.0) + self.motorOffsetY  - yTarget
 
         #Coordinates definition:
         #         x -->, y |
@@ -199,115 +268,87 @@ class Kinematics():
         # (0,0) at center of left sprocket
         # upper left corner of plywood (270, 270)
 
-        Tries = 0                                  #initialize
-        if(self.x > self.D/2.0):                              #the right half of the board mirrors the left half so all computations are done  using left half coordinates.
-          self.x = self.D-self.x                                  #Chain lengths are swapped at exit if the x,y is on the right half
-          self.Mirror = True
-
+        if(x > D/2.0):                              #the right half of the board mirrors the left half so all computations are done  using left half coordinates.
+            x = D-x                                 #Chain lengths are swapped at exit if the x,y is on the right half
+            Mirror = True
         else:
-            self.Mirror = False
+            Mirror = False
+
+        TanGamma = y/x
+        TanLambda = y/(D-x)
+        Y1Plus = R * math.sqrt(1 + TanGamma * TanGamma)
+        Y2Plus = R * math.sqrt(1 + TanLambda * TanLambda)
 
-        self.TanGamma = self.y/self.x
-        self.TanLambda = self.y/(self.D-self.x)
-        self.Y1Plus = self.R * math.sqrt(1 + self.TanGamma * self.TanGamma)
-        self.Y2Plus = self.R * math.sqrt(1 + self.TanLambda * self.TanLambda)
+        MySinPhi, MySinPhiDelta, SinPsi1, CosPsi1, SinPsi2, CosPsi2, SinPsi1D, CosPsi1D, SinPsi2D, CosPsi2D = self._MyTrig(Phi)
 
-        self._MyTrig()
-        #self.Psi1 = self.Theta - self.Phi
-        #self.Psi2 = self.Theta + self.Phi
                                                  #These criteria will be zero when the correct values are reached
                                                  #They are negated here as a numerical efficiency expedient
 
-        self.Crit[0] = - self._moment(self.Y1Plus, self.Y2Plus, self.Phi, self.MySinPhi, self.SinPsi1, self.CosPsi1, self.SinPsi2, self.CosPsi2)
-        self.Crit[1] = - self._YOffsetEqn(self.Y1Plus, self.x - self.h * self.CosPsi1, self.SinPsi1)
-        self.Crit[2] = - self._YOffsetEqn(self.Y2Plus, self.D - (self.x + self.h * self.CosPsi2), self.SinPsi2)
+        Crit = [- self._moment(x, y, Y1Plus, Y2Plus, MySinPhi, SinPsi1, CosPsi1, SinPsi2, CosPsi2),
+                - self._YOffsetEqn(y, Y1Plus, x - h * CosPsi1, SinPsi1),
+                - self._YOffsetEqn(y, Y2Plus, D - (x + h * CosPsi2), SinPsi2)]
 
+        Tries = 0
         while (Tries <= self.MaxTries):
-            if (abs(self.Crit[0]) < self.MaxError):
-                if (abs(self.Crit[1]) < self.MaxError):
-                    if (abs(self.Crit[2]) < self.MaxError):
-                        break
+            if (abs(Crit[0]) < MaxError and abs(Crit[1]) < MaxError and abs(Crit[2]) < MaxError):
+                break
 
                        #estimate the tilt angle that results in zero net _moment about the pen
                        #and refine the estimate until the error is acceptable or time runs out
 
                               #Estimate the Jacobian components
 
-            self.Jac[0] = (self._moment( self.Y1Plus, self.Y2Plus,self.Phi + self.DeltaPhi, self.MySinPhiDelta, self.SinPsi1D, self.CosPsi1D, self.SinPsi2D, self.CosPsi2D) + self.Crit[0])/self.DeltaPhi
-            self.Jac[1] = (self._moment( self.Y1Plus + self.DeltaY, self.Y2Plus, self.Phi, self.MySinPhi, self.SinPsi1, self.CosPsi1, self.SinPsi2, self.CosPsi2) + self.Crit[0])/self.DeltaY
-            self.Jac[2] = (self._moment(self.Y1Plus, self.Y2Plus + self.DeltaY,  self.Phi, self.MySinPhi, self.SinPsi1, self.CosPsi1, self.SinPsi2, self.CosPsi2) + self.Crit[0])/self.DeltaY
-            self.Jac[3] = (self._YOffsetEqn(self.Y1Plus, self.x - self.h * self.CosPsi1D, self.SinPsi1D) + self.Crit[1])/self.DeltaPhi
-            self.Jac[4] = (self._YOffsetEqn(self.Y1Plus + self.DeltaY, self.x - self.h * self.CosPsi1,self.SinPsi1) + self.Crit[1])/self.DeltaY
-            self.Jac[5] = 0.0
-            self.Jac[6] = (self._YOffsetEqn(self.Y2Plus, self.D - (self.x + self.h * self.CosPsi2D), self.SinPsi2D) + self.Crit[2])/self.DeltaPhi
-            self.Jac[7] = 0.0
-            self.Jac[8] = (self._YOffsetEqn(self.Y2Plus + self.DeltaY, self.D - (self.x + self.h * self.CosPsi2D), self.SinPsi2) + self.Crit[2])/self.DeltaY
-
+            Jac = [(self._moment(x, y, Y1Plus, Y2Plus, MySinPhiDelta, SinPsi1D, CosPsi1D, SinPsi2D, CosPsi2D) + Crit[0])/self.DeltaPhi,
+                   (self._moment(x, y, Y1Plus + self.DeltaY, Y2Plus, MySinPhi, SinPsi1, CosPsi1, SinPsi2, CosPsi2) + Crit[0])/self.DeltaY,
+                   (self._moment(x, y, Y1Plus, Y2Plus + self.DeltaY, MySinPhi, SinPsi1, CosPsi1, SinPsi2, CosPsi2) + Crit[0])/self.DeltaY,
+                   (self._YOffsetEqn(y, Y1Plus, x - h * CosPsi1D, SinPsi1D) + Crit[1])/self.DeltaPhi,
+                   (self._YOffsetEqn(y, Y1Plus + self.DeltaY, x - h * CosPsi1, SinPsi1) + Crit[1])/self.DeltaY,
+                   0.0,
+                   (self._YOffsetEqn(y, Y2Plus, D - (x + h * CosPsi2D), SinPsi2D) + Crit[2])/self.DeltaPhi,
+                   0.0,
+                   (self._YOffsetEqn(y, Y2Plus + self.DeltaY, D - (x + h * CosPsi2D), SinPsi2) + Crit[2])/self.DeltaY,
+                   0]
 
             #solve for the next guess
 
-            buildOutJac  =  self._moment( self.Y1Plus + self.DeltaY, self.Y2Plus, self.Phi, self.MySinPhi, self.SinPsi1, self.CosPsi1, self.SinPsi2, self.CosPsi2) + self.Crit[0]
-
-
-            self._MatSolv()     # solves the matrix equation Jx=-Criterion
+            Solution = self._MatSolv(Jac, Crit)     # solves the matrix equation Jx=-Criterion
 
             # update the variables with the new estimate
 
-
-            self.Phi = self.Phi + self.Solution[0]
-            self.Y1Plus = self.Y1Plus + self.Solution[1]                         #don't allow the anchor points to be inside a sprocket
-            if (self.Y1Plus < self.R):
-                self.Y1Plus = self.R
-
-            self.Y2Plus = self.Y2Plus + self.Solution[2]                         #don't allow the anchor points to be inside a sprocke
-            if (self.Y2Plus < self.R):
-                self.Y2Plus = self.R
-
-
-            self.Psi1 = self.Theta - self.Phi
-            self.Psi2 = self.Theta + self.Phi
+            Phi = Phi + Solution[0]
+            Y1Plus = max(Y1Plus + Solution[1], R)                        #don't allow the anchor points to be inside a sprocket
+            Y2Plus = max(Y2Plus + Solution[2], R)
 
                                                                  #evaluate the
                                                                  #three criterion equations
-            self._MyTrig()
+            MySinPhi, MySinPhiDelta, SinPsi1, CosPsi1, SinPsi2, CosPsi2, SinPsi1D, CosPsi1D, SinPsi2D, CosPsi2D = self._MyTrig(Phi)
 
-            self.Crit[0] = - self._moment(self.Y1Plus, self.Y2Plus, self.Phi, self.MySinPhi, self.SinPsi1, self.CosPsi1, self.SinPsi2, self.CosPsi2)
-            self.Crit[1] = - self._YOffsetEqn(self.Y1Plus, self.x - self.h * self.CosPsi1, self.SinPsi1)
-            self.Crit[2] = - self._YOffsetEqn(self.Y2Plus, self.D - (self.x + self.h * self.CosPsi2), self.SinPsi2)
+            Crit = [- self._moment(x, y, Y1Plus, Y2Plus, MySinPhi, SinPsi1, CosPsi1, SinPsi2, CosPsi2),
+                    - self._YOffsetEqn(y, Y1Plus, x - h * CosPsi1, SinPsi1),
+                    - self._YOffsetEqn(y, Y2Plus, D - (x + h * CosPsi2), SinPsi2)]
             Tries = Tries + 1                                       # increment itteration count
 
-
-        if (Tries > self.MaxTries):
-            print "unable to calculate chain lengths"
-
         #Variables are within accuracy limits
         #  perform output computation
 
-        self.Offsetx1 = self.h * self.CosPsi1
-        self.Offsetx2 = self.h * self.CosPsi2
-        self.Offsety1 = self.h *  self.SinPsi1
-        self.Offsety2 = self.h * self.SinPsi2
-        self.TanGamma = (self.y - self.Offsety1 + self.Y1Plus)/(self.x - self.Offsetx1)
-        self.TanLambda = (self.y - self.Offsety2 + self.Y2Plus)/(self.D -(self.x + self.Offsetx2))
-        self.Gamma  = math.atan(self.TanGamma)
-        self.Lambda = math.atan(self.TanLambda)
+        Offsetx1 = h * CosPsi1
+        Offsetx2 = h * CosPsi2
+        Offsety1 = h * SinPsi1
+        Offsety2 = h * SinPsi2
+        TanGamma = (y - Offsety1 + Y1Plus)/(x - Offsetx1)
+        TanLambda = (y - Offsety2 + Y2Plus)/(D -(x + Offsetx2))
+        Gamma  = math.atan(TanGamma)
+        Lambda = math.atan(TanLambda)
 
         #compute the chain lengths
 
-        if(self.Mirror):
-            Chain2 = math.sqrt((self.x - self.Offsetx1)*(self.x - self.Offsetx1) + (self.y + self.Y1Plus - self.Offsety1)*(self.y + self.Y1Plus - self.Offsety1)) - self.R * self.TanGamma + self.R * self.Gamma   #right chain length
-            Chain1 = math.sqrt((self.D - (self.x + self.Offsetx2))*(self.D - (self.x + self.Offsetx2))+(self.y + self.Y2Plus - self.Offsety2)*(self.y + self.Y2Plus - self.Offsety2)) - self.R * self.TanLambda + self.R * self.Lambda   #left chain length
-        else:
-            Chain1 = math.sqrt((self.x - self.Offsetx1)*(self.x - self.Offsetx1) + (self.y + self.Y1Plus - self.Offsety1)*(self.y + self.Y1Plus - self.Offsety1)) - self.R * self.TanGamma + self.R * self.Gamma   #left chain length
-            Chain2 = math.sqrt((self.D - (self.x + self.Offsetx2))*(self.D - (self.x + self.Offsetx2))+(self.y + self.Y2Plus - self.Offsety2)*(self.y + self.Y2Plus - self.Offsety2)) - self.R * self.TanLambda + self.R * self.Lambda   #right chain length
-
+        Chain1 = math.sqrt((x - Offsetx1)*(x - Offsetx1) + (y + Y1Plus - Offsety1)*(y + Y1Plus - Offsety1)) - R * TanGamma + R * Gamma   #left chain length
+        Chain2 = math.sqrt((D - (x + Offsetx2))*(D - (x + Offsetx2))+(y + Y2Plus - Offsety2)*(y + Y2Plus - Offsety2)) - R * TanLambda + R * Lambda   #right chain length
 
+        if(Mirror):
+            Chain1, Chain2 = Chain2, Chain1
 
-        aChainLength = Chain1
-        bChainLength = Chain2
-        #print 'target ({:.2f},{:.2f}) chains {:.3f},{:.3f} chain diff {:.3f} sled angle {:.4f} (degrees{:.4f})'.format(xTarget,yTarget,aChainLength, bChainLength, aChainLength - bChainLength, self.Phi, self.Phi*3.14159)
-
-        return aChainLength, bChainLength
+        return Chain1, Chain2, Phi, Tries <= self.MaxTries
 
     def forward(self, chainALength, chainBLength):
         '''
@@ -316,62 +357,218 @@ class Kinematics():
 
         '''
 
+        #start from the last position found, which is usually close
+        xGuess, yGuess, Phi, converged = self._forwardSolve(chainALength, chainBLength, self.xForward, self.yForward, self.Phi)
+
+        if not converged:
+            print "Message: Unable to find valid machine position. Please calibrate chain lengths.",xGuess,yGuess
+            return 0, 0
+
+        self.xForward = xGuess
+        self.yForward = yGuess
+        self.Phi      = Phi
+        return xGuess, yGuess
+
+    def forwardBatch(self, chainALengths, chainBLengths):
+        '''
+
+        Find the XY positions for many pairs of chain lengths, returned as a list of the X values and a
+        list of the Y values. Positions which can't be found are returned as 0, 0 like forward.
+
+        Nothing is stored on the object, and each search starts from the position found for the pair
+        before it.
+
+        '''
+        xValues  = []
+        yValues  = []
+        xGuess   = self.xForward
+        yGuess   = self.yForward
+        Phi      = self.Phi
+        failures = 0
+        for chainALength, chainBLength in zip(chainALengths, chainBLengths):
+            x, y, solvedPhi, converged = self._forwardSolve(chainALength, chainBLength, xGuess, yGuess, Phi)
+            if converged:
+                xGuess, yGuess, Phi = x, y, solvedPhi
+            else:
+                x, y     = 0, 0
+                failures = failures + 1
+            xValues.append(x)
+            yValues.append(y)
+
+        if failures:
+            print "Message: Unable to find valid machine position for " + str(failures) + " points. Please calibrate chain lengths."
+
+        return xValues, yValues
+
+    def _forwardSolve(self, chainALength, chainBLength, xGuess, yGuess, Phi):
+        '''
+
+        Find the XY position whose chain lengths are chainALength and chainBLength, starting from
+        xGuess, yGuess and the sled tilt Phi. Every intermediate value is kept local.
+
+        Newton's method is tried first from the guess and then from the center of the board. Far
+        from the board the chain lengths can match at more than one position, so a position on the
+        board is preferred. If neither converges the slower fixed gain search is used.
+
+        Returns the position, the tilt of the sled there, and whether it converged.
+
+        '''
+
         # apply any offsets for slipped links
         chainALength = chainALength + (self.chain1Offset * self.R)
         chainBLength = chainBLength + (self.chain2Offset * self.R)
 
+        offBoard = None
+        for xStart, yStart, PhiStart in ((xGuess, yGuess, Phi), (0.0, 0.0, Kinematics.Phi)):
+            result = self._newtonForward(chainALength, chainBLength, xStart, yStart, PhiStart)
+            if result[3]:
+                if self._isOnBoard(result[0], result[1]):
+                    return result
+                offBoard = offBoard or result
+
+        if offBoard is not None:
+            return offBoard
+        return self._searchForward(chainALength, chainBLength)
+
+    def _isOnBoard(self, x, y):
+        return abs(x) <= self.machineWidth/2.0 + self.ForwardMargin and abs(y) <= self.machineHeight/2.0 + self.ForwardMargin
+
+    def _isReachable(self, x, y):
+        '''
+
+        True if x, y is between the motors and below them, where the sled can be. The chain lengths
+        are mirrored above the motors, so a search must not wander there.
+
+        '''
+        return abs(x) < self.D/2.0 and y < self.machineHeight/2.0 + self.motorOffsetY
+
+    def _newtonForward(self, chainALength, chainBLength, xGuess, yGuess, Phi):
+        '''
+
+        Newton's method for _forwardSolve. How the chain lengths change with the position is
+        estimated by moving ForwardDelta in x and in y, and each step is cut short as needed to
+        bring the chain lengths closer while staying where the sled can reach.
+
+        '''
+
+        delta = self.ForwardDelta
+
+        if not self._isReachable(xGuess, yGuess):
+            return xGuess, yGuess, Phi, False
+        try:
+            guessLengthA, guessLengthB, Phi = self._inverseSolve(xGuess, yGuess, Phi)
+        except (ValueError, ZeroDivisionError):
+            return xGuess, yGuess, Phi, False
+        aChainError = guessLengthA - chainALength
+        bChainError = guessLengthB - chainBLength
+
+        Tries = 0
+        while (abs(aChainError) >= .01 or abs(bChainError) >= .01):
+            Tries = Tries + 1
+            if Tries > self.MaxForwardTries:
+                return xGuess, yGuess, Phi, False
+
+            #the Jacobian of the chain lengths
+            try:
+                lengthA, lengthB, unused = self._inverseSolve(xGuess + delta, yGuess, Phi)
+                dAdx = (lengthA - guessLengthA)/delta
+                dBdx = (lengthB - guessLengthB)/delta
+                lengthA, lengthB, unused = self._inverseSolve(xGuess, yGuess + delta, Phi)
+                dAdy = (lengthA - guessLengthA)/delta
+                dBdy = (lengthB - guessLengthB)/delta
+            except (ValueError, ZeroDivisionError):
+                return xGuess, yGuess, Phi, False
+
+            determinant = dAdx*dBdy - dAdy*dBdx
+            if determinant == 0:
+                return xGuess, yGuess, Phi, False
+            xStep = (dBdy*aChainError - dAdy*bChainError)/determinant
+            yStep = (dAdx*bChainError - dBdx*aChainError)/determinant
+
+            #take the step, or as much of it as brings the chain lengths closer
+            worstError = max(abs(aChainError), abs(bChainError))
+            fraction   = 1.0
+            while True:
+                xNext = xGuess - fraction*xStep
+                yNext = yGuess - fraction*yStep
+                if self._isReachable(xNext, yNext):
+                    try:
+                        lengthA, lengthB, nextPhi = self._inverseSolve(xNext, yNext, Phi)
+                        if max(abs(lengthA - chainALength), abs(lengthB - chainBLength)) < worstError:
+                            break
+                    except (ValueError, ZeroDivisionError):
+                        pass                                #the step left the region where the chains can reach
+                fraction = fraction/2
+                if fraction < .001:
+                    return xGuess, yGuess, Phi, False
+
+            xGuess, yGuess, Phi        = xNext, yNext, nextPhi
+            guessLengthA, guessLengthB = lengthA, lengthB
+            aChainError = guessLengthA - chainALength
+            bChainError = guessLengthB - chainBLength
+
+        return xGuess, yGuess, Phi, True
+
+    def _searchForward(self, chainALength, chainBLength):
+        '''
+
+        The fixed gain search forward used before _newtonForward, which nudges the guess by a tenth of
+        the chain errors. It is slow but finds positions Newton's method can miss.
+
+        '''
+
         xGuess = -10
         yGuess = 0
+        Phi    = Kinematics.Phi
 
         guessCount = 0
 
         while(1):
 
-
             #check our guess
-            guessLengthA, guessLengthB = self.inverse(xGuess, yGuess)
+            try:
+                guessLengthA, guessLengthB, Phi, converged = self._quadrilateralSolve(xGuess, yGuess, Phi) if self.isQuadKinematics else self.triangularInverse(xGuess, yGuess) + (Phi, True)
+            except (ValueError, ZeroDivisionError):
+                return xGuess, yGuess, Phi, False
 
             aChainError = chainALength - guessLengthA
             bChainError = chainBLength - guessLengthB
 
-            #print 'guess {:7.3f} {:7.3f} error {:7.3f} {:7.3f} guesslength {:7.3f} {:7.3f} '.format(xGuess,yGuess,aChainError,bChainError,guessLengthA, guessLengthB)
-
             #adjust the guess based on the result
             xGuess = xGuess + .1*aChainError - .1*bChainError
             yGuess = yGuess - .1*aChainError - .1*bChainError
 
             guessCount = guessCount + 1
 
-
             #if we've converged on the point...or it's time to give up, exit the loop
             if((abs(aChainError) < .01 and abs(bChainError) < .01) or guessCount > 5000):
-                if(guessCount > 5000):
-                    print "Message: Unable to find valid machine position. Please calibrate chain lengths.",aChainError,bChainError,xGuess,yGuess
-                    return 0, 0
-                else:
-                    return xGuess, yGuess
-
-    def _MatSolv(self):
-        Sum = 0
-        NN = 0
-        i = 0
-        ii = 0
-        J = 0
-        JJ = 0
-        K = 0
-        KK = 0
-        L = 0
-        M = 0
-        N = 0
-
-        fact = 0
-
-        b = 0
-        while b < 5 :
-            b = b + 1
+                return xGuess, yGuess, Phi, guessCount <= 5000 and self._isReachable(xGuess, yGuess)
 
-        # gaus elimination, no pivot
+    def _inverseSolve(self, xTarget, yTarget, Phi):
+        '''
+
+        The chain lengths at an XY position, and the tilt of the sled there, starting from the tilt
+        Phi and keeping nothing on the object.
 
+        The tilt is solved to ForwardMaxError, much tighter than inverse needs, so that the chain
+        lengths change smoothly with the position for _forwardSolve to follow.
+
+        '''
+        if self.isQuadKinematics:
+            Chain1, Chain2, Phi, converged = self._quadrilateralSolve(xTarget, yTarget, Phi, self.ForwardMaxError)
+            return Chain1, Chain2, Phi
+        else:
+            Chain1, Chain2 = self.triangularInverse(xTarget, yTarget)
+            return Chain1, Chain2, Phi
+
+    def _MatSolv(self, Jac, Crit):
+        '''
+
+        Solves the matrix equation Jac * Solution = Crit and returns Solution. Jac and Crit are changed.
+
+        '''
+
+        # gaus elimination, no pivot
 
         N = 3
         NN = N-1
@@ -383,95 +580,94 @@ class Kinematics():
             KK = -1
             K = 0
             while (K<L):
-                fact = self.Jac[KK+J]/self.Jac[JJ+J];
+                fact = Jac[KK+J]/Jac[JJ+J];
                 M = 1
                 while (M<=J):
-                    self.Jac[KK + M]= self.Jac[KK + M] -fact * self.Jac[JJ+M]
+                    Jac[KK + M]= Jac[KK + M] -fact * Jac[JJ+M]
                     M = M + 1
                 KK = KK + N;
-                self.Crit[K] = self.Crit[K] - fact * self.Crit[J-1];
+                Crit[K] = Crit[K] - fact * Crit[J-1];
                 K = K + 1
             i = i + 1
 
     #Lower triangular matrix solver
 
-        self.Solution[0] =  self.Crit[0]/self.Jac[0]
+        Solution = [0, 0, 0]
+        Solution[0] =  Crit[0]/Jac[0]
         ii = N-1
 
         i = 2
         while (i<=N):
             M = i -1;
-            Sum = self.Crit[i-1];
+            Sum = Crit[i-1];
 
             J = 1
             while (J<=M):
-                Sum = Sum-self.Jac[ii+J]*self.Solution[J-1];
+                Sum = Sum-Jac[ii+J]*Solution[J-1];
                 J = J + 1
 
-            self.Solution[i-1] = Sum/self.Jac[ii+i];
+            Solution[i-1] = Sum/Jac[ii+i];
             ii = ii + N;
 
             i = i + 1
 
-    def _moment(self, Y1Plus, Y2Plus, Phi, MSinPhi, MSinPsi1, MCosPsi1, MSinPsi2, MCosPsi2):   #computes net moment about center of mass
-        '''Temp
-        Offsetx1
-        Offsetx2
-        Offsety1
-        Offsety2
-        Psi1
-        Psi2
-        TanGamma
-        TanLambda'''
+        return Solution
 
+    def _moment(self, x, y, Y1Plus, Y2Plus, MSinPhi, MSinPsi1, MCosPsi1, MSinPsi2, MCosPsi2):   #computes net moment about center of mass
 
-        self.Psi1 = self.Theta - Phi
-        self.Psi2 = self.Theta + Phi
+        Offsetx1 = self.h * MCosPsi1
+        Offsetx2 = self.h * MCosPsi2
+        Offsety1 = self.h * MSinPsi1
+        Offsety2 = self.h * MSinPsi2
+        TanGamma = (y - Offsety1 + Y1Plus)/(x - Offsetx1)
+        TanLambda = (y - Offsety2 + Y2Plus)/(self.D -(x + Offsetx2))
 
+        return self.h3*MSinPhi + (self.h/(TanLambda+TanGamma))*(MSinPsi2 - MSinPsi1 + (TanGamma*MCosPsi1 - TanLambda * MCosPsi2))
 
-        self.Offsetx1 = self.h * MCosPsi1
-        self.Offsetx2 = self.h * MCosPsi2
-        self.Offsety1 = self.h * MSinPsi1
-        self.Offsety2 = self.h * MSinPsi2
-        self.TanGamma = (self.y - self.Offsety1 + Y1Plus)/(self.x - self.Offsetx1)
-        self.TanLambda = (self.y - self.Offsety2 + Y2Plus)/(self.D -(self.x + self.Offsetx2))
+    def _MyTrig(self, Phi):
+        '''
 
-        return self.h3*MSinPhi + (self.h/(self.TanLambda+self.TanGamma))*(MSinPsi2 - MSinPsi1 + (self.TanGamma*MCosPsi1 - self.TanLambda * MCosPsi2))
+        Approximations of the sines and cosines of the sled angles at the tilt Phi and at Phi + DeltaPhi,
+        returned as MySinPhi, MySinPhiDelta, SinPsi1, CosPsi1, SinPsi2, CosPsi2, SinPsi1D, CosPsi1D,
+        SinPsi2D, CosPsi2D
 
-    def _MyTrig(self):
+        '''
+
+        Psi1 = self.Theta - Phi
+        Psi2 = self.Theta + Phi
 
-        Phisq = self.Phi * self.Phi
-        Phicu = self.Phi * Phisq
-        Phidel = self.Phi + self.DeltaPhi
+        Phisq = Phi * Phi
+        Phicu = Phi * Phisq
+        Phidel = Phi + self.DeltaPhi
         Phidelsq = Phidel * Phidel
         Phidelcu = Phidel * Phidelsq
-        Psi1sq = self.Psi1 * self.Psi1
-        Psi1cu = Psi1sq * self.Psi1
-        Psi2sq = self.Psi2 * self.Psi2
-        Psi2cu = self.Psi2 * Psi2sq
-        Psi1del = self.Psi1 - self.DeltaPhi
+        Psi1sq = Psi1 * Psi1
+        Psi1cu = Psi1sq * Psi1
+        Psi2sq = Psi2 * Psi2
+        Psi2cu = Psi2 * Psi2sq
+        Psi1del = Psi1 - self.DeltaPhi
         Psi1delsq = Psi1del * Psi1del
         Psi1delcu = Psi1del * Psi1delsq
-        Psi2del = self.Psi2 + self.DeltaPhi
+        Psi2del = Psi2 + self.DeltaPhi
         Psi2delsq = Psi2del * Psi2del
         Psi2delcu = Psi2del * Psi2delsq
 
-        self.MySinPhi = -0.1616*Phicu - 0.0021*Phisq + 1.0002*self.Phi
-        self.MySinPhiDelta = -0.1616*Phidelcu - 0.0021*Phidelsq + 1.0002*Phidel
+        MySinPhi = -0.1616*Phicu - 0.0021*Phisq + 1.0002*Phi
+        MySinPhiDelta = -0.1616*Phidelcu - 0.0021*Phidelsq + 1.0002*Phidel
 
-        self.SinPsi1 = -0.0942*Psi1cu - 0.1368*Psi1sq + 1.0965*self.Psi1 - 0.0241#sinPsi1
-        self.CosPsi1 = 0.1369*Psi1cu - 0.6799*Psi1sq + 0.1077*self.Psi1 + 0.9756#cosPsi1
-        self.SinPsi2 = -0.1460*Psi2cu - 0.0197*Psi2sq + 1.0068*self.Psi2 - 0.0008#sinPsi2
-        self.CosPsi2 = 0.0792*Psi2cu - 0.5559*Psi2sq + 0.0171*self.Psi2 + 0.9981#cosPsi2
+        SinPsi1 = -0.0942*Psi1cu - 0.1368*Psi1sq + 1.0965*Psi1 - 0.0241#sinPsi1
+        CosPsi1 = 0.1369*Psi1cu - 0.6799*Psi1sq + 0.1077*Psi1 + 0.9756#cosPsi1
+        SinPsi2 = -0.1460*Psi2cu - 0.0197*Psi2sq + 1.0068*Psi2 - 0.0008#sinPsi2
+        CosPsi2 = 0.0792*Psi2cu - 0.5559*Psi2sq + 0.0171*Psi2 + 0.9981#cosPsi2
 
-        self.SinPsi1D = -0.0942*Psi1delcu - 0.1368*Psi1delsq + 1.0965*Psi1del - 0.0241#sinPsi1
-        self.CosPsi1D = 0.1369*Psi1delcu - 0.6799*Psi1delsq + 0.1077*Psi1del + 0.9756#cosPsi1
-        self.SinPsi2D = -0.1460*Psi2delcu - 0.0197*Psi2delsq + 1.0068*Psi2del - 0.0008#sinPsi2
-        self.CosPsi2D = 0.0792*Psi2delcu - 0.5559*Psi2delsq + 0.0171*Psi2del +0.9981#cosPsi2
+        SinPsi1D = -0.0942*Psi1delcu - 0.1368*Psi1delsq + 1.0965*Psi1del - 0.0241#sinPsi1
+        CosPsi1D = 0.1369*Psi1delcu - 0.6799*Psi1delsq + 0.1077*Psi1del + 0.9756#cosPsi1
+        SinPsi2D = -0.1460*Psi2delcu - 0.0197*Psi2delsq + 1.0068*Psi2del - 0.0008#sinPsi2
+        CosPsi2D = 0.0792*Psi2delcu - 0.5559*Psi2delsq + 0.0171*Psi2del +0.9981#cosPsi2
 
-    def _YOffsetEqn(self, YPlus, Denominator, Psi):
-
-        Temp = ((math.sqrt(YPlus * YPlus - self.R * self.R)/self.R) - (self.y + YPlus - self.h * math.sin(Psi))/Denominator)
-        return Temp
+        return MySinPhi, MySinPhiDelta, SinPsi1, CosPsi1, SinPsi2, CosPsi2, SinPsi1D, CosPsi1D, SinPsi2D, CosPsi2D
 
+    def _YOffsetEqn(self, y, YPlus, Denominator, Psi):
 
+        Temp = ((math.sqrt(YPlus * YPlus - self.R * self.R)/self.R) - (y + YPlus - self.h * math.sin(Psi))/Denominator)
+        return Temp
@@ -115,6 +115,9 @@ class SimulationCanvas(GridLayout):
                 point = (i,j)
                 self.listOfPointsToPlot.append(point)
 
+        #find the chain lengths for the whole grid at once
+        self.chainLengthsToPlot = zip(*self.correctKinematics.inverseBatch([point[0] for point in self.listOfPointsToPlot], [point[1] for point in self.listOfPointsToPlot]))
+
         self.plotNextPoint()
 
     def plotNextPoint(self, *args):
@@ -123,7 +126,7 @@ class SimulationCanvas(GridLayout):
         xValue = point[0]
         yValue = point[1]
 
-        pointPlotted, distortedPoint = self.testPointGenerator.plotPoint(xValue, yValue)
+        pointPlotted, distortedPoint = self.testPointGenerator.plotPoint(xValue, yValue, self.chainLengthsToPlot[self.pointIndex - 1])
         self.listOfPointsPlotted.append(pointPlotted)
         self.listOfDistortedPoints.append(distortedPoint)
 
@@ -24,14 +24,16 @@ class TestPoint(GridLayout):
         self.xLocation = xTarget
         self.yLocation = yTarget
 
-    def plotPoint(self, correctPosX, correctPosY, *args):
+    def plotPoint(self, correctPosX, correctPosY, chainLengths = None, *args):
         
         radius = 5
         self.xLocation = correctPosX
         self.yLocation = correctPosY
 
-        #take the position, translate it to chain lengths
-        chainALength, chainBLength = self.correctKinematics.inverse(correctPosX, correctPosY)
+        #take the position, translate it to chain lengths unless they were found already
+        if chainLengths is None:
+            chainLengths = self.correctKinematics.inverse(correctPosX, correctPosY)
+        chainALength, chainBLength = chainLengths
 
         #then back into XY coordinates using the correct kinematics
         correctPosX, correctPosY = self.correctKinematics.forward(chainALength, chainBLength)
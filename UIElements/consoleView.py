@@ -0,0 +1,134 @@
+from kivy.uix.label                          import Label
+from kivy.core.text                          import Label as CoreLabel
+from kivy.properties                         import NumericProperty
+from DataStructures.ringBuffer               import RingBuffer
+
+
+class ConsoleView(Label):
+    '''
+
+    ConsoleView shows the output from the machine. The lines are kept in a ring buffer of
+    scrollbackLines and only the lines which fit in the view are put into the label, so writing to
+    the console costs the same however many lines are kept.
+
+    The view follows the newest line unless it has been scrolled back with the mouse wheel or by
+    dragging, in which case it stays on the same lines as more arrive.
+
+    '''
+
+    scrollbackLines = NumericProperty(2000)
+    scrollStep      = 3                     #lines moved by one step of the mouse wheel
+
+    def __init__(self, **kwargs):
+        self.lines       = RingBuffer(self.scrollbackLines)
+        self.partLine    = ''               #the start of a line which has not all arrived yet
+        self.lastShown   = None             #the number of the line after the last one shown, None to follow the newest
+        self.dragged     = 0                #how far a drag has moved since it last scrolled a line
+        self.lineHeights = {}               #the height of a line of text at each font size
+        super(ConsoleView, self).__init__(**kwargs)
+        self.lines.resize(self.scrollbackLines)
+        self.bind(size = self.refresh, font_size = self.refresh, scrollbackLines = self.onScrollbackLines)
+
+    def write(self, text):
+        '''
+
+        Add text to the end of the console.
+
+        '''
+        text   = (self.partLine + text).replace('\r\n', '\n').replace('\r', '\n')
+        pieces = text.split('\n')
+        self.partLine = pieces.pop()
+        for line in pieces:
+            self.lines.append(line)
+        self.refresh()
+
+    def clear(self):
+        self.lines.clear()
+        self.partLine  = ''
+        self.lastShown = None
+        self.refresh()
+
+    def gotToBottom(self):
+        '''
+
+        Scroll the widget to the bottom
+
+        '''
+        self.lastShown = None
+        self.refresh()
+
+    def scroll(self, count):
+        '''
+
+        Move the view count lines towards the newest, or back if count is negative.
+
+        '''
+        end = self.lines.appended if self.lastShown is None else self.lastShown
+        self.lastShown = end + count
+        self.refresh()
+
+    def rowCount(self):
+        '''
+
+        The number of lines of text which fit in the view.
+
+        '''
+        lineHeight = self.lineHeights.get(self.font_size)
+        if lineHeight is None:
+            lineHeight = self.lineHeights[self.font_size] = CoreLabel(font_size = self.font_size).get_extents('Wg')[1]
+        return max(int(self.height/lineHeight), 1)
+
+    def refresh(self, *args):
+        rows = self.rowCount()
+        if self.lastShown is not None:
+            #keep a full view when the lines shown are thrown away to make room for new ones
+            self.lastShown = max(self.lastShown, self.lines.firstNumber() + rows)
+            if self.lastShown >= self.lines.appended:
+                self.lastShown = None
+
+        if self.lastShown is None:
+            shown = self.lines.numbered(self.lines.appended - rows, self.lines.appended)
+            if self.partLine:
+                shown = shown[1:] if len(shown) >= rows else shown
+                shown.append(self.partLine)
+        else:
+            shown = self.lines.numbered(self.lastShown - rows, self.lastShown)
+        self.text = '\n'.join(shown)
+
+    def onScrollbackLines(self, instance, lines):
+        self.lines.resize(lines)
+        self.refresh()
+
+    def on_touch_down(self, touch):
+        if not self.collide_point(*touch.pos):
+            return super(ConsoleView, self).on_touch_down(touch)
+
+        if touch.is_mouse_scrolling:
+            if touch.button == 'scrolldown':
+                self.scroll(-self.scrollStep)
+            elif touch.button == 'scrollup':
+                self.scroll(self.scrollStep)
+            return True
+
+        touch.grab(self)
+        self.dragged = 0
+        return True
+
+    def on_touch_move(self, touch):
+        if touch.grab_current is not self:
+            return super(ConsoleView, self).on_touch_move(touch)
+
+        #dragging the text up shows newer lines
+        self.dragged = self.dragged + touch.dy
+        lineHeight   = self.lineHeights.get(self.font_size, 1)
+        lines        = int(self.dragged/lineHeight)
+        if lines:
+            self.dragged = self.dragged - lines*lineHeight
+            self.scroll(lines)
+        return True
+
+    def on_touch_up(self, touch):
+        if touch.grab_current is not self:
+            return super(ConsoleView, self).on_touch_up(touch)
+        touch.ungrab(self)
+        return True
@@ -109,6 +109,20 @@ class Diagnostics(FloatLayout, MakesmithInitFuncs):
         self.data.gcodeFile = "./gcodeForTesting/Calibration Benchmark Test.nc"
         self.parentWidget.close()
     
+    def positionalErrorReport(self):
+        '''
+        
+        Shows the positional error statistics of the job being cut, or the last one cut
+        
+        '''
+        content = ScrollableTextPopup(cancel = self.dismiss_popup, text = self.data.logger.errorStatistics.report(), markup = True)
+        if sys.platform.startswith('darwin'):
+            self._popup = Popup(title="Positional Error Report", content=content, size=(520,400), size_hint=(.6, .6))
+        else:
+            self._popup = Popup(title="Positional Error Report", content=content, size=(520,400), size_hint=(None, None))
+        self._popup.open()
+        self.parentWidget.close()
+    
     def advancedOptionsFunctions(self, text):
         
         if   text == "Test Feedback System":
@@ -121,3 +135,5 @@ class Diagnostics(FloatLayout, MakesmithInitFuncs):
             self.launchSimulation()
         elif text == "Load Calibration Benchmark Test":
             self.loadCalibrationBenchmarkTest()
+        elif text == "Positional Error Report":
+            self.positionalErrorReport()
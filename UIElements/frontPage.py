@@ -12,10 +12,11 @@ from DataStructures.makesmithInitFuncs         import MakesmithInitFuncs
 from kivy.uix.popup                            import Popup
 from UIElements.touchNumberInput               import TouchNumberInput
 from UIElements.zAxisPopupContent              import ZAxisPopupContent
+from UIElements.consoleView                    import ConsoleView
 from DataStructures.data                       import Data
+from Settings                                  import maslowSettings
 from math                                      import sqrt
 from time                                      import time
-import re
 import global_variables
 
 class FrontPage(Screen, MakesmithInitFuncs):
@@ -25,6 +26,7 @@ class FrontPage(Screen, MakesmithInitFuncs):
     screenControls = ObjectProperty(None) 
     
     connectionStatus = StringProperty("Not Connected")
+    dispatchRate     = StringProperty("")     #messages from the machine handled per second and time per tick
     
     xReadoutPos = StringProperty("0 mm")
     yReadoutPos = StringProperty("0 mm")
@@ -45,10 +47,9 @@ class FrontPage(Screen, MakesmithInitFuncs):
     
     stepsizeval  = 0
     
-    consoleText  = StringProperty(" ")
-    
     units = StringProperty("MM")
     gcodeLineNumber = StringProperty('0')
+    linesPerSecond = StringProperty('')
     
     data         = Data()
     
@@ -149,9 +150,23 @@ class FrontPage(Screen, MakesmithInitFuncs):
         self.data.bind(connectionStatus = self.updateConnectionStatus)
         self.data.bind(units            = self.onUnitsSwitch)
         self.data.bind(gcodeIndex       = self.onIndexMove)
+        self.data.bind(runningIndex     = self.onRunningIndexMove)
         self.data.bind(gcodeFile        = self.onGcodeFileChange)
         self.data.bind(uploadFlag       = self.onUploadFlagChange)
         self.update_macro_titles()
+        self.setConsoleScrollback()
+    
+    def setConsoleScrollback(self):
+        '''
+        
+        Sets how many lines the console keeps from the Ground Control Settings.
+        
+        '''
+        try:
+            lines = int(float(self.data.config.get('Ground Control Settings', 'consoleScrollback')))
+        except ValueError:
+            lines = int(maslowSettings.getDefaultValue('Ground Control Settings', 'consoleScrollback'))
+        self.textconsole.scrollbackLines = max(lines, 1)
     
     def updateConnectionStatus(self, callback, connected):
         if connected:
@@ -180,13 +195,30 @@ class FrontPage(Screen, MakesmithInitFuncs):
             self.data.tolerance = 0.5
     
     def onIndexMove(self, callback, newIndex):
+        '''
+        
+        While a program is running gcodeIndex is the next line to send, which can be well ahead of
+        the machine, so the readout follows runningIndex instead. Otherwise gcodeIndex is the line
+        the program will start from.
+        
+        '''
+        if not self.data.uploadFlag:
+            self.showLine(newIndex)
+    
+    def onRunningIndexMove(self, callback, newIndex):
+        self.showLine(newIndex)
+    
+    def showLine(self, newIndex):
         self.gcodeLineNumber = str(newIndex)
         self.percentComplete = '%.1f' %(100* (float(newIndex) / (len(self.data.gcode)-1))) + "%"
-        if newIndex >=1:
-            gCodeLine = self.data.gcode[newIndex-1] #We're executing newIndex-1... about to send newIndex
-            F = re.search("F(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if F:
-                self.gcodeVel = F.groups()[0]   #Otherwise, it stays what it was...
+        if self.data.uploadFlag and self.data.linesPerSecond > 0:
+            self.linesPerSecond = ' @ %.0f lines/s' % self.data.linesPerSecond
+        else:
+            self.linesPerSecond = ''
+        if newIndex < len(self.data.gcode):
+            F = self.data.gcode.lineValue(newIndex, 'F') #The machine is executing newIndex
+            if F is not None and F == F:
+                self.gcodeVel = '%g' % F   #Otherwise, it stays what it was...
             
     def onGcodeFileChange(self, callback, newGcode):
         pass
@@ -232,26 +264,27 @@ class FrontPage(Screen, MakesmithInitFuncs):
         else:
             self.data.gcodeIndex = targetIndex
         
-        gCodeLine = self.data.gcode[self.data.gcodeIndex]
-        
         xTarget = 0
         yTarget = 0
         
         try:
-            x = re.search("X(?=.)([+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if x:
-                xTarget = float(x.groups()[0])
+            x = self.data.gcode.lineValue(self.data.gcodeIndex, 'X')
+            if x is not None:
+                xTarget = float(x)
                 self.previousPosX = xTarget
             else:
                 xTarget = self.previousPosX
             
-            y = re.search("Y(?=.)([+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if y:
-                yTarget = float(y.groups()[0])
+            y = self.data.gcode.lineValue(self.data.gcodeIndex, 'Y')
+            if y is not None:
+                yTarget = float(y)
                 self.previousPosY = yTarget
             else:
                 yTarget = self.previousPosY
             
+            if xTarget != xTarget or yTarget != yTarget:
+                raise ValueError("unreadable coordinate")
+            
             self.gcodecanvas.positionIndicator.setPos(xTarget,yTarget,self.data.units)
         except:
             print "Unable to update position for new gcode line"
@@ -364,6 +397,8 @@ class FrontPage(Screen, MakesmithInitFuncs):
     
     def startRun(self):
         
+        if not self.data.logger.recordingPositionalErrors:
+            self.data.logger.beginRecordingAvgError()
         self.data.uploadFlag = 1
         self.sendLine()
     
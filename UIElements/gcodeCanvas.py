@@ -9,32 +9,56 @@ from kivy.uix.floatlayout                    import FloatLayout
 from kivy.properties                         import NumericProperty, ObjectProperty
 from kivy.graphics                           import Color, Ellipse, Line, Point
 from kivy.clock                              import Clock
+from functools                               import partial
+from timeit                                  import default_timer
+from bisect                                  import bisect_right
+from os                                      import path
 from DataStructures.makesmithInitFuncs       import MakesmithInitFuncs
+from DataStructures.gcodeParser              import GcodeParser
+from DataStructures.gcodeCache               import GcodeCache
+from DataStructures.gcodeProgram             import GcodeProgram, MappedGcodeProgram
+from DataStructures.segmentIndex             import SegmentIndex
+from DataStructures.arcTessellation          import tessellateArc
+from DataStructures.gcodeInterpreter         import GcodeInterpreter, Toolpath
+from UIElements.toolpathBatch                import ToolpathBatch
 from UIElements.positionIndicator            import PositionIndicator
 from UIElements.viewMenu                     import ViewMenu
 from kivy.graphics.transformation            import Matrix
 from kivy.core.window                        import Window
 from UIElements.modernMenu                   import ModernMenu
+from Settings                                import maslowSettings
 
-import re
+import os
 import math
+import threading
 import global_variables
 
 class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
     
-    canvasScaleFactor = 1 #scale from mm to pixels
-    INCHES            = 25.4
-    MILLIMETERS       = 1 
+    lineNumber = 0  #the line number currently being processed
     
-    xPosition = 0
-    yPosition = 0
-    zPosition = 0
+    drawQueue     = []      #(first line, end line) of each region of the gcode still to be drawn, in order
+    frameBudget   = 0.008   #seconds of each frame which can be spent drawing
+    linesPerStep  = 50      #lines drawn between checks of the time
+    priorityLines = 1000    #lines either side of gcodeIndex which are drawn first
     
-    lineNumber = 0  #the line number currently being processed
+    gcodeLoader = None  #the parser of the gcode file currently being loaded in the background
+    
+    interpreter    = None   #the GcodeInterpreter for the program being drawn
+    offset         = (0, 0) #how far the drawing is moved by gcodeShift
+    pen            = None   #the end of the feed moves being drawn, None until the first rapid move
     
-    absoluteFlag = 0
+    gcodeChunks    = []     #the ToolpathBatch for each group of lines drawn together, by first line
+    gcodeChunk     = None   #the batch lines are currently being drawn in
+    drawEvent      = None   #the scheduled drawing of the next group of lines
+    redrawFromLine = None   #set when only the lines from this one on need to be redrawn
+    levelOfDetail  = 0      #how simplified the feed moves are drawn, see ToolpathBatch.levelTolerances
+    segmentIndex   = None   #finds the line of gcode drawn at a point
     
-    prependString = "G01 "
+    arcTolerance    = 0.25  #how far the chords of an arc may stray from it, set from the zoom
+    maxArcTolerance = 0.25  #no coarser than the most detailed simplified toolpath
+    minArcTolerance = 0.005
+    hasArcs         = False #whether any arcs have been drawn with arcTolerance
     
     
     
@@ -49,22 +73,43 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
             Window.bind(on_resize = self.centerCanvas)
 
         self.data.bind(gcode = self.updateGcode)
-        self.data.bind(gcodeShift = self.reloadGcode)
+        self.data.bind(gcodeShift = self.shiftGcode)
         self.data.bind(gcodeFile = self.centerCanvasAndReloadGcode)
+        self.scatterInstance.bind(scale = self.setLevelOfDetail)
+        self.scatterInstance.bind(transform = self.cullToolpath)
+        self.bind(size = self.cullToolpath)
         
         global_variables._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         global_variables._keyboard.bind(on_key_down=self._on_keyboard_down)
         
         self.centerCanvasAndReloadGcode()
     
-    def addPoint(self, x, y):
+    def addPoint(self, x, y, line):
         '''
         
-        Add a point to the line currently being plotted
+        Add a point drawn by a line of gcode to the line currently being plotted
         
         '''
-
-        self.line.points.extend((x,y))
+        
+        if self.pen is not None:
+            self.gcodeChunk.addFeed(self.pen[0], self.pen[1], x, y)
+            self.segmentIndex.add(self.pen[0], self.pen[1], x, y, line)
+        self.pen = (x, y)
+    
+    def addPoints(self, points, line):
+        '''
+        
+        Add a flat list of x, y points starting at the current position to the line currently being
+        plotted, all at once
+        
+        '''
+        
+        if self.pen is not None:
+            points[0] = self.pen[0]
+            points[1] = self.pen[1]
+        self.gcodeChunk.addFeedPoints(points)
+        self.segmentIndex.addPolyline(points, line)
+        self.pen = (points[-2], points[-1])
     
     def _keyboard_closed(self):
         '''
@@ -95,9 +140,6 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
         else:
             return False # we didn't handle this key - let next callback handle it
 
-    def isClose(self, a, b):
-        return abs(a-b) <= self.data.tolerance
-
     def centerCanvasAndReloadGcode(self, *args):
         self.centerCanvas()
         self.reloadGcode()
@@ -107,57 +149,152 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
         
         This reloads the gcode from the hard drive in case it has been updated. 
         
+        The file is read in a separate thread so that the program stays responsive while a large
+        file loads. Any load which is already in progress is cancelled.
+        
         '''
         
+        if self.gcodeLoader is not None:
+            self.gcodeLoader.cancel()
+            self.gcodeLoader = None
+        
         filename = self.data.gcodeFile
         if filename is "": #Blank the g-code if we're loading "nothing"
-			self.data.gcode = ""
+			self.data.gcode = GcodeProgram()
 			return
 
         try:
-            filterfile = open(filename, 'r')
-            rawfilters = filterfile.read()
-
-            filtersparsed = re.sub(r'\(([^)]*)\)','\n',rawfilters) #replace mach3 style gcode comments with newline
-            filtersparsed = re.sub(r';([^\n]*)\n','\n',filtersparsed) #replace standard ; initiated gcode comments with newline
-            filtersparsed = re.sub(r'\n\n','\n',filtersparsed) #removes blank lines
-            filtersparsed = re.sub(r'([0-9])([GXYZIJFTM]) *', '\\1 \\2',filtersparsed) #put spaces between gcodes
-            filtersparsed = re.sub(r'  +',' ',filtersparsed) #condense space runs
-
-            if self.data.config.getint('Advanced Settings','truncate'):
-                digits = self.data.config.get('Advanced Settings','digits')
-                filtersparsed = re.sub(r'([+-]?\d*\.\d{1,'+digits+'})(\d*)',r'\g<1>',filtersparsed) #truncates all long floats to 4 decimal places, leaves shorter floats
-
-            filtersparsed = re.split('\n', filtersparsed) #splits the gcode into elements to be added to the list
-            filtersparsed = [x + ' ' for x in filtersparsed] #adds a space to the end of each line
-            filtersparsed = [x.lstrip() for x in filtersparsed]
-            filtersparsed = [x.replace('X ','X') for x in filtersparsed]
-            filtersparsed = [x.replace('Y ','Y') for x in filtersparsed]
-            filtersparsed = [x.replace('Z ','Z') for x in filtersparsed]
-            filtersparsed = [x.replace('I ','I') for x in filtersparsed]
-            filtersparsed = [x.replace('J ','J') for x in filtersparsed]
-            filtersparsed = [x.replace('F ','F') for x in filtersparsed]
-            
-            self.data.gcode = "[]"
-            self.data.gcode = filtersparsed
-            
-            filterfile.close() #closes the filter save file
-
-            #Find gcode indicies of z moves
-            self.data.zMoves = [0]
-            zList = []
-            for index, line in enumerate(self.data.gcode):
-                z = re.search("Z(?=.)([+-]?([0-9]*)(\.([0-9]+))?)",line)
-                if z:
-                    zList.append(z)
-                    if len(zList) > 1:
-                        if not self.isClose(float(zList[-1].groups()[0]),float(zList[-2].groups()[0])):
-                            self.data.zMoves.append(index-1)
+            parser = GcodeParser(self.data.config.getint('Advanced Settings','truncate'),
+                                 self.data.config.get('Advanced Settings','digits'),
+                                 self.data.tolerance)
+        except:
+            self.data.message_queue.put("Message: Unable to truncate gcode to " + self.data.config.get('Advanced Settings','digits') + " digits. Check the truncate settings in Advanced Settings.")
+            return
+        
+        mapFileSize = self.getSizeSetting('mapFileSize')
+        gcodeCache  = GcodeCache(self.getSizeSetting('gcodeCacheSize'))
+        
+        self.gcodeLoader = parser
+        th = threading.Thread(target = self.loadGcodeFile, args = (parser, filename, mapFileSize, gcodeCache, self.data.gcode, self.data.zMoves))
+        th.daemon = True
+        th.start()
+    
+    def shiftGcode(self, *args):
+        '''
+        
+        Move the gcode to the new origin in gcodeShift. The lines themselves are not changed, the
+        shift is added to their coordinates as they are drawn and sent.
+        
+        '''
+        
+        self.data.gcode = self.data.gcode.shifted(self.data.gcodeShift[0], self.data.gcodeShift[1])
+    
+    def getSizeSetting(self, key):
+        '''
+        
+        Reads a size in megabytes from the Ground Control Settings and returns it in bytes.
+        
+        '''
+        
+        return self.getNumberSetting(key)*1000000
+    
+    def getNumberSetting(self, key):
+        '''
+        
+        Reads a number from the Ground Control Settings, using the default if it can not be read.
+        
+        '''
+        
+        try:
+            return float(self.data.config.get('Ground Control Settings', key))
+        except ValueError:
+            return float(maslowSettings.getDefaultValue('Ground Control Settings', key))
+    
+    def loadGcodeFile(self, parser, filename, mapFileSize, gcodeCache, oldGcode, oldZMoves):
+        '''
+        
+        Runs in a separate thread. Parses the gcode file, reporting progress to the text console
+        in steps of 10%, and hands the finished program back to the main thread.
+        
+        Files larger than mapFileSize bytes are only indexed, and their lines are read from the
+        memory mapped file as they are needed.
+        
+        If the file is the one oldGcode was read from, only the parts of it which have changed are
+        read again. Otherwise a file which has been parsed before with the same settings is read
+        from gcodeCache.
+        
+        '''
+        
+        reported = [0]
+        def reportProgress(fraction):
+            percent = int(fraction*10)*10
+            if percent > reported[0] and not parser.cancelled:
+                reported[0] = percent
+                self.data.message_queue.put("Loading " + path.basename(filename) + ": " + str(percent) + "%\n")
+        
+        try:
+            fileStatus = os.stat(filename)
+            mapped     = fileStatus.st_size > mapFileSize
+            source     = getattr(oldGcode, 'source', None)
+            if source is not None and source.matches(filename, parser) and isinstance(oldGcode, MappedGcodeProgram) == mapped:
+                gcode, zMoves, firstChangedLine = parser.reparseFile(filename, oldGcode, oldZMoves, reportProgress)
+                if firstChangedLine is not None and not parser.cancelled:
+                    gcodeCache.store(gcodeCache.key(filename, parser, mapped), gcode, zMoves)
+            else:
+                firstChangedLine = 0
+                key    = gcodeCache.key(filename, parser, mapped)
+                cached = gcodeCache.load(key, filename, parser, fileStatus)
+                if cached is not None:
+                    gcode, zMoves = cached
+                else:
+                    if mapped:
+                        gcode, zMoves = parser.mapFile(filename, reportProgress)
                     else:
-                        self.data.zMoves.append(index)
+                        gcode, zMoves = parser.parseFile(filename, reportProgress)
+                    if not parser.cancelled:
+                        gcodeCache.store(key, gcode, zMoves)
         except:
+            gcode, zMoves, firstChangedLine = None, None, 0
+        
+        if not parser.cancelled:
+            Clock.schedule_once(partial(self.finishLoadingGcode, parser, gcode, zMoves, firstChangedLine))
+    
+    def finishLoadingGcode(self, parser, gcode, zMoves, firstChangedLine, *args):
+        '''
+        
+        Runs on the main thread once a gcode file has been loaded. The new program replaces the old
+        one in a single step, and not until any job which is running has stopped.
+        
+        If only part of the file changed, only the lines from the first change on are redrawn.
+        
+        '''
+        
+        if parser is not self.gcodeLoader: #a newer file was asked for while this one was loading
+            return
+        
+        if self.data.uploadFlag:
+            Clock.schedule_once(partial(self.finishLoadingGcode, parser, gcode, zMoves, firstChangedLine), 1)
+            return
+        
+        self.gcodeLoader = None
+        
+        if gcode is None:
             self.data.message_queue.put("Message: Cannot reopen gcode file. It may have been moved or deleted. To locate it or open a different file use Actions > Open G-code")
             self.data.gcodeFile = ""
+            return
+        
+        if firstChangedLine is None:                #the file has not changed
+            return
+        
+        gcode = gcode.shifted(self.data.gcodeShift[0], self.data.gcodeShift[1])
+        
+        self.data.zMoves = zMoves
+        if firstChangedLine > 0:
+            self.redrawFromLine = self.firstRedrawnLine(firstChangedLine)
+            self.data.gcode = gcode
+        else:
+            self.data.gcode = "[]"
+            self.data.gcode = gcode
     
     def centerCanvas(self, *args):
         '''
@@ -190,6 +327,55 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
                 mat = Matrix().scale(1+scaleFactor, 1+scaleFactor, 1)
                 self.scatterInstance.apply_transform(mat, anchor = touch.pos)
 
+    def setLevelOfDetail(self, *args):
+        '''
+        
+        Show the toolpath simplified as far as it can be without the difference being visible at
+        the current zoom.
+        
+        '''
+        
+        #arcs are redrawn with more points if the view has zoomed in a long way since they were drawn
+        if self.hasArcs and ToolpathBatch.pixelTolerance/self.scatterInstance.scale < self.arcTolerance/4 and self.arcTolerance > self.minArcTolerance:
+            self.updateGcode()
+            return
+        
+        level = ToolpathBatch.levelForScale(self.scatterInstance.scale)
+        if level != self.levelOfDetail:
+            self.levelOfDetail = level
+            for batch in self.gcodeChunks:
+                batch.setLevel(level)
+    
+    def viewport(self):
+        '''
+        
+        The part of the drawing which is on screen as (xMin, yMin, xMax, yMax)
+        
+        '''
+        
+        xMin, yMin = self.scatterInstance.to_widget(*self.to_window(self.x, self.y))
+        xMax, yMax = self.scatterInstance.to_widget(*self.to_window(self.right, self.top))
+        return (min(xMin, xMax), min(yMin, yMax), max(xMin, xMax), max(yMin, yMax))
+    
+    def cullToolpath(self, *args):
+        '''
+        
+        Only keep the batches of toolpath which are on screen on the canvas
+        
+        '''
+        
+        viewport = self.viewport()
+        for batch in self.gcodeChunks:
+            self.cullBatch(batch, viewport)
+    
+    def cullBatch(self, batch, viewport):
+        visible = batch.overlaps(*viewport)
+        if visible and not batch.visible:
+            self.scatterObject.canvas.add(batch.canvas)
+        elif batch.visible and not visible:
+            self.scatterObject.canvas.remove(batch.canvas)
+        batch.visible = visible
+    
     def drawWorkspace(self, *args):
 
         self.scatterObject.canvas.remove_group('workspace')
@@ -209,141 +395,46 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
             Line(points = (-width/2,0,width/2,0), dash_offset = 5, group='workspace')
             Line(points = (0, -height/2,0,height/2), dash_offset = 5, group='workspace')
     
-    def drawLine(self,gCodeLine,command):
+    def drawMove(self, toolpath, index):
         '''
         
-        drawLine draws a line using the previous command as the start point and the xy coordinates
-        from the current command as the end point. The line is styled based on the command to allow
-        visually differentiating between normal and rapid moves. If the z-axis depth is changed a
-        circle is placed at the location of the depth change to alert the user. 
+        drawMove draws one move of the toolpath. The line is styled based on the kind of move to
+        allow visually differentiating between normal and rapid moves, and arcs are drawn as a
+        series of chords. If the z-axis depth is changed a circle is placed at the location of the
+        depth change to alert the user. 
     
         '''
         
-        try:
-            xTarget = self.xPosition
-            yTarget = self.yPosition
-            zTarget = self.zPosition
-            
-            x = re.search("X(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if x:
-                xTarget = float(x.groups()[0])*self.canvasScaleFactor
-                if self.absoluteFlag == 1:
-                    xTarget = self.xPosition + xTarget
-            
-            y = re.search("Y(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if y:
-                yTarget = float(y.groups()[0])*self.canvasScaleFactor
-                if self.absoluteFlag == 1:
-                    yTarget = self.yPosition + yTarget
-            z = re.search("Z(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if z:
-                zTarget = float(z.groups()[0])*self.canvasScaleFactor
-            
-            
-            #Draw lines for G1 and G0
-            with self.scatterObject.canvas:
-                Color(self.data.drawingColor[0], self.data.drawingColor[1], self.data.drawingColor[2])
-                
-                if command == 'G00':
-                    #draw a dashed line
-                    Line(points = (self.xPosition , self.yPosition , xTarget, yTarget), width = 1, group = 'gcode', dash_length = 4, dash_offset = 2)
-                    
-                    #start a new straight line from the end of the dashed line
-                    self.line = Line(points = (), width = 1, group = 'gcode')
-                    self.addPoint(xTarget , yTarget)
-                else:
-                    self.addPoint(xTarget , yTarget)
-                
-            #If the zposition has changed, add indicators
-            tol = 0.05 #Acceptable error in mm
-            if abs(zTarget - self.zPosition) >= tol:
-                with self.scatterObject.canvas:
-                    if zTarget - self.zPosition > 0:
-                        Color(0, 1, 0)
-                        radius = 1
-                    else:
-                        Color(1, 0, 0)
-                        radius = 2
-                    Line(circle=(self.xPosition , self.yPosition, radius), group = 'gcode')
-                    Color(self.data.drawingColor[0], self.data.drawingColor[1], self.data.drawingColor[2])
-            
-            self.xPosition = xTarget
-            self.yPosition = yTarget
-            self.zPosition = zTarget
-        except:
-            print "Unable to draw line on screen: " + gCodeLine
-    
-    def drawArc(self,gCodeLine,command):
-        '''
-        
-        drawArc draws an arc using the previous command as the start point, the xy coordinates from
-        the current command as the end point, and the ij coordinates from the current command as the
-        circle center. Clockwise or counter-clockwise travel is based on the command. 
-    
-        '''
-        
-        try:
-            xTarget = self.xPosition
-            yTarget = self.yPosition
-            iTarget = 0
-            jTarget = 0
-            
-            x = re.search("X(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if x:
-                xTarget = float(x.groups()[0])*self.canvasScaleFactor
-            y = re.search("Y(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if y:
-                yTarget = float(y.groups()[0])*self.canvasScaleFactor
-            i = re.search("I(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if i:
-                iTarget = float(i.groups()[0])*self.canvasScaleFactor
-            j = re.search("J(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if j:
-                jTarget = float(j.groups()[0])*self.canvasScaleFactor
-            
-            radius = math.sqrt(iTarget**2 + jTarget**2)
-            centerX = self.xPosition + iTarget
-            centerY = self.yPosition + jTarget
-            
-            angle1 = math.atan2(self.yPosition - centerY, self.xPosition - centerX)
-            angle2 = math.atan2(yTarget - centerY, xTarget - centerX)
-            
-            
-            #atan2 returns results from -pi to +pi and we want results from 0 - 2pi
-            if angle1 < 0:
-                angle1 = angle1 + 2*math.pi
-            if angle2 < 0:
-                angle2 = angle2 + 2*math.pi
-            
-            
-            #take into account command G1 or G2
-            if int(command[1:]) == 2:
-                if angle1 < angle2:
-                    angle1 = angle1 + 2*math.pi
-                direction = -1
+        xStart, yStart, zStart = toolpath.startOf(index)
+        xEnd, yEnd, zEnd       = toolpath.endOf(index)
+        
+        xStart = xStart + self.offset[0]
+        yStart = yStart + self.offset[1]
+        xEnd   = xEnd + self.offset[0]
+        yEnd   = yEnd + self.offset[1]
+        
+        kind = toolpath.kinds[index]
+        line = toolpath.lines[index]
+        if kind == Toolpath.RAPID:
+            #draw a dashed line and start the feed moves again from the end of it
+            self.gcodeChunk.addRapid(xStart, yStart, xEnd, yEnd)
+            self.segmentIndex.add(xStart, yStart, xEnd, yEnd, line)
+            self.pen = (xEnd, yEnd)
+        elif kind == Toolpath.FEED:
+            self.addPoint(xEnd, yEnd, line)
+        else:
+            self.hasArcs = True
+            centerX, centerY = toolpath.centerOf(index)
+            self.addPoints(tessellateArc(xStart, yStart, xEnd, yEnd, centerX + self.offset[0], centerY + self.offset[1], kind == Toolpath.CLOCKWISE, self.arcTolerance), line)
+        
+        #If the zposition has changed, add indicators
+        tol = 0.05 #Acceptable error in mm
+        if abs(zEnd - zStart) >= tol:
+            if zEnd - zStart > 0:
+                self.gcodeChunk.addRetract(xStart, yStart)
             else:
-                if angle2 < angle1:
-                    angle2 = angle2 + 2*math.pi
-                direction = 1
-            
-            arcLen = abs(angle1 - angle2)
-            if abs(angle1 - angle2) == 0:
-                arcLen = 6.28313530718
-            
-            i = 0
-            while abs(i) < arcLen:
-                xPosOnLine = centerX + radius*math.cos(angle1 + i)
-                yPosOnLine = centerY + radius*math.sin(angle1 + i)
-                self.addPoint(xPosOnLine , yPosOnLine)
-                i = i+.1*direction #this is going to need to be a direction 
-            
-            self.addPoint(xTarget , yTarget)
-            
-            self.xPosition = xTarget
-            self.yPosition = yTarget
-        except:
-            print "Unable to draw arc on screen: " + gCodeLine
-
+                self.gcodeChunk.addPlunge(xStart, yStart)
+    
     def clearGcode(self):
         '''
         
@@ -351,6 +442,9 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
     
         '''
         self.scatterObject.canvas.clear()#remove_group('gcode')
+        self.gcodeChunks  = []
+        self.gcodeChunk   = None
+        self.segmentIndex = SegmentIndex()
         
         self.drawWorkspace()
     
@@ -371,6 +465,30 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
         
         self.data.gcode_queue.put(commandString)
     
+    def goToLine(self, xPosition, yPosition, *args):
+        '''
+        
+        Move the gcode index to the line which cuts closest to a point selected on the screen, so
+        that the job can be started from there
+        
+        '''
+        
+        if self.segmentIndex is None or self.data.uploadFlag:
+            return
+        
+        nearest = self.segmentIndex.nearest(xPosition, yPosition, 10/self.scatterInstance.scale)   #within 10 pixels
+        if nearest is None:
+            return
+        
+        line, distance = nearest
+        self.data.gcodeIndex = line
+        
+        if self.data.units == 'MM':
+            scaleFactor = 1
+        else:
+            scaleFactor = 25.4
+        self.positionIndicator.setPos(xPosition/scaleFactor, yPosition/scaleFactor, self.data.units)
+    
     def createMark(self, xPosition, yPosition, *args):
         '''
         
@@ -398,161 +516,181 @@ class GcodeCanvas(FloatLayout, MakesmithInitFuncs):
         '''
         pass
     
-    def moveLine(self, gCodeLine):
+    def callBackMechanism(self, callback) :
+        '''
         
-        originalLine = gCodeLine
+        Draw the gcode a little at a time in a non-blocking way, spending up to frameBudget seconds
+        of each frame, until every region in drawQueue has been drawn. Lines are interpreted
+        before they are drawn if they have not been already.
         
-        try:
-            gCodeLine = gCodeLine.upper() + " "
-            x = re.search("X(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if x:
-#                 xTarget = '%f' % (float(x.groups()[0]) + self.data.gcodeShift[0]) # not used any more...
-                eNtnX = re.sub('\-?\d\.|\d*e-','',str(abs(float(x.groups()[0]) + self.data.gcodeShift[0]))) # strip off everything but the decimal part or e-notation exponent
-                e = re.search(".*e-", str(abs(float(x.groups()[0]) + self.data.gcodeShift[0])))
-                if e:
-                    fmtX = "%0%.%sf" % eNtnX  # if e-notation, use the exponent from the e notation
-                else:
-                    fmtX = "%0%.%sf" % len(eNtnX) # use the number of digits after the decimal place
-                gCodeLine = gCodeLine[0:x.start()+1] + (fmtX % (float(x.groups()[0]) + self.data.gcodeShift[0])) + gCodeLine[x.end():]
+        Moves are drawn into a ToolpathBatch until it is full or the region ends, then a new batch
+        is started, so that the gcode can be redrawn from the start of any batch.
+        
+        '''
+        
+        started  = default_timer()
+        toolpath = self.interpreter.toolpath
+        while self.drawQueue and default_timer() - started < self.frameBudget:
+            regionEnd = self.drawQueue[0][1]
+            if self.lineNumber >= regionEnd:
+                self.drawQueue.pop(0)
+                if self.drawQueue:
+                    self.startRegion()
+                continue
             
-            y = re.search("Y(?=.)(([ ]*)?[+-]?([0-9]*)(\.([0-9]+))?)", gCodeLine)
-            if y:
-#                 yTarget = '%f' % (float(y.groups()[0]) + self.data.gcodeShift[1]) # not used any more...
-                eNtnY = re.sub('\-?\d\.|\d*e-','',str(abs(float(y.groups()[0]) + self.data.gcodeShift[1])))
-                e = re.search(".*e-", str(abs(float(y.groups()[0]) + self.data.gcodeShift[1])))
-                if e:
-                    fmtY = "%0%.%sf" % eNtnY
-                else:
-                    fmtY = "%0%.%sf" % len(eNtnY)
-                gCodeLine = gCodeLine[0:y.start()+1] + (fmtY % (float(y.groups()[0]) + self.data.gcodeShift[1])) + gCodeLine[y.end():]
+            lastLine = min(self.lineNumber + self.linesPerStep, regionEnd)
+            if self.interpreter.lineNumber < lastLine:
+                self.interpreter.advance(self.interpreter.lineNumber + 500)
+                self.data.units = self.interpreter.units
+                continue
             
-            return gCodeLine
-        except ValueError:
-            print "line could not be moved:"
-            print originalLine
-            return originalLine
-    
-    def loadNextLine(self):
-        '''
+            if self.gcodeChunk is None or self.gcodeChunk.isFull():
+                self.startBatch()
+            
+            for index in xrange(toolpath.firstMoveOf(self.lineNumber), toolpath.firstMoveOf(lastLine)):
+                self.drawMove(toolpath, index)
+            self.lineNumber = lastLine
         
-        Load the next line of gcode
+        if self.gcodeChunk is not None:
+            self.gcodeChunk.update()
+            self.cullBatch(self.gcodeChunk, self.viewport())
         
+        #Repeat until end of file
+        if self.drawQueue:
+            self.drawEvent = Clock.schedule_once(self.callBackMechanism)
+    
+    def startRegion(self):
         '''
         
-        try:
-            self.data.gcode[self.lineNumber] = self.moveLine(self.data.gcode[self.lineNumber])    #move the line if the gcode has been moved
-            fullString = self.data.gcode[self.lineNumber]
-            self.lineNumber = self.lineNumber + 1
-        except:
-            return #we have reached the end of the file
-        
-        #if the line contains multiple gcode commands split them and execute them individually
-        listOfLines = fullString.split('G')
+        Start drawing the region at the head of drawQueue
         
-        if len(listOfLines) > 1:                              #if the line contains at least one 'G'
-            for line in listOfLines:
-                if len(line) > 0:                                   #If the line is not blank
-                    self.updateOneLine('G' + line)                     #Draw it
-        else:
-            self.updateOneLine(fullString)
-        
-    def updateOneLine(self, fullString):
         '''
         
-        Draw the next line on the gcode canvas
-        
+        self.finishBatch()
+        self.lineNumber = self.drawQueue[0][0]
+    
+    def startBatch(self):
         '''
         
-        validPrefixList = ['G00','G0 ','G1 ','G01','G2 ','G02','G3 ','G03', 'G17']
+        Start a new ToolpathBatch at lineNumber, keeping gcodeChunks in order of first line
         
-        fullString = fullString + " " #ensures that there is a space at the end of the line
+        '''
         
-        #find 'G' anywhere in string
-        gString = fullString[fullString.find('G'):fullString.find('G') + 3]
+        self.finishBatch()
         
-        if gString in validPrefixList:
-            self.prependString = gString
+        #the feed moves carry on from the end of the move before
+        toolpath = self.interpreter.toolpath
+        index    = toolpath.firstMoveOf(self.lineNumber)
+        if index > 0:
+            x, y, z  = toolpath.endOf(index - 1)
+            self.pen = (x + self.offset[0], y + self.offset[1])
+        else:
+            self.pen = None
         
-        if fullString.find('G') == -1: #this adds the gcode operator if it is omitted by the program
-            fullString = self.prependString + ' ' + fullString
-            gString = self.prependString
+        self.gcodeChunk = ToolpathBatch(self.lineNumber, self.data.drawingColor, self.levelOfDetail)
+        self.scatterObject.canvas.add(self.gcodeChunk.canvas)
+        position = bisect_right([batch.firstLine for batch in self.gcodeChunks], self.lineNumber)
+        self.gcodeChunks.insert(position, self.gcodeChunk)
+    
+    def finishBatch(self):
+        if self.gcodeChunk is not None:
+            self.gcodeChunk.finish()
+            self.cullBatch(self.gcodeChunk, self.viewport())
+            self.gcodeChunk = None
+    
+    def firstRedrawnLine(self, lineNumber):
+        '''
         
-        if gString == 'G00' or gString == 'G0 ':
-            self.drawLine(fullString, 'G00')
-
-        if gString == 'G01' or gString == 'G1 ':
-            self.drawLine(fullString, 'G01')
-                    
-        if gString == 'G02' or gString == 'G2 ':
-            self.drawArc(fullString, 'G02')
-                           
-        if gString == 'G03' or gString == 'G3 ':
-            self.drawArc(fullString, 'G03')
-        
-        if gString == 'G17':
-            #Take no action, XY coordinate plane is the default
-            pass
-        
-        if gString == 'G18':
-            print "G18 not supported"
-        
-        if gString == 'G20':
-            self.canvasScaleFactor = self.INCHES
-            self.data.units = "INCHES"
-            
-        if gString == 'G21':
-            self.canvasScaleFactor = self.MILLIMETERS
-            self.data.units = "MM"
+        The first line which needs to be redrawn to redraw lineNumber, which is the start of the
+        batch it was drawn in.
         
-        if gString == 'G90':
-            self.absoluteFlag = 0
-            
-        if gString == 'G91':
-            self.absoluteFlag = 1
+        '''
         
-    def callBackMechanism(self, callback) :
+        firstLine = 0
+        for batch in self.gcodeChunks:
+            if batch.firstLine > lineNumber:
+                break
+            firstLine = batch.firstLine
+        return firstLine
+    
+    def redrawGcodeFrom(self, lineNumber):
         '''
         
-        Call the loadNextLine function periodically in a non-blocking way to
-        update the gcode.
+        Remove the gcode drawn from lineNumber, which must be the start of a batch, onwards and draw
+        it again. The lines before it are left as they are, and any of them still waiting to be
+        drawn are drawn first.
         
         '''
         
-        with self.scatterObject.canvas:
-            self.line = Line(points = (), width = 1, group = 'gcode')
+        if self.drawEvent is not None:
+            self.drawEvent.cancel()
         
-        #Draw numberOfTimesToCall lines on the canvas
-        numberOfTimesToCall = 500
-        for _ in range(numberOfTimesToCall):
-            self.loadNextLine()
+        while self.gcodeChunks and self.gcodeChunks[-1].firstLine >= lineNumber:
+            batch = self.gcodeChunks.pop()
+            if batch.visible:
+                self.scatterObject.canvas.remove(batch.canvas)
+            if batch is self.gcodeChunk:
+                self.gcodeChunk = None
+        self.segmentIndex.removeFrom(lineNumber)
         
-        #Repeat until end of file
-        if self.lineNumber < min(len(self.data.gcode),60000):
-            Clock.schedule_once(self.callBackMechanism)
+        waiting = []
+        if self.drawQueue:
+            waiting = [(self.lineNumber, self.drawQueue[0][1])] + self.drawQueue[1:]
+        self.drawQueue = [(first, min(end, lineNumber)) for first, end in waiting if first < lineNumber] + [(lineNumber, len(self.data.gcode))]
+        
+        if self.gcodeChunk is None or self.drawQueue[0][0] != self.lineNumber:
+            self.startRegion()
+        self.callBackMechanism(self.updateGcode)
     
     def updateGcode(self, *args):
         '''
         
-        updateGcode parses the gcode commands and calls the appropriate drawing function for the 
-        specified command. 
+        updateGcode draws the moves made by the gcode program. The program is only interpreted
+        again if it has changed; moving the gcode only moves the drawing.
+        
+        The lines around the current gcodeIndex are drawn first, then the rest of the program.
     
         '''
         
+        if self.drawEvent is not None:
+            self.drawEvent.cancel()
+        
+        gcode = self.data.gcode
+        if not isinstance(gcode, GcodeProgram):     #a placeholder used to force a redraw
+            self.drawQueue = []
+            self.clearGcode()
+            return
+        
+        if self.redrawFromLine is not None:
+            lineNumber = self.redrawFromLine
+            self.redrawFromLine = None
+            if self.interpreter is not None:
+                #carry on interpreting from before the change and redraw from the start of its batch
+                lineNumber = self.interpreter.restart(gcode.unshifted(), lineNumber)
+                self.redrawGcodeFrom(self.firstRedrawnLine(lineNumber))
+                return
+        
+        if self.interpreter is None or gcode.unshifted() is not self.interpreter.gcode:
+            self.interpreter = GcodeInterpreter(gcode.unshifted(), self.data.units)
+        
         #reset variables 
-        self.xPosition = self.data.gcodeShift[0]*self.canvasScaleFactor
-        self.yPosition = self.data.gcodeShift[1]*self.canvasScaleFactor
-        self.zPosition = 0
-
-        self.prependString = "G00 "
-        self.lineNumber = 0
+        scale = GcodeInterpreter.scales[self.interpreter.startUnits]
+        self.offset      = (self.data.gcodeShift[0]*scale, self.data.gcodeShift[1]*scale)
+        self.frameBudget = self.getNumberSetting('drawingFrameTime')/1000
+        
+        self.arcTolerance = min(max(ToolpathBatch.pixelTolerance/self.scatterInstance.scale, self.minArcTolerance), self.maxArcTolerance)
+        self.hasArcs      = False
         
         self.clearGcode()
         
-        #Check to see if file is too large to load
-        if len(self.data.gcode) > 60000:
-            errorText = "The current file contains " + str(len(self.data.gcode)) + " lines of gcode.\nrendering all " +  str(len(self.data.gcode)) + " lines simultaneously may crash the\n program, only the first 60000 lines are shown here.\nThe complete program will cut if you choose to do so."
-            print errorText
-            self.data.message_queue.put("Message: " + errorText)
+        #draw the lines around gcodeIndex first
+        length = len(gcode)
+        first  = max(min(self.data.gcodeIndex, length) - self.priorityLines, 0)
+        end    = min(self.data.gcodeIndex + self.priorityLines, length)
+        if first > 0:
+            self.drawQueue = [(first, end), (0, first), (end, length)]
+        else:
+            self.drawQueue = [(0, length)]
+        self.startRegion()
         
         self.callBackMechanism(self.updateGcode)
-        
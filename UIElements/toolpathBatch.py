@@ -0,0 +1,351 @@
+'''
+
+This module provides a batch of toolpath drawn on the gcode canvas. Rather than creating canvas
+instructions for every move, the moves are collected into one vertex array per type of move and
+drawn with a handful of Mesh instructions.
+
+The feed moves can be drawn at several levels of detail, each simplified with the Douglas-Peucker
+algorithm, so that a zoomed out view of a large program draws far fewer vertices.
+
+'''
+
+from kivy.graphics                           import Canvas, Color, InstructionGroup, Mesh
+from array                                   import array
+import math
+
+
+class ToolpathBatch(object):
+    '''
+
+    A ToolpathBatch holds the feed moves, rapid moves, plunge markers and retract markers for a
+    group of gcode lines. Every move is stored as a line segment and each type is drawn in a single
+    color, so each type needs only as many Mesh instructions as it takes to hold its vertices.
+
+    firstLine is the first line of gcode in the batch, so that the gcode can be redrawn from the
+    start of any batch.
+
+    Feed moves are joined into runs of connected points, which are kept at full detail. The runs
+    are simplified for the level of detail being shown as they are drawn, and again for another
+    level when it is shown. Vertices are only kept until their mesh is full, or the batch is
+    finished, since the meshes hold their own copy.
+
+    '''
+
+    meshVertices  = 65534           #Mesh indices are unsigned shorts, keep an even number per mesh
+
+    dashLength    = 4               #length of the dashes in a rapid move
+    dashGap       = 2               #length of the gaps between them
+    circleSides   = 12              #number of sides in a z move marker
+
+    levelTolerances = (0, 0.25, 1, 4, 16)   #how far each level of detail may stray from the toolpath
+    pixelTolerance  = 0.5                   #how far on screen a simplified toolpath may stray
+    runLength       = 512                   #most points simplified together
+
+    def __init__(self, firstLine, drawingColor, level = 0):
+        '''
+
+        level is the level of detail to show, an index into levelTolerances.
+
+        '''
+        self.firstLine = firstLine
+        self.level     = level
+        self.canvas    = Canvas()
+
+        self.bounds   = None        #xMin, yMin, xMax, yMax of everything drawn so far
+        self.visible  = True        #False while the canvas is left off the screen
+        self.finished = False       #True once nothing more will be added
+
+        self.run       = []             #x, y of each point in the feed moves not yet in a run
+        self.runs      = array('f')     #x, y of each point in every run of feed moves, back to back
+        self.runEnds   = array('L', [0])    #0, then where each run ends in runs
+        self.runsDrawn = 0              #the number of runs added to the feed vertices at this level
+        self.feedSize  = 0              #the number of vertex coordinates the feed moves take at full detail
+
+        colors = {'feed':drawingColor, 'rapid':drawingColor, 'retract':(0, 1, 0), 'plunge':(1, 0, 0)}
+
+        self.points      = {}       #x, y pairs for each type of move not yet in a full mesh, two per segment
+        self.firstVertex = {}       #the number of vertices of each type before those in points
+        self.groups      = {}       #the color and meshes for each type
+        self.meshes      = {}
+        self.drawn       = {}       #the number of vertices of each type already in a mesh
+        for moveType in ('feed', 'rapid', 'retract', 'plunge'):
+            group = InstructionGroup()
+            group.add(Color(colors[moveType][0], colors[moveType][1], colors[moveType][2]))
+            self.canvas.add(group)
+
+            self.points[moveType]      = array('f')
+            self.firstVertex[moveType] = 0
+            self.groups[moveType]      = group
+            self.meshes[moveType]      = []
+            self.drawn[moveType]       = 0
+
+    @classmethod
+    def levelForScale(cls, scale):
+        '''
+
+        The least detailed level which can be shown when one unit of the toolpath is scale pixels
+        across on screen.
+
+        '''
+        level = 0
+        for index, tolerance in enumerate(cls.levelTolerances):
+            if tolerance*scale <= cls.pixelTolerance:
+                level = index
+        return level
+
+    def addFeed(self, xStart, yStart, xEnd, yEnd):
+        self.addFeedPoints([xStart, yStart, xEnd, yEnd])
+
+    def addFeedPoints(self, points):
+        '''
+
+        Add feed moves joining a flat list of x, y points
+
+        '''
+        run = self.run
+        if run and (run[-2] != points[0] or run[-1] != points[1]):
+            self._finishRun()
+            run = self.run
+        if run:
+            run.extend(points[2:])
+        else:
+            run.extend(points)
+
+        if len(run) >= 2*self.runLength:
+            self._finishRun()
+            self.run.extend(points[-2:])        #the next run carries on from the end of this one
+
+    def addRapid(self, xStart, yStart, xEnd, yEnd):
+        '''
+
+        Add a rapid move, which is drawn as a dashed line
+
+        '''
+
+        length = math.sqrt((xEnd - xStart)**2 + (yEnd - yStart)**2)
+        if length == 0:
+            return
+
+        xStep = (xEnd - xStart)/length
+        yStep = (yEnd - yStart)/length
+
+        rapids   = self.points['rapid']
+        distance = 0
+        while distance < length:
+            dashEnd = min(distance + self.dashLength, length)
+            rapids.extend((xStart + xStep*distance, yStart + yStep*distance, xStart + xStep*dashEnd, yStart + yStep*dashEnd))
+            distance = dashEnd + self.dashGap
+
+    def addPlunge(self, x, y):
+        self._addCircle(self.points['plunge'], x, y, 2)
+
+    def addRetract(self, x, y):
+        self._addCircle(self.points['retract'], x, y, 1)
+
+    def isFull(self):
+        '''
+
+        True once any type of move has filled a mesh, at which point a new batch should be started
+
+        '''
+
+        return max(self.feedSize + len(self.run), self._size('rapid'), self._size('plunge'), self._size('retract')) >= 2*self.meshVertices
+
+    def setLevel(self, level):
+        '''
+
+        Show the feed moves at a different level of detail
+
+        '''
+        if level == self.level:
+            return
+
+        self.level = level
+        for mesh in self.meshes['feed']:
+            self.groups['feed'].remove(mesh)
+        self.meshes['feed']      = []
+        self.points['feed']      = array('f')
+        self.firstVertex['feed'] = 0
+        self.drawn['feed']       = 0
+        self.runsDrawn           = 0
+
+        self.update()
+
+    def update(self):
+        '''
+
+        Copy the moves added since the last update into the meshes
+
+        '''
+
+        self._finishRun()
+        self._simplifyRuns()
+
+        for moveType, points in self.points.items():
+            meshes = self.meshes[moveType]
+            first  = self.firstVertex[moveType]
+            count  = first + len(points)//2
+            if moveType != 'feed':
+                self._addBounds(points[2*(self.drawn[moveType] - first):])
+
+            #only the last mesh and any new ones have changed
+            if count > self.drawn[moveType]:
+                firstMesh = self.drawn[moveType]//self.meshVertices*self.meshVertices
+                for start in xrange(firstMesh, count, self.meshVertices):
+                    piece    = points[2*(start - first):2*(start - first + self.meshVertices)]
+                    vertices = [0.0]*(2*len(piece))
+                    vertices[0::4] = piece[0::2]
+                    vertices[1::4] = piece[1::2]
+                    indices  = range(len(piece)//2)
+
+                    meshNumber = start//self.meshVertices
+                    if meshNumber < len(meshes):
+                        meshes[meshNumber].vertices = vertices
+                        meshes[meshNumber].indices  = indices
+                    else:
+                        mesh = Mesh(vertices = vertices, indices = indices, mode = 'lines')
+                        self.groups[moveType].add(mesh)
+                        meshes.append(mesh)
+
+            self.drawn[moveType] = count
+
+            #keep only the vertices of a mesh which may still grow
+            if self.finished:
+                keepFrom = count
+            else:
+                keepFrom = count//self.meshVertices*self.meshVertices
+            del points[:2*(keepFrom - first)]
+            self.firstVertex[moveType] = keepFrom
+
+    def finish(self):
+        '''
+
+        Draw anything not yet drawn and let go of the vertices. Nothing more can be added once the
+        batch is finished.
+
+        '''
+        self.finished = True
+        self.update()
+
+    def overlaps(self, xMin, yMin, xMax, yMax):
+        '''
+
+        True if anything in the batch may be inside the rectangle
+
+        '''
+        if self.bounds is None:
+            return False
+        return self.bounds[0] <= xMax and self.bounds[2] >= xMin and self.bounds[1] <= yMax and self.bounds[3] >= yMin
+
+    def _addBounds(self, points):
+        if not points:
+            return
+        xs = points[0::2]
+        ys = points[1::2]
+        if self.bounds is None:
+            self.bounds = [min(xs), min(ys), max(xs), max(ys)]
+        else:
+            self.bounds = [min(self.bounds[0], min(xs)), min(self.bounds[1], min(ys)), max(self.bounds[2], max(xs)), max(self.bounds[3], max(ys))]
+
+    def _size(self, moveType):
+        '''
+
+        The number of vertex coordinates of a type of move added so far
+
+        '''
+        return 2*self.firstVertex[moveType] + len(self.points[moveType])
+
+    def _finishRun(self):
+        '''
+
+        Keep the current run of feed moves and start a new run
+
+        '''
+        run = self.run
+        if len(run) >= 4:
+            self._addBounds(run)
+            self.runs.extend(run)
+            self.runEnds.append(len(self.runs))
+            self.feedSize = self.feedSize + 2*len(run) - 4
+        self.run = []
+
+    def _simplifyRuns(self):
+        '''
+
+        Simplify the runs not yet drawn for the level of detail shown and add them to the feed vertices
+
+        '''
+        tolerance = self.levelTolerances[self.level]
+        feeds     = self.points['feed']
+        for number in xrange(self.runsDrawn, len(self.runEnds) - 1):
+            run = self.runs[self.runEnds[number]:self.runEnds[number + 1]]
+            if tolerance > 0:
+                kept = simplifyPolyline(run, tolerance)
+            else:
+                kept = run
+
+            #each segment has its own pair of vertices
+            segments = [0.0]*(2*len(kept) - 4)
+            segments[0::4] = kept[0:-2:2]
+            segments[1::4] = kept[1:-2:2]
+            segments[2::4] = kept[2::2]
+            segments[3::4] = kept[3::2]
+            feeds.extend(segments)
+        self.runsDrawn = len(self.runEnds) - 1
+
+    def _addCircle(self, points, x, y, radius):
+        step = 2*math.pi/self.circleSides
+        for side in xrange(self.circleSides):
+            points.extend((x + radius*math.cos(step*side), y + radius*math.sin(step*side), x + radius*math.cos(step*(side + 1)), y + radius*math.sin(step*(side + 1))))
+
+
+def simplifyPolyline(points, tolerance):
+    '''
+
+    Simplify a polyline with the Douglas-Peucker algorithm. points is a flat list of x, y pairs and
+    no point is moved further than tolerance from the simplified line. Returns a flat list of the
+    points which are kept, always including the first and last.
+
+    '''
+
+    count = len(points)//2
+    if count < 3:
+        return list(points)
+
+    keep = [False]*count
+    keep[0] = keep[-1] = True
+
+    stack = [(0, count - 1)]            #a stack rather than recursion, a run can be long
+    while stack:
+        first, last = stack.pop()
+        xFirst, yFirst = points[2*first], points[2*first + 1]
+        dx = points[2*last] - xFirst
+        dy = points[2*last + 1] - yFirst
+        lengthSquared = dx*dx + dy*dy
+
+        farthest = None
+        distance = tolerance*tolerance
+        for index in xrange(first + 1, last):
+            px = points[2*index] - xFirst
+            py = points[2*index + 1] - yFirst
+            #the distance to the segment, not the line through it, so a point beyond either end is kept
+            if lengthSquared > 0:
+                along = max(0.0, min(1.0, (px*dx + py*dy)/lengthSquared))
+                px = px - along*dx
+                py = py - along*dy
+            offset = px*px + py*py
+            if offset > distance:
+                farthest = index
+                distance = offset
+
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+
+    simplified = []
+    for index in xrange(count):
+        if keep[index]:
+            simplified.append(points[2*index])
+            simplified.append(points[2*index + 1])
+    return simplified
@@ -65,9 +65,7 @@ class ViewMenu(GridLayout, MakesmithInitFuncs):
         
         '''
         
-        filePath = self.data.gcodeFile
-        self.data.gcodeFile = ""
-        self.data.gcodeFile = filePath
+        self.data.property('gcodeFile').dispatch(self.data)    #the gcode is not cleared first so only the parts of the file which changed are read
         
         #close the parent popup
         self.parentWidget.close()
@@ -139,7 +137,8 @@ class ViewMenu(GridLayout, MakesmithInitFuncs):
             if line>len(self.data.gcode):
                 line = len(self.data.gcode)-447
 
-            for lineNum, gcodeLine in enumerate(self.data.gcode):
+            for lineNum in xrange(max(line,0), len(self.data.gcode)):   #only read the lines being shown
+                gcodeLine = self.data.gcode[lineNum]
                 if lineNum>=line and lineNum<line+447:
                     popupText = popupText + str(lineNum+1) + ': ' + gcodeLine + "\n"
                 elif lineNum>=line+447:
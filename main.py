@@ -20,6 +20,7 @@ import math
 import global_variables
 import sys
 import re
+import timeit
 
 
 '''
@@ -49,6 +50,15 @@ Main UI Program
 '''
 
 class GroundControlApp(App):
+    
+    consoleBuffer    = []       #text to add to the console at the end of this tick
+    messageCount     = 0        #messages handled since the dispatch rate was last shown
+    dispatchTime     = 0        #seconds spent handling them
+    tickCount        = 0
+    rateWindowStart  = 0        #when the messages being counted started
+    xval             = 0        #the last position reported by the machine
+    yval             = 0
+    zval             = 0
 
     def get_application_config(self):
         return super(GroundControlApp, self).get_application_config(
@@ -205,6 +215,10 @@ class GroundControlApp(App):
 
             if (key == "macro1_title") or (key == "macro2_title"):
                 self.frontpage.update_macro_titles()
+        
+        if section == "Ground Control Settings":
+            if key == "consoleScrollback":
+                self.frontpage.setConsoleScrollback()
 
         if section == "Advanced Settings":
             if (key == "truncate") or (key == "digits"):
@@ -267,27 +281,48 @@ class GroundControlApp(App):
     '''
     
     def writeToTextConsole(self, message):
+        '''
+        
+        Add message to the console. The text is held until the end of the tick so that the console
+        is only updated once however many messages arrive.
+        
+        '''
+        self.consoleBuffer.append(message)
+    
+    def flushTextConsole(self):
+        if not self.consoleBuffer:
+            return
         try:
-            newText = self.frontpage.consoleText[-2000:] + message
-            self.frontpage.consoleText = newText
-            self.frontpage.textconsole.gotToBottom()  
+            self.frontpage.textconsole.write(''.join(self.consoleBuffer))
         except:
-            self.frontpage.consoleText = "text not displayed correctly"
+            self.frontpage.textconsole.write("text not displayed correctly\n")
+        self.consoleBuffer = []
     
     def runPeriodically(self, *args):
         '''
         this block should be handled within the appropriate widget
+        
+        Every message which has arrived is handled each tick. Position and positional error reports
+        only show where the machine is now, so just the latest of each is shown. Every positional
+        error is still logged.
         '''
+        started         = timeit.default_timer()
+        messageCount    = 0
+        latestPosition  = None
+        latestError     = None
+        
         while not self.data.message_queue.empty(): #if there is new data to be read
             message = self.data.message_queue.get()
+            messageCount = messageCount + 1
             
             if message[0] == "<":
-                self.setPosOnScreen(message)
+                latestPosition = message
             elif message[0] == "$":
                 self.receivedSetting(message)
             elif message[0] == "[":
                 if message[1:4] == "PE:":
-                    self.setErrorOnScreen(message)
+                    latestError = message
+                    self.logPositionalError(message, latestPosition)
                 elif message[1:8] == "Measure":
                     measuredDist = float(message[9:len(message)-3])
                     self.data.measureRequest(measuredDist)
@@ -327,6 +362,35 @@ class GroundControlApp(App):
                 pass #displaying all the 'ok' messages clutters up the display
             else:
                 self.writeToTextConsole(message)
+        
+        if latestPosition is not None:
+            self.setPosOnScreen(latestPosition)
+        if latestError is not None:
+            self.setErrorOnScreen(latestError)      #placed relative to the position, so applied after it
+        self.flushTextConsole()
+        
+        self.updateDispatchRate(messageCount, timeit.default_timer() - started)
+    
+    def updateDispatchRate(self, messageCount, taken):
+        '''
+        
+        Count the messages handled and the time taken by each tick, and show the averages about once
+        a second.
+        
+        '''
+        self.messageCount = self.messageCount + messageCount
+        self.dispatchTime = self.dispatchTime + taken
+        self.tickCount    = self.tickCount + 1
+        
+        now     = timeit.default_timer()
+        elapsed = now - self.rateWindowStart
+        if elapsed >= 1:
+            if self.rateWindowStart:
+                self.frontpage.dispatchRate = '  %d msg/s, %.1f ms/tick' % (self.messageCount/elapsed, 1000*self.dispatchTime/self.tickCount)
+            self.messageCount    = 0
+            self.dispatchTime    = 0
+            self.tickCount       = 0
+            self.rateWindowStart = now
 
     def ondismiss_popup(self, event):
         if global_variables._keyboard:
@@ -365,18 +429,7 @@ class GroundControlApp(App):
         '''
         
         try:
-            startpt = message.find('MPos:') + 5
-            
-            endpt = message.find('WPos:')
-            
-            numz  = message[startpt:endpt]
-            units = "mm" #message[endpt+1:endpt+3]
-            
-            valz = numz.split(",")
-            
-            self.xval  = float(valz[0])
-            self.yval  = float(valz[1])
-            self.zval  = float(valz[2])
+            self.xval, self.yval, self.zval = self.readPosition(message)
 
             if math.isnan(self.xval):
                 self.writeToTextConsole("Unable to resolve x Kinematics.")
@@ -394,28 +447,74 @@ class GroundControlApp(App):
         self.frontpage.setPosReadout(self.xval, self.yval, self.zval)
         self.frontpage.gcodecanvas.positionIndicator.setPos(self.xval,self.yval,self.data.units)
     
+    def readPosition(self, message):
+        '''
+        
+        The x, y and z machine position in a position report, in the current units
+        
+        '''
+        startpt = message.find('MPos:') + 5
+        
+        endpt = message.find('WPos:')
+        
+        numz  = message[startpt:endpt]
+        units = "mm" #message[endpt+1:endpt+3]
+        
+        valz = numz.split(",")
+        
+        return float(valz[0]), float(valz[1]), float(valz[2])
+    
+    def readPositionalError(self, message):
+        '''
+        
+        The left and right chain errors in a positional error report, in millimeters
+        
+        '''
+        startpt = message.find(':')+1 
+        endpt = message.find(',', startpt)
+        leftErrorValueAsString = message[startpt:endpt]
+        leftErrorValueAsFloat  = float(leftErrorValueAsString)
+        
+        startpt = endpt + 1
+        endpt = message.find(',', startpt)
+        rightErrorValueAsString = message[startpt:endpt]
+        
+        rightErrorValueAsFloat  = float(rightErrorValueAsString)
+        
+        return leftErrorValueAsFloat, rightErrorValueAsFloat
+    
+    def logPositionalError(self, message, positionMessage):
+        '''
+        
+        Add a positional error report to the logger's statistics, along with where the machine was
+        according to positionMessage, the latest position report, or the last position shown if
+        there is none
+        
+        '''
+        
+        try:
+            leftErrorValueAsFloat, rightErrorValueAsFloat = self.readPositionalError(message)
+            x, y = self.xval, self.yval
+            if positionMessage is not None:
+                x, y, z = self.readPosition(positionMessage)
+        except:
+            print "Machine Position Report Command Misread Happened Once"
+            return
+        
+        scale = 25.4 if self.data.units == "INCHES" else 1
+        avgError = (abs(leftErrorValueAsFloat) + abs(rightErrorValueAsFloat))/2
+        self.data.logger.writeErrorValueToLog(avgError, x*scale, y*scale)
+    
     def setErrorOnScreen(self, message):
         
         try:
-            startpt = message.find(':')+1 
-            endpt = message.find(',', startpt)
-            leftErrorValueAsString = message[startpt:endpt]
-            leftErrorValueAsFloat  = float(leftErrorValueAsString)
-            
-            startpt = endpt + 1
-            endpt = message.find(',', startpt)
-            rightErrorValueAsString = message[startpt:endpt]
-            
-            rightErrorValueAsFloat  = float(rightErrorValueAsString)
+            leftErrorValueAsFloat, rightErrorValueAsFloat = self.readPositionalError(message)
             
             if self.data.units == "INCHES":
                 rightErrorValueAsFloat = rightErrorValueAsFloat/25.4
                 leftErrorValueAsFloat  = leftErrorValueAsFloat/25.4
             
-            avgError = (abs(leftErrorValueAsFloat) + abs(rightErrorValueAsFloat))/2
-            
             self.frontpage.gcodecanvas.positionIndicator.setError(0, self.data.units)
-            self.data.logger.writeErrorValueToLog(avgError)
             
             self.frontpage.gcodecanvas.targetIndicator.setPos(self.xval - .5*rightErrorValueAsFloat + .5*leftErrorValueAsFloat, self.yval - .5*rightErrorValueAsFloat - .5*leftErrorValueAsFloat,self.data.units)
             